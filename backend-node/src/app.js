@@ -89,49 +89,69 @@ app.get('/announcements/active', adminController.getActiveAnnouncements);
 
 // --- LEGACY ALIASES (For Frontend Proxy Support) ---
 // Note: Next.js proxies /api/:path* to /:path* on// Webhook for Python Engine to save completed trades
-app.post('/webhook/save_trade', async (req, res) => {
-    try {
-        const { user_id, symbol, mode, qty, entry, exit, tp, sl, pnl, status, date, time, trade_mode, strategy } = req.body;
+// Persist one closed trade from the engine. Deduplicates on the outbox
+// idempotency key (exactly-once redelivery) or, for older payloads, on
+// user + symbol + timestamp.
+async function saveTradeRecord(body) {
+    const { user_id, symbol, mode, qty, entry, exit, tp, sl, pnl, status, date, time, trade_mode, strategy, idempotency_key } = body;
+
+    if (!user_id || !symbol) {
+        return { status: 'rejected', message: 'Missing user_id or symbol' };
+    }
 
-        console.log(`[SaveTrade Webhook] Received: user=${user_id}, symbol=${symbol}, pnl=${pnl}, mode=${trade_mode}`);
+    const { Trade } = require('./models');
 
-        if (!user_id || !symbol) {
-            console.error('[SaveTrade Webhook] Missing required fields: user_id or symbol');
-            return res.status(400).json({ status: 'error', message: 'Missing user_id or symbol' });
+    if (idempotency_key) {
+        const existing = await Trade.findOne({ where: { idempotency_key } });
+        if (existing) {
+            return { status: 'success', message: 'duplicate_skipped', trade_id: existing.id };
         }
+    }
 
-        const { Trade } = require('./models');
-
-        // Check for duplicate trade (same user, symbol, date, time)
-        const timestamp = `${date || ''} ${time || ''}`.trim();
-        if (timestamp) {
-            const existing = await Trade.findOne({
-                where: { user_id, symbol, timestamp }
-            });
-            if (existing) {
-                console.log(`[SaveTrade Webhook] Duplicate skipped: ${symbol} at ${timestamp}`);
-                return res.json({ status: 'success', message: 'duplicate_skipped' });
-            }
+    // Check for duplicate trade (same user, symbol, date, time)
+    const timestamp = `${date || ''} ${time || ''}`.trim();
+    if (timestamp && !idempotency_key) {
+        const existing = await Trade.findOne({
+            where: { user_id, symbol, timestamp }
+        });
+        if (existing) {
+            console.log(`[SaveTrade Webhook] Duplicate skipped: ${symbol} at ${timestamp}`);
+            return { status: 'success', message: 'duplicate_skipped' };
         }
+    }
 
-        const trade = await Trade.create({
-            user_id,
-            symbol,
-            mode: mode || 'BUY',
-            quantity: qty || 1,
-            entry_price: entry || 0,
-            exit_price: exit || 0,
-            tp: tp || 0,
-            sl: sl || 0,
-            pnl: pnl || 0,
-            status: status || 'COMPLETED',
-            timestamp: timestamp || new Date().toISOString(),
-            is_simulated: trade_mode === 'PAPER',
-            strategy: strategy || 'ORB'
-        });
+    const trade = await Trade.create({
+        user_id,
+        symbol,
+        mode: mode || 'BUY',
+        quantity: qty || 1,
+        entry_price: entry || 0,
+        exit_price: exit || 0,
+        tp: tp || 0,
+        sl: sl || 0,
+        pnl: pnl || 0,
+        status: status || 'COMPLETED',
+        timestamp: timestamp || new Date().toISOString(),
+        is_simulated: trade_mode === 'PAPER',
+        strategy: strategy || 'ORB',
+        idempotency_key: idempotency_key || null
+    });
+
+    console.log(`[SaveTrade Webhook] ✅ Saved trade ID=${trade.id}: ${symbol} PnL=${pnl} (${trade_mode})`);
+    return { status: 'success', trade_id: trade.id };
+}
+
+app.post('/webhook/save_trade', async (req, res) => {
+    try {
+        const { user_id, symbol, pnl, trade_mode } = req.body;
+        console.log(`[SaveTrade Webhook] Received: user=${user_id}, symbol=${symbol}, pnl=${pnl}, mode=${trade_mode}`);
 
-        console.log(`[SaveTrade Webhook] ✅ Saved trade ID=${trade.id}: ${symbol} PnL=${pnl} (${trade_mode})`);
-        res.json({ status: 'success', trade_id: trade.id });
+        const result = await saveTradeRecord(req.body);
+        if (result.status === 'rejected') {
+            console.error('[SaveTrade Webhook] Missing required fields: user_id or symbol');
+            return res.status(400).json({ status: 'error', message: result.message });
+        }
+        res.json(result);
     } catch (e) {
         console.error("[SaveTrade Webhook] ❌ Error:", e.message);
         console.error("[SaveTrade Webhook] Stack:", e.stack);
@@ -139,6 +159,28 @@ app.post('/webhook/save_trade', async (req, res) => {
     }
 });
 
+// Batch variant used by the engine's durable trade outbox.
+// Returns a per-trade result so the engine only retries what failed.
+app.post('/webhook/save_trades', async (req, res) => {
+    const { trades } = req.body;
+    if (!Array.isArray(trades)) {
+        return res.status(400).json({ status: 'error', message: 'trades must be an array' });
+    }
+
+    const results = [];
+    for (const body of trades) {
+        try {
+            const result = await saveTradeRecord(body);
+            results.push({ idempotency_key: body.idempotency_key, ...result });
+        } catch (e) {
+            console.error(`[SaveTrades Webhook] ❌ ${body.symbol}: ${e.message}`);
+            results.push({ idempotency_key: body.idempotency_key, status: 'error', message: e.message });
+        }
+    }
+    console.log(`[SaveTrades Webhook] Processed ${trades.length} trades`);
+    res.json({ status: 'success', results });
+});
+
 // Real-time Tick/PnL Update Webhook
 app.post('/webhook/tick', (req, res) => {
     try {
@@ -160,6 +202,49 @@ app.post('/webhook/tick', (req, res) => {
     }
 });
 
+// Batched, delta-encoded tick updates from the engine's tick publisher.
+// Keeps the merged open-position state per user and emits the same full
+// 'tick_update' payload the frontend already consumes.
+const tickState = new Map(); // user_id -> { trades: Map(entry_order_id -> trade), ltp: {} }
+
+app.post('/webhook/ticks', (req, res) => {
+    try {
+        const { updates } = req.body;
+        const { sendUserUpdate } = require('./services/socketService');
+        const timestamp = new Date().toISOString();
+
+        for (const update of updates || []) {
+            if (update.closed) {
+                tickState.delete(update.user_id);
+                continue;
+            }
+
+            let state = tickState.get(update.user_id);
+            if (!state || update.full) {
+                state = { trades: new Map(), ltp: {} };
+                tickState.set(update.user_id, state);
+            }
+            for (const trade of update.upserts || []) {
+                state.trades.set(trade.entry_order_id, trade);
+            }
+            for (const id of update.removed || []) {
+                state.trades.delete(id);
+            }
+            Object.assign(state.ltp, update.ltp || {});
+
+            sendUserUpdate(update.user_id, 'tick_update', {
+                trades: Array.from(state.trades.values()),
+                pnl: update.pnl,
+                timestamp
+            });
+        }
+
+        res.json({ status: 'ok' });
+    } catch (e) {
+        res.status(500).json({ status: 'error' });
+    }
+});
+
 // Start Server
 
 app.post('/register', authController.register);
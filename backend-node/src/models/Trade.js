@@ -81,6 +81,11 @@ const Trade = sequelize.define('Trade', {
     notes: {
         type: DataTypes.TEXT,
         allowNull: true
+    },
+    idempotency_key: {
+        type: DataTypes.STRING(100), // Set by the engine's trade outbox; makes redelivery a no-op
+        allowNull: true,
+        unique: true
     }
 }, {
     tableName: 'trades',
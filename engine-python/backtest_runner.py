@@ -1,8 +1,11 @@
-from SmartApi import SmartConnect
 from logzero import logger
+import broker_sessions
+import broker_gateway
 import pandas as pd
 import numpy as np
 import importlib 
+import datetime as dt
+import market_clock
 
 def fetch_historical_data(smartApi, exchange, symbol_token, interval, from_date, to_date):
     try:
@@ -43,6 +46,158 @@ def fetch_historical_data(smartApi, exchange, symbol_token, interval, from_date,
         logger.exception(f"Historic Api failed: {e}")
         return None
 
+def clamp_to_trading_days(start_date, end_date):
+    """
+    Narrow a "DATE HH:MM" range (YYYY-MM-DD or DD-MM-YYYY) to its first and
+    last NSE trading days. Returns (start, end) in the same format, or None
+    if the range holds no trading day.
+    """
+    def split(value):
+        day, _, hhmm = str(value).replace("T", " ").partition(" ")
+        fmt = "%d-%m-%Y" if len(day) > 5 and day[2] == '-' else "%Y-%m-%d"
+        return dt.datetime.strptime(day, fmt).date(), hhmm, fmt
+
+    try:
+        first, start_time, fmt = split(start_date)
+        last, end_time, _ = split(end_date)
+    except ValueError:
+        return start_date, end_date   # Leave unparseable input to the API
+    sessions = market_clock.get_clock().trading_range(first, last)
+    if sessions is None:
+        return None
+    first_day, last_day = sessions
+    start_time = start_time if first_day == first else "09:15"
+    end_time = end_time if last_day == last else "15:30"
+    return f"{first_day.strftime(fmt)} {start_time}".strip(), f"{last_day.strftime(fmt)} {end_time}".strip()
+
+def _backtest_range(data):
+    """(start, end) "DATE HH:MM" strings of the request, or (start, end, None) if it holds no trading day"""
+    # Handle Date Inputs - Avoid double time concatenation
+    raw_from = data.get("from_date", "2024-01-01")
+    raw_to = data.get("to_date", "2024-01-31")
+    
+    # If input doesn't look like it has time (length < 11), append default time
+    start_date = raw_from if len(str(raw_from)) > 11 else f"{raw_from} 09:15"
+    end_date = raw_to if len(str(raw_to)) > 11 else f"{raw_to} 15:30"
+    
+    # Weekends/NSE holidays at either end would only cost empty candle requests
+    sessions = clamp_to_trading_days(start_date, end_date)
+    if sessions:
+        start_date, end_date = sessions
+    return start_date, end_date, sessions
+
+def fetch_backtest_data(data):
+    """
+    Broker half of a backtest, run in the engine process: resolve tokens and
+    fetch candles through the engine's broker session and BULK lane, so
+    compute workers never log in or hold rate-limit buckets of their own.
+    Returns [{"symbol", "candles"} | {"symbol", "error"}] for run_backtest.
+    """
+    start_date, end_date, sessions = _backtest_range(data)
+    if sessions:
+        logger.info(f"[Backtest] Date Range: {start_date} to {end_date}")
+    else:
+        logger.warning(f"[Backtest] No trading days between {start_date} and {end_date}; skipping data fetch")
+    
+    interval = data.get("interval", "5")
+    
+    # CREDENTIALS
+    creds = data.get("broker_credentials", {})
+    api_key = creds.get("api_key")
+    client_code = creds.get("client_code")
+    password = creds.get("password")
+    totp_key = creds.get("totp")
+
+    smartApi = None
+    if api_key and client_code and password and totp_key:
+        try:
+            # History fetches queue behind live order traffic on the same account
+            smartApi = broker_gateway.in_lane(broker_sessions.get_cache().get(creds).smart_api, broker_gateway.BULK)
+            logger.info("Angel One Login Successful for Backtest")
+        except broker_sessions.BrokerLoginError as e:
+            logger.error(f"Login Failed: {e}")
+        except Exception as e:
+            logger.error(f"Login Exception: {e}")
+    
+    # Token Map - Removed hardcoded values as requested. 
+    # We rely strictly on:
+    # 1. User providing token in request
+    # 2. Dynamic lookup via SmartAPI
+    fetched = []
+    for symbol_data in data.get("symbols", []):
+        try:
+            # Determine if input is object (new) or string (old)
+            symbol_name = ""
+            market_token = None
+            
+            if isinstance(symbol_data, dict):
+                symbol_name = symbol_data.get("symbol", "")
+                if symbol_data.get("token"):
+                    market_token = str(symbol_data.get("token"))
+            else:
+                symbol_name = str(symbol_data)
+            
+            # Dynamic Search via API if token not provided
+            if not market_token and smartApi:
+                try:
+                    clean_search = symbol_name.upper().replace("-EQ", "")
+                    search_res = smartApi.searchScrip("NSE", clean_search)
+                    if search_res and search_res.get('status') and search_res.get('data'):
+                        # Priority Logic: 1. Exact Match, 2. Ends with -EQ, 3. First Found
+                        found_scrip = None
+                        
+                        # 1. Exact match with -EQ suffix (Best for Equity)
+                        target_eq = f"{clean_search}-EQ"
+                        for scrip in search_res['data']:
+                            if scrip['tradingsymbol'] == target_eq:
+                                found_scrip = scrip
+                                break
+                        
+                        # 2. Exact match on raw symbol name (some indices/futures)
+                        if not found_scrip:
+                            for scrip in search_res['data']:
+                                if scrip['tradingsymbol'] == clean_search:
+                                    found_scrip = scrip
+                                    break
+                                    
+                        # 3. Fallback: Ends with -EQ
+                        if not found_scrip:
+                            for scrip in search_res['data']:
+                                if scrip['tradingsymbol'].endswith('-EQ'):
+                                    found_scrip = scrip
+                                    break
+                                    
+                        # 4. First result (Last resort)
+                        if not found_scrip:
+                            found_scrip = search_res['data'][0]
+                            
+                        market_token = found_scrip['symboltoken']
+                        symbol_name = found_scrip['tradingsymbol'] 
+                        logger.info(f"Dynamic Token Found: {symbol_name} -> {market_token}")
+                except Exception as ex:
+                    logger.error(f"Dynamic Search Failed for {symbol_name}: {ex}")
+            
+            # Use the resolved symbol name for logging and results
+            symbol = symbol_name
+            candles = None
+
+            # REAL DATA FETCH
+            if smartApi and market_token and sessions:
+                try:
+                    res = fetch_historical_data(smartApi, "NSE", market_token, interval, start_date, end_date)
+                    if res and res.get('status') and res.get('data'):
+                        candles = res['data']
+                    else:
+                        logger.warning(f"No Data for {symbol}")
+                except Exception as e:
+                    logger.error(f"Data Fetch Error {symbol}: {e}")
+            fetched.append({"symbol": symbol, "candles": candles})
+        
+        except Exception as symbol_error:
+            logger.exception(f"Error processing {symbol_data}: {symbol_error}")
+            fetched.append({"symbol": str(symbol_data), "error": str(symbol_error)})
+    return fetched
+
 def login_and_run_backtest(data):
     """
     1. Login to Angel One
@@ -50,133 +205,34 @@ def login_and_run_backtest(data):
     3. Run Selected Strategy
     4. Return Results
     """
+    return run_backtest(data, fetch_backtest_data(data))
+
+def run_backtest(data, fetched):
+    """
+    Compute half of a backtest (runs in a compute worker): build each
+    symbol's frame from the candles `fetch_backtest_data` returned (or
+    simulate one), run the selected strategy and summarise the trades.
+    """
     try:
         strategy_name = data.get("strategy", "orb").lower()
-        selected_symbols = data.get("symbols", [])
-        
-        # Handle Date Inputs - Avoid double time concatenation
-        raw_from = data.get("from_date", "2024-01-01")
-        raw_to = data.get("to_date", "2024-01-31")
-        
-        # If input doesn't look like it has time (length < 11), append default time
-        start_date = raw_from if len(str(raw_from)) > 11 else f"{raw_from} 09:15"
-        end_date = raw_to if len(str(raw_to)) > 11 else f"{raw_to} 15:30"
-        
-        logger.info(f"[Backtest] Date Range: {start_date} to {end_date}")
-        
+        start_date, end_date, sessions = _backtest_range(data)
         interval = data.get("interval", "5")
         
-        # CREDENTIALS
-        creds = data.get("broker_credentials", {})
-        api_key = creds.get("api_key")
-        client_code = creds.get("client_code")
-        password = creds.get("password")
-        totp_key = creds.get("totp")
-
-        smartApi = None
-        if api_key and client_code and password and totp_key:
-            try:
-                import pyotp
-                smartApi = SmartConnect(api_key=api_key)
-                totp = pyotp.TOTP(totp_key).now()
-                session_data = smartApi.generateSession(client_code, password, totp)
-                if not session_data['status']:
-                    logger.error(f"Login Failed: {session_data['message']}")
-                    smartApi = None
-                else:
-                    logger.info("Angel One Login Successful for Backtest")
-            except Exception as e:
-                logger.error(f"Login Exception: {e}")
-                smartApi = None
-        
         summary_results = []
-
-        # Token Map - Removed hardcoded values as requested. 
-        # We rely strictly on:
-        # 1. User providing token in request
-        # 2. Dynamic lookup via SmartAPI
-        
-        import time
-        from datetime import datetime
-        
-        for symbol_data in selected_symbols:
+        for item in fetched:
+            if "error" in item:
+                summary_results.append({"Symbol": item["symbol"], "Error": item["error"]})
+                continue
             try:
-                # Rate limit for iteration
-                time.sleep(0.4)
-                
-                # Determine if input is object (new) or string (old)
-                symbol_name = ""
-                market_token = None
-                
-                if isinstance(symbol_data, dict):
-                    symbol_name = symbol_data.get("symbol", "")
-                    if symbol_data.get("token"):
-                        market_token = str(symbol_data.get("token"))
-                else:
-                    symbol_name = str(symbol_data)
-                
-                # Dynamic Search via API if token not provided
-                if not market_token and smartApi:
-                    try:
-                        clean_search = symbol_name.upper().replace("-EQ", "")
-                        search_res = smartApi.searchScrip("NSE", clean_search)
-                        if search_res and search_res.get('status') and search_res.get('data'):
-                            # Priority Logic: 1. Exact Match, 2. Ends with -EQ, 3. First Found
-                            found_scrip = None
-                            
-                            # 1. Exact match with -EQ suffix (Best for Equity)
-                            target_eq = f"{clean_search}-EQ"
-                            for scrip in search_res['data']:
-                                if scrip['tradingsymbol'] == target_eq:
-                                    found_scrip = scrip
-                                    break
-                            
-                            # 2. Exact match on raw symbol name (some indices/futures)
-                            if not found_scrip:
-                                for scrip in search_res['data']:
-                                    if scrip['tradingsymbol'] == clean_search:
-                                        found_scrip = scrip
-                                        break
-                                        
-                            # 3. Fallback: Ends with -EQ
-                            if not found_scrip:
-                                for scrip in search_res['data']:
-                                    if scrip['tradingsymbol'].endswith('-EQ'):
-                                        found_scrip = scrip
-                                        break
-                                        
-                            # 4. First result (Last resort)
-                            if not found_scrip:
-                                found_scrip = search_res['data'][0]
-                                
-                            market_token = found_scrip['symboltoken']
-                            symbol_name = found_scrip['tradingsymbol'] 
-                            logger.info(f"Dynamic Token Found: {symbol_name} -> {market_token}")
-                    except Exception as ex:
-                        logger.error(f"Dynamic Search Failed for {symbol_name}: {ex}")
-                
-                # Use the resolved symbol name for logging and results
-                symbol = symbol_name
-                
+                symbol = item["symbol"]
                 df = pd.DataFrame()
-
-                # REAL DATA FETCH
-                if smartApi and market_token:
-                    try:
-                        time.sleep(0.3) # Rate limit for data fetch
-                        res = fetch_historical_data(smartApi, "NSE", market_token, interval, start_date, end_date)
-                        if res and res.get('status') and res.get('data'):
-                            raw_data = res['data']
-                            df = pd.DataFrame(raw_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                            df['timestamp'] = pd.to_datetime(df['timestamp'])
-                            for c in ['open','high','low','close','volume']: df[c] = df[c].astype(float)
-                        else:
-                            logger.warning(f"No Data for {symbol}")
-                    except Exception as e:
-                        logger.error(f"Data Fetch Error {symbol}: {e}")
+                if item["candles"]:
+                    df = pd.DataFrame(item["candles"], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+                    df['timestamp'] = pd.to_datetime(df['timestamp'])
+                    for c in ['open','high','low','close','volume']: df[c] = df[c].astype(float)
 
                 # FALLBACK SIMULATION (Only if Real Fetch Fails or No Creds)
-                if df.empty:
+                if df.empty and sessions:
                     logger.warning(f"Using Simulation for {symbol} due to missing data/creds.")
                     
                     # Create timestamps based on full start/end range
@@ -190,11 +246,14 @@ def login_and_run_backtest(data):
                     # Parse start/end times for daily window logic (Market Hours Only)
                     market_open = pd.to_datetime("09:15").time()
                     market_close = pd.to_datetime("15:30").time()
+                    clock = market_clock.get_clock()
                     
                     for d in full_range:
                         # Only generate data during market hours
                         if d.time() < market_open or d.time() > market_close:
                             continue
+                        if not clock.is_trading_day(d.date()):
+                            continue
                             
                         # Important: Also respect the specific user start/end requested
                         if d < pd.to_datetime(start_date) or d > pd.to_datetime(end_date):
@@ -265,9 +324,9 @@ def login_and_run_backtest(data):
                 })
             
             except Exception as symbol_error:
-                logger.exception(f"Error processing {symbol_data}: {symbol_error}")
+                logger.exception(f"Error processing {item['symbol']}: {symbol_error}")
                 summary_results.append({
-                    "Symbol": str(symbol_data),
+                    "Symbol": item["symbol"],
                     "Error": str(symbol_error)
                 })
 
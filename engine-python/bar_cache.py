@@ -0,0 +1,422 @@
+"""
+MerQPrime Daily Bar Cache
+Persistent, columnar daily OHLCV store for the scanner universe.
+
+Each field is kept as a (dates × tickers) float matrix saved as a .npy file,
+so a scan reads the whole universe from local disk instead of re-downloading
+2 years of history. Refreshes only fetch the sessions after the last stored
+date (re-fetching the last bar, which may have been a partial intraday bar),
+and stream batch by batch so callers can evaluate while the next batches
+are still downloading.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from logzero import logger
+
+try:
+    import fcntl
+except ImportError:   # Windows dev boxes: single process, no cross-process lock
+    fcntl = None
+
+DATA_DIR = os.getenv('ENGINE_DATA_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+CACHE_DIR = os.path.join(DATA_DIR, 'daily_bars')
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+HISTORY_PERIOD = "2y"       # Initial download for tickers not yet in the cache
+HISTORY_DAYS = 730          # Calendar days kept on disk (matches HISTORY_PERIOD)
+BATCH_SIZE = 50             # Tickers per pipeline chunk
+MAX_IN_FLIGHT = 3           # Chunks downloading ahead of the one being evaluated
+DOWNLOAD_WORKERS = 16       # Concurrent per-ticker HTTP requests
+ADJUSTMENT_TOLERANCE = 0.01 # Anchor bar moved > 1% → split/bonus, re-download ticker
+AUTO_ADJUST = True          # Split/dividend-adjusted bars; recorded in meta.json, every fetch uses it
+
+
+def _fetch_history(ticker, **kwargs):
+    """Download one ticker's daily history (Ticker.history is safe to run concurrently, yf.download is not)"""
+    try:
+        return yf.Ticker(ticker).history(interval="1d", auto_adjust=AUTO_ADJUST, **kwargs)
+    except Exception as e:
+        logger.error(f"yfinance history failed for {ticker}: {e}")
+        return None
+
+
+def _ticker_frame(data, ticker):
+    """Extract one ticker's OHLCV frame from a yfinance result"""
+    if data is None or data.empty:
+        return None
+    if isinstance(data.columns, pd.MultiIndex):
+        if ticker not in data.columns.get_level_values(0):
+            return None
+        df = data[ticker]
+    else:
+        df = data
+    df = df.dropna(how='all')
+    if df.empty:
+        return None
+    df = df.copy()
+    df.columns = [str(c).lower() for c in df.columns]
+    if not all(f in df.columns for f in FIELDS):
+        return None
+    return df[FIELDS]
+
+
+def _to_days(index):
+    """Normalize a DatetimeIndex to numpy datetime64[D]"""
+    idx = pd.DatetimeIndex(index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    return idx.normalize().values.astype('datetime64[D]')
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """
+    Cross-process lock on `path` (created if missing). The engine and its
+    compute workers share the files under DATA_DIR: writers take it
+    exclusive, readers shared, so nobody sees a half-replaced set of files.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+_download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="bar-cache")
+
+
+class DailyBarCache:
+    """Columnar daily OHLCV cache for the scanner universe."""
+
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+        self._lock_path = os.path.join(path, '.lock')
+        self.dates = np.array([], dtype='datetime64[D]')
+        self.tickers = []
+        self.columns = {f: np.empty((0, 0)) for f in FIELDS}
+        self.refreshed_at = 0
+        self._unpinned = set()      # Tickers stored under another adjustment mode: full reload on refresh
+        self._index = {}
+        self._lock = threading.RLock()
+        self._loaded_stamp = None   # Files' stamp when last read or written by this process
+        self._load()
+
+    # ═══════════════════════════════════════════
+    # DISK I/O
+    # ═══════════════════════════════════════════
+
+    def _stamp(self):
+        """(mtime, size) of meta.json, which save() replaces last; None if there is no cache yet"""
+        try:
+            st = os.stat(os.path.join(self.path, 'meta.json'))
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        with file_lock(self._lock_path, shared=True):
+            self._read()
+
+    def reload_if_changed(self):
+        """Re-read the files if another process saved since this one last read or wrote them"""
+        with self._lock, file_lock(self._lock_path, shared=True):
+            self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """Caller holds the file lock"""
+        if self._stamp() != self._loaded_stamp:
+            logger.info("Daily bar cache changed on disk; reloading")
+            self._read()
+
+    def _read(self):
+        """Load the files (caller holds the file lock)"""
+        meta_path = os.path.join(self.path, 'meta.json')
+        stamp = self._stamp()
+        if stamp is None:
+            return
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            dates = np.load(os.path.join(self.path, 'dates.npy'))
+            columns = {f: np.load(os.path.join(self.path, f'{f}.npy')) for f in FIELDS}
+            tickers = meta.get('tickers', [])
+            if any(c.shape != (len(dates), len(tickers)) for c in columns.values()):
+                raise ValueError("column shapes do not match meta.json")
+            self.dates = dates.astype('datetime64[D]')
+            self.tickers = tickers
+            self.columns = columns
+            self.refreshed_at = meta.get('refreshed_at', 0)
+            # Caches written before AUTO_ADJUST was recorded came from yf.download with the
+            # library's default; comparing them to pinned bars would fail every overlap check
+            if meta.get('auto_adjust') == AUTO_ADJUST:
+                self._unpinned = set(meta.get('unpinned', [])) & set(tickers)
+            else:
+                self._unpinned = set(tickers)
+                logger.warning(f"Daily bar cache adjustment mode differs (auto_adjust={meta.get('auto_adjust')}); "
+                               f"{len(tickers)} tickers get a full reload on their next refresh")
+            self._index = {t: j for j, t in enumerate(self.tickers)}
+            self._loaded_stamp = stamp
+            logger.info(f"Daily bar cache loaded: {len(self.tickers)} tickers × {len(self.dates)} sessions")
+        except Exception as e:
+            logger.error(f"Daily bar cache unreadable, starting empty: {e}")
+
+    def save(self):
+        """Persist all columns atomically (write to temp file, then rename) under the cross-process lock"""
+        with self._lock, file_lock(self._lock_path):
+            self._write()
+
+    def _write(self):
+        """Caller holds the exclusive file lock, with data read after any newer save"""
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+
+            def _write_array(name, arr):
+                final = os.path.join(self.path, f'{name}.npy')
+                tmp = final + '.tmp.npy'
+                np.save(tmp, arr)
+                os.replace(tmp, final)
+
+            _write_array('dates', self.dates)
+            for f in FIELDS:
+                _write_array(f, self.columns[f])
+
+            meta_path = os.path.join(self.path, 'meta.json')
+            with open(meta_path + '.tmp', 'w') as fh:
+                json.dump({"tickers": self.tickers, "refreshed_at": self.refreshed_at,
+                           "auto_adjust": AUTO_ADJUST, "unpinned": sorted(self._unpinned)}, fh)
+            os.replace(meta_path + '.tmp', meta_path)
+            self._loaded_stamp = self._stamp()
+
+    # ═══════════════════════════════════════════
+    # READ
+    # ═══════════════════════════════════════════
+
+    def last_date(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def has(self, ticker):
+        return ticker in self._index
+
+    def frame(self, ticker):
+        """Return a ticker's daily OHLCV as a DataFrame (lowercase columns), or None"""
+        with self._lock:
+            j = self._index.get(ticker)
+            if j is None:
+                return None
+            df = pd.DataFrame(
+                {f: self.columns[f][:, j] for f in FIELDS},
+                index=pd.DatetimeIndex(self.dates, name='date')
+            )
+        return df.dropna(how='all')
+
+    # ═══════════════════════════════════════════
+    # WRITE
+    # ═══════════════════════════════════════════
+
+    def _merge(self, frames):
+        """Merge {ticker: DataFrame} into the matrices, growing dates/tickers as needed"""
+        if not frames:
+            return
+        with self._lock:
+            day_index = {t: _to_days(df.index) for t, df in frames.items()}
+
+            all_dates = np.union1d(self.dates, np.concatenate(list(day_index.values())))
+            if len(all_dates) != len(self.dates):
+                rows = np.searchsorted(all_dates, self.dates)
+                for f in FIELDS:
+                    grown = np.full((len(all_dates), len(self.tickers)), np.nan)
+                    grown[rows, :] = self.columns[f]
+                    self.columns[f] = grown
+                self.dates = all_dates
+
+            new_tickers = [t for t in frames if t not in self._index]
+            if new_tickers:
+                pad = np.full((len(self.dates), len(new_tickers)), np.nan)
+                for f in FIELDS:
+                    self.columns[f] = np.hstack([self.columns[f], pad])
+                for t in new_tickers:
+                    self._index[t] = len(self.tickers)
+                    self.tickers.append(t)
+
+            for t, df in frames.items():
+                j = self._index[t]
+                rows = np.searchsorted(self.dates, day_index[t])
+                for f in FIELDS:
+                    self.columns[f][rows, j] = df[f].to_numpy(dtype=float)
+
+    def _drop_ticker_history(self, ticker):
+        """Blank a ticker's column so a full re-download replaces it cleanly"""
+        j = self._index.get(ticker)
+        if j is not None:
+            for f in FIELDS:
+                self.columns[f][:, j] = np.nan
+
+    def _trim(self):
+        """Keep only the last HISTORY_DAYS calendar days"""
+        if not len(self.dates):
+            return
+        cutoff = self.dates[-1] - np.timedelta64(HISTORY_DAYS, 'D')
+        start = int(np.searchsorted(self.dates, cutoff))
+        if start > 0:
+            self.dates = self.dates[start:]
+            for f in FIELDS:
+                self.columns[f] = self.columns[f][start:, :]
+
+    def _refresh_starts(self, tickers, anchor):
+        """
+        Per-ticker incremental start: the anchor, or the ticker's last stored
+        bar if that is older (a batch that failed on an earlier run would
+        otherwise leave a permanent gap). None for tickers with no bars at all.
+        """
+        cols = [self._index[t] for t in tickers]
+        valid = ~np.isnan(self.columns['close'][:, cols])
+        last = len(self.dates) - 1 - np.argmax(valid[::-1], axis=0)
+        return {t: (min(anchor, self.dates[last[i]]) if valid[:, i].any() else None)
+                for i, t in enumerate(tickers)}
+
+    def _submit_batch(self, batch, **kwargs):
+        """Queue one download per ticker on the shared pool; returns [(ticker, future)]"""
+        return [(t, _download_pool.submit(_fetch_history, t, **kwargs)) for t in batch]
+
+    def _overlap_mismatch(self, ticker, df, start):
+        """
+        True if the ticker's stored close on `start` (its own overlap bar: the
+        anchor, or its last stored bar if older) disagrees with the fresh
+        (re-adjusted) one, or the fresh data lacks that bar so it cannot be
+        verified. Either way the ticker is reloaded instead of merged with a gap.
+        """
+        j = self._index[ticker]
+        row = int(np.searchsorted(self.dates, start))
+        if row >= len(self.dates) or self.dates[row] != start:
+            return False
+        stored = self.columns['close'][row, j]
+        if np.isnan(stored):
+            return False
+        fresh_rows = df[_to_days(df.index) == start]
+        if fresh_rows.empty:
+            return True
+        fresh = float(fresh_rows['close'].iloc[0])
+        return stored > 0 and abs(fresh - stored) / stored > ADJUSTMENT_TOLERANCE
+
+    def iter_refresh(self, tickers, max_in_flight=MAX_IN_FLIGHT):
+        """
+        Bring the cache up to date for `tickers`, yielding as each batch lands.
+        New tickers get a full HISTORY_PERIOD download; known tickers only fetch
+        from the anchor date (second-to-last stored session), or from their own
+        last stored bar if that is older, onwards.
+        Up to `max_in_flight` batches download concurrently while the caller
+        works on the batch just yielded. The exclusive file lock is held
+        throughout, so concurrent refreshes in other processes queue behind it
+        and then start from the saved result.
+        Yields: (ready_tickers, failed_count) per batch.
+        """
+        # One read-modify-write across processes: a worker never overwrites a
+        # newer cache with its stale in-memory copy
+        with file_lock(self._lock_path):
+            with self._lock:
+                self._reload_if_changed()   # Another process may have refreshed meanwhile
+                known = [t for t in tickers if t in self._index and t not in self._unpinned]
+                missing = [t for t in tickers if t not in self._index or t in self._unpinned]
+                anchor = self.dates[-2] if len(self.dates) >= 2 else None
+                starts = self._refresh_starts(known, anchor) if anchor is not None and known else {}
+
+            jobs = deque()
+            if anchor is None:
+                missing, known = list(tickers), []
+            missing += [t for t in known if starts[t] is None]
+            by_start = {}
+            for t in known:
+                if starts[t] is not None:
+                    by_start.setdefault(starts[t], []).append(t)
+            for start, group in sorted(by_start.items()):
+                for i in range(0, len(group), BATCH_SIZE):
+                    jobs.append(("incremental", group[i:i + BATCH_SIZE], start))
+            for i in range(0, len(missing), BATCH_SIZE):
+                jobs.append(("full", missing[i:i + BATCH_SIZE], None))
+
+            in_flight = deque()
+            full_reloads = []
+            failed_total = 0
+
+            def _fill():
+                while jobs and len(in_flight) < max_in_flight:
+                    kind, batch, start = jobs.popleft()
+                    if kind == "incremental":
+                        in_flight.append((kind, start, self._submit_batch(batch, start=str(start))))
+                    else:
+                        in_flight.append((kind, start, self._submit_batch(batch, period=HISTORY_PERIOD)))
+
+            try:
+                _fill()
+                while in_flight:
+                    kind, start, pending = in_flight.popleft()
+                    frames, ready, failed, readjusted = {}, [], 0, []
+                    for t, fut in pending:
+                        df = _ticker_frame(fut.result(), t)
+                        if df is None:
+                            failed += 1
+                        elif kind == "incremental" and self._overlap_mismatch(t, df, start):
+                            readjusted.append(t)
+                        else:
+                            frames[t] = df
+                            ready.append(t)
+
+                    if kind == "full":
+                        with self._lock:
+                            for t in frames:
+                                self._drop_ticker_history(t)
+                            self._unpinned -= frames.keys()
+                    self._merge(frames)
+
+                    # Split/bonus-adjusted tickers go to the back of the queue for a full reload
+                    for i in range(0, len(readjusted), BATCH_SIZE):
+                        jobs.append(("full", readjusted[i:i + BATCH_SIZE], None))
+                    full_reloads.extend(readjusted)
+                    failed_total += failed
+
+                    # Keep downloads running while the caller processes this batch
+                    _fill()
+                    yield ready, failed
+            finally:
+                for _, _, pending in in_flight:
+                    for _, fut in pending:
+                        fut.cancel()
+                with self._lock:
+                    self._trim()
+                    self.refreshed_at = time.time()
+                    self._write()
+                logger.info(f"Daily bar cache refreshed: {len(tickers)} tickers, "
+                            f"{len(missing) + len(full_reloads)} full downloads, {failed_total} failed")
+
+    def refresh(self, tickers):
+        """Bring the cache up to date for `tickers`. Returns the number that failed."""
+        return sum(failed for _, failed in self.iter_refresh(tickers))
+
+
+# ── Process-wide cache instance ──
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the shared DailyBarCache (loaded from disk on first use)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DailyBarCache()
+        return _cache
@@ -0,0 +1,233 @@
+"""
+MerQPrime Broker Gateway
+Single choke point for Angel One SmartAPI calls: per-account token buckets
+per endpoint class, with priority lanes.
+
+Angel One rate-limits each endpoint family per account (orders ~20/s,
+candles 3/s, search and order book 1/s ...). Instead of sleeping before
+every call, callers go through a GatewayClient which waits for a token
+from the right bucket. Waiters are served by lane, then arrival order:
+
+    LIVE    - entry / exit / cancel / modify (default for order calls)
+    NORMAL  - session housekeeping (order book, positions, LTP polls)
+    BULK    - history fetches, warm-ups, scans, backtests
+
+so a live exit never queues behind a backtest's candle downloads.
+Queue wait per lane and endpoint class is recorded for `metrics()`.
+
+Usage:
+    client = broker_gateway.wrap(smart_api, client_code)
+    with broker_gateway.lane(broker_gateway.BULK):
+        client.getCandleData(params)
+    bulk_client = broker_gateway.in_lane(client, broker_gateway.BULK)
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+LIVE, NORMAL, BULK = 0, 1, 2
+LANE_NAMES = {LIVE: "live", NORMAL: "normal", BULK: "bulk"}
+
+# Endpoint class -> (tokens per second, burst)
+ENDPOINT_LIMITS = {
+    "orders": (20.0, 10),
+    "orderbook": (1.0, 1),
+    "position": (1.0, 1),
+    "candles": (3.0, 3),
+    "search": (1.0, 1),
+    "quote": (10.0, 5),
+    "auth": (1.0, 1),
+    "default": (3.0, 3),
+}
+
+# SmartConnect method -> (endpoint class, default lane)
+METHOD_CLASSES = {
+    "placeOrder": ("orders", LIVE),
+    "placeOrderFullResponse": ("orders", LIVE),
+    "modifyOrder": ("orders", LIVE),
+    "cancelOrder": ("orders", LIVE),
+    "orderBook": ("orderbook", NORMAL),
+    "tradeBook": ("orderbook", NORMAL),
+    "individual_order_details": ("orderbook", NORMAL),
+    "position": ("position", NORMAL),
+    "holding": ("position", NORMAL),
+    "allholding": ("position", NORMAL),
+    "getCandleData": ("candles", BULK),
+    "searchScrip": ("search", NORMAL),
+    "ltpData": ("quote", NORMAL),
+    "getMarketData": ("quote", NORMAL),
+    "generateSession": ("auth", LIVE),
+    "generateToken": ("auth", LIVE),
+    "getProfile": ("auth", NORMAL),
+    "terminateSession": ("auth", NORMAL),
+}
+
+# Attributes that are local state on SmartConnect, not API calls
+_LOCAL_METHODS = {"setAccessToken", "setRefreshToken", "setFeedToken", "setUserId", "getfeedToken",
+                  "getUserId", "setSessionExpiryHook", "login_url", "requestHeaders"}
+
+
+# ═══════════════════════════════════════════
+# TOKEN BUCKET WITH PRIORITY QUEUE
+# ═══════════════════════════════════════════
+
+class _Bucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiters = []          # heap of (lane, seq)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, lane, seq):
+        """Block until this caller is first in line and a token is available"""
+        with self.cond:
+            entry = (lane, seq)
+            heapq.heappush(self.waiters, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.waiters[0] == entry and self.tokens >= 1:
+                    heapq.heappop(self.waiters)
+                    self.tokens -= 1
+                    self.cond.notify_all()   # Next in line re-checks
+                    return
+                wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+                self.cond.wait(timeout=max(wait, 0.001))
+
+
+class _LaneStats:
+    __slots__ = ("calls", "wait_ms", "max_wait_ms")
+
+    def __init__(self):
+        self.calls = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+
+class BrokerGateway:
+    """Per-account, per-endpoint-class rate limiter with priority lanes."""
+
+    def __init__(self, limits=ENDPOINT_LIMITS):
+        self.limits = limits
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _bucket(self, account, endpoint):
+        key = (account, endpoint)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(*self.limits.get(endpoint, self.limits["default"]))
+            return bucket
+
+    def acquire(self, account, endpoint, lane=NORMAL):
+        """Wait for a call slot; returns the queue wait in seconds"""
+        started = time.monotonic()
+        self._bucket(account, endpoint).acquire(lane, next(self._seq))
+        waited = time.monotonic() - started
+
+        with self._lock:
+            stats = self._stats.setdefault((LANE_NAMES.get(lane, str(lane)), endpoint), _LaneStats())
+            stats.calls += 1
+            stats.wait_ms += waited * 1000
+            stats.max_wait_ms = max(stats.max_wait_ms, waited * 1000)
+        return waited
+
+    def metrics(self):
+        """Queue-wait totals per lane and endpoint class"""
+        with self._lock:
+            out = {}
+            for (lane, endpoint), s in self._stats.items():
+                out.setdefault(lane, {})[endpoint] = {
+                    "calls": s.calls,
+                    "avg_wait_ms": round(s.wait_ms / s.calls, 1) if s.calls else 0.0,
+                    "max_wait_ms": round(s.max_wait_ms, 1),
+                }
+            return out
+
+
+_gateway = BrokerGateway()
+_context = threading.local()
+
+
+def get_gateway():
+    return _gateway
+
+
+@contextmanager
+def lane(priority):
+    """Run the enclosed broker calls in a given lane (e.g. BULK for warm-ups and backtests)"""
+    previous = getattr(_context, "lane", None)
+    _context.lane = priority
+    try:
+        yield
+    finally:
+        _context.lane = previous
+
+
+def current_lane(default, override=None):
+    override = getattr(_context, "lane", None) if override is None else override
+    # Order calls stay LIVE even inside a BULK context
+    if override is None or default == LIVE:
+        return default
+    return override
+
+
+# ═══════════════════════════════════════════
+# SMARTCONNECT PROXY
+# ═══════════════════════════════════════════
+
+class GatewayClient:
+    """Wraps a SmartConnect so every API method waits on the gateway first."""
+
+    def __init__(self, smart_api, account, gateway=None, lane=None):
+        object.__setattr__(self, "_api", smart_api)
+        object.__setattr__(self, "_account", account)
+        object.__setattr__(self, "_gateway", gateway or _gateway)
+        object.__setattr__(self, "_lane", lane)
+
+    @property
+    def raw(self):
+        return self._api
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith("_") or name in _LOCAL_METHODS:
+            return attr
+        endpoint, default_lane = METHOD_CLASSES.get(name, ("default", NORMAL))
+        gateway, account, override = self._gateway, self._account, self._lane
+
+        def _call(*args, **kwargs):
+            gateway.acquire(account, endpoint, current_lane(default_lane, override))
+            return attr(*args, **kwargs)
+        _call.__name__ = name
+        return _call
+
+    def __setattr__(self, name, value):
+        # Token assignments etc. land on the real SmartConnect
+        setattr(self._api, name, value)
+
+
+def wrap(smart_api, account):
+    """Route a SmartConnect's API calls through the gateway under `account`'s limits"""
+    if isinstance(smart_api, GatewayClient):
+        return smart_api
+    return GatewayClient(smart_api, account)
+
+
+def in_lane(client, priority):
+    """Same SmartConnect and limits, with non-order calls queued in `priority` (e.g. BULK for a whole backtest)"""
+    if not isinstance(client, GatewayClient):
+        return client
+    return GatewayClient(client.raw, client._account, client._gateway, priority)
@@ -0,0 +1,213 @@
+"""
+MerQPrime Broker Session Cache
+One authenticated Angel One SmartConnect per client code, shared by trading
+sessions, backtests, scans and test orders.
+
+A login (SmartConnect + TOTP + generateSession) costs 1-2s and counts
+against the broker's login rate limit, so it happens once per client code:
+- concurrent callers for the same client code wait on a single in-flight
+  login instead of each logging in
+- JWT / refresh / feed tokens and their expiry are kept with the session
+- tokens are renewed with generateToken(refresh_token) before they expire
+  (on access and from a background refresher); a full login is only the
+  fallback
+- the SmartConnect is wrapped by broker_gateway, so every API call made
+  through it is rate-limited per client code
+
+Usage:
+    import broker_sessions
+    broker = broker_sessions.get_cache().get(credentials)
+    broker.smart_api.getCandleData(...)
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+
+import pyotp
+from SmartApi import SmartConnect
+from logzero import logger
+
+import http_client
+import broker_gateway
+import engine_loop
+
+TOKEN_LIFETIME = float(os.getenv('BROKER_TOKEN_LIFETIME_HOURS', '12')) * 3600
+REFRESH_MARGIN = 3600          # Renew tokens this long before they expire
+REFRESH_CHECK_INTERVAL = 300   # Background refresher wake-up
+
+
+class BrokerLoginError(Exception):
+    """Raised when a broker session cannot be established."""
+
+
+def normalize_credentials(credentials):
+    """Accept both the camelCase (sessions, test order) and snake_case (scanner, backtest) credential keys"""
+    c = credentials or {}
+    return {
+        "api_key": c.get("api_key") or c.get("apiKey"),
+        "client_code": c.get("client_code") or c.get("clientCode"),
+        "password": c.get("password"),
+        "totp": c.get("totp"),
+        "access_token": c.get("access_token") or c.get("accessToken"),
+    }
+
+
+class BrokerSession:
+    """An authenticated SmartConnect plus its tokens."""
+
+    def __init__(self, client_code, api_key, smart_api, fingerprint):
+        self.client_code = client_code
+        self.api_key = api_key
+        self.smart_api = smart_api
+        self.fingerprint = fingerprint
+        self.auth_token = None
+        self.refresh_token = None
+        self.feed_token = None
+        self.expires_at = 0.0
+        self.oauth = False
+
+    def needs_refresh(self, now=None):
+        return not self.oauth and (now or time.time()) >= self.expires_at - REFRESH_MARGIN
+
+    def expired(self, now=None):
+        return not self.oauth and (now or time.time()) >= self.expires_at
+
+
+class BrokerSessionCache:
+    """Per-client-code session cache with single-flight login and token refresh."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def _client_lock(self, client_code):
+        with self._lock:
+            return self._locks.setdefault(client_code, threading.Lock())
+
+    @staticmethod
+    def _fingerprint(creds):
+        raw = f"{creds['api_key']}|{creds['password']}|{creds['totp']}|{creds['access_token']}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # ═══════════════════════════════════════════
+    # LOGIN / REFRESH
+    # ═══════════════════════════════════════════
+
+    def _login(self, creds, allow_oauth):
+        api_key, client_code = creds["api_key"], creds["client_code"]
+        smart_api = broker_gateway.wrap(http_client.attach(SmartConnect(api_key=api_key)), client_code)
+        broker = BrokerSession(client_code, api_key, smart_api, self._fingerprint(creds))
+
+        if creds["password"] and creds["totp"]:
+            totp = pyotp.TOTP(creds["totp"]).now()
+            data = smart_api.generateSession(client_code, creds["password"], totp)
+            if not data or not data.get('status'):
+                raise BrokerLoginError((data or {}).get('message', 'Unknown error'))
+            broker.auth_token = data['data']['jwtToken']
+            broker.refresh_token = data['data']['refreshToken']
+            broker.feed_token = data['data']['feedToken']
+            broker.expires_at = time.time() + TOKEN_LIFETIME
+        elif allow_oauth and creds["access_token"]:
+            # OAuth tokens are pushed by the backend; they cannot be renewed here
+            smart_api.access_token = creds["access_token"]
+            broker.auth_token = creds["access_token"]
+            broker.oauth = True
+        else:
+            raise BrokerLoginError("Missing broker credentials (password/totp or access_token)")
+
+        logger.info(f"Broker login for ...{client_code[-4:]} ({'OAuth' if broker.oauth else 'TOTP'})")
+        return broker
+
+    def _renew(self, broker):
+        """Swap in fresh tokens via the refresh token; False if the broker refused"""
+        try:
+            resp = broker.smart_api.generateToken(broker.refresh_token)
+            if not resp or not resp.get('status'):
+                return False
+            data = resp['data']
+            broker.auth_token = f"Bearer {data['jwtToken']}"
+            broker.refresh_token = data.get('refreshToken', broker.refresh_token)
+            broker.smart_api.setRefreshToken(broker.refresh_token)
+            broker.feed_token = data['feedToken']
+            broker.expires_at = time.time() + TOKEN_LIFETIME
+            logger.info(f"Broker tokens renewed for ...{broker.client_code[-4:]}")
+            return True
+        except Exception as e:
+            logger.warning(f"Broker token renewal failed for ...{broker.client_code[-4:]}: {e}")
+            return False
+
+    # ═══════════════════════════════════════════
+    # PUBLIC API
+    # ═══════════════════════════════════════════
+
+    def get(self, credentials, allow_oauth=True):
+        """
+        Ready BrokerSession for these credentials, logging in at most once per
+        client code. Raises BrokerLoginError.
+        """
+        creds = normalize_credentials(credentials)
+        if not creds["api_key"] or not creds["client_code"]:
+            raise BrokerLoginError("Missing API key or Client Code")
+        client_code = creds["client_code"]
+
+        with self._client_lock(client_code):
+            broker = self._sessions.get(client_code)
+            if broker and broker.fingerprint != self._fingerprint(creds):
+                broker = None   # Credentials changed: log in again
+            if broker and broker.needs_refresh():
+                if not (broker.refresh_token and self._renew(broker)) and broker.expired():
+                    broker = None
+            if broker is None:
+                broker = self._login(creds, allow_oauth)
+                self._sessions[client_code] = broker
+        self._start_refresher()
+        return broker
+
+    def refresh(self, credentials, allow_oauth=True):
+        """Force new tokens after an auth error: refresh token first, full login as fallback"""
+        creds = normalize_credentials(credentials)
+        client_code = creds["client_code"]
+        with self._client_lock(client_code):
+            broker = self._sessions.get(client_code)
+            if broker and broker.refresh_token and self._renew(broker):
+                return broker
+            self._sessions.pop(client_code, None)
+        return self.get(credentials, allow_oauth)
+
+    def invalidate(self, client_code):
+        with self._client_lock(client_code):
+            self._sessions.pop(client_code, None)
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = engine_loop.submit(self._refresh_loop())
+
+    def _refresh_due(self):
+        for client_code, broker in list(self._sessions.items()):
+            if broker.needs_refresh() and broker.refresh_token:
+                with self._client_lock(client_code):
+                    if broker.needs_refresh() and not self._renew(broker) and broker.expired():
+                        self._sessions.pop(client_code, None)
+
+    async def _refresh_loop(self):
+        """Renew tokens ahead of expiry so live sessions never hit an expired JWT"""
+        while True:
+            await asyncio.sleep(REFRESH_CHECK_INTERVAL)
+            try:
+                await engine_loop.run_blocking(self._refresh_due)
+            except Exception as e:
+                logger.error(f"Broker token refresher error: {e}")
+
+
+# ── Process-wide cache ──
+_cache = BrokerSessionCache()
+
+
+def get_cache():
+    return _cache
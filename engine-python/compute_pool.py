@@ -0,0 +1,227 @@
+"""
+MerQPrime Compute Pool
+Backtests and scanner passes run in a separate pool of worker processes
+instead of the live trading interpreter.
+
+pandas/numpy-heavy jobs used to run on the engine's own threads, so a
+large scan held the GIL between websocket callbacks of every live session.
+Jobs now go to a small ProcessPoolExecutor whose workers run at lower CPU
+priority (nice), with admission control: at most COMPUTE_WORKERS jobs run
+and COMPUTE_MAX_QUEUED wait; further submissions are rejected with
+ComputePoolBusy instead of piling up.
+
+Workers never talk to the broker: a backtest's candles are fetched in the
+engine (on its cached login and per-account rate limits) and passed in,
+and scans read yfinance bars through the file-locked bar cache.
+
+Scan progress is mirrored from the worker into a Manager dict so the
+progress endpoint keeps working; queue depth, queue wait and run time per
+job kind are exposed by `metrics()`.
+"""
+
+import os
+import time
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from logzero import logger
+
+COMPUTE_WORKERS = int(os.getenv('COMPUTE_WORKERS', '2'))
+COMPUTE_MAX_QUEUED = int(os.getenv('COMPUTE_MAX_QUEUED', '8'))
+COMPUTE_NICE = int(os.getenv('COMPUTE_NICE', '10'))
+
+
+class ComputePoolBusy(Exception):
+    """Raised when the pool's running + queued limit is reached."""
+
+
+def _init_worker(niceness):
+    """Worker initializer: yield CPU to the live trading process"""
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+def _timed(fn, args, kwargs):
+    """Run a job in the worker, returning (start time, result) so the parent can measure queue wait"""
+    started = time.time()
+    return started, fn(*args, **kwargs)
+
+
+# ═══════════════════════════════════════════
+# JOB ENTRY POINTS (run inside workers)
+# ═══════════════════════════════════════════
+
+def run_backtest_job(data, fetched):
+    """Strategy half of a backtest; `fetched` is backtest_runner.fetch_backtest_data() from the engine"""
+    import backtest_runner
+    importlib.reload(backtest_runner)   # Pick up strategy edits without restarting the engine
+    return backtest_runner.run_backtest(data, fetched)
+
+
+def run_scan_job(scanner_id, sentiment_map, filter_sentiment, shared_progress):
+    import scanner
+    keys = set(scanner.SCANNERS) | {scanner_id, scanner.ALL_SCANNERS}
+
+    def publish(progress):
+        for key in keys:
+            shared_progress[key] = progress
+    return scanner.run_scanners(list(scanner.SCANNERS), sentiment_map, filter_sentiment,
+                                progress_keys=[scanner_id], publish=publish)
+
+
+# ═══════════════════════════════════════════
+# POOL
+# ═══════════════════════════════════════════
+
+class _KindStats:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.run_ms = 0.0
+
+
+class ComputePool:
+    """Niced worker processes with bounded admission and per-kind metrics."""
+
+    def __init__(self, workers=COMPUTE_WORKERS, max_queued=COMPUTE_MAX_QUEUED):
+        # spawn: never fork the trading process with its live socket threads
+        self._ctx = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=self._ctx,
+                                             initializer=_init_worker, initargs=(COMPUTE_NICE,))
+        self._manager = None
+        self._progress = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {}
+
+    @property
+    def shared_progress(self):
+        """Manager dict the scan workers publish progress into (started on first scan)"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._ctx.Manager()
+                self._progress = self._manager.dict()
+            return self._progress
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue a job; returns a Future of its result. Raises ComputePoolBusy."""
+        with self._lock:
+            stats = self._stats.setdefault(kind, _KindStats())
+            if self._in_flight >= self.workers + self.max_queued:
+                stats.rejected += 1
+                raise ComputePoolBusy(f"Compute pool busy ({self._in_flight} jobs in flight)")
+            self._in_flight += 1
+            stats.submitted += 1
+
+        submitted = time.time()
+        inner = self._executor.submit(_timed, fn, args, kwargs)
+        outer = _ResultFuture(inner)
+
+        def _done(f):
+            finished = time.time()
+            with self._lock:
+                self._in_flight -= 1
+                if f.exception() is not None:
+                    stats.failed += 1
+                    logger.error(f"Compute job {kind} failed: {f.exception()}")
+                    return
+                started, _ = f.result()
+                wait_ms = max(started - submitted, 0) * 1000
+                stats.completed += 1
+                stats.wait_ms += wait_ms
+                stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+                stats.run_ms += (finished - started) * 1000
+        inner.add_done_callback(_done)
+        return outer
+
+    def submit_scan(self, scanner_id, sentiment_map, filter_sentiment, on_result):
+        """Queue a scanner pass; progress shows "queued" until a worker picks it up"""
+        import scanner
+        keys = set(scanner.SCANNERS) | {scanner_id, scanner.ALL_SCANNERS}
+        shared = self.shared_progress
+        for key in keys:
+            shared[key] = {"status": "queued", "current": 0, "total": 0, "symbol": "Queued", "matches": 0}
+        try:
+            future = self.submit("scan", run_scan_job, scanner_id, sentiment_map, filter_sentiment, shared)
+        except ComputePoolBusy:
+            for key in keys:
+                shared.pop(key, None)
+            raise
+
+        def _finished(f):
+            try:
+                on_result(f.result())
+            except Exception as e:
+                for key in keys:
+                    shared[key] = {"status": "error", "message": str(e)}
+        future.add_done_callback(_finished)
+        return future
+
+    def run(self, kind, fn, *args, **kwargs):
+        """Submit and wait for the result (for synchronous endpoints)"""
+        return self.submit(kind, fn, *args, **kwargs).result()
+
+    def progress(self, key):
+        if self._progress is None:
+            return None
+        return self._progress.get(key)
+
+    def metrics(self):
+        with self._lock:
+            running = min(self._in_flight, self.workers)
+            return {
+                "workers": self.workers,
+                "running": running,
+                "queued": self._in_flight - running,
+                "max_queued": self.max_queued,
+                "kinds": {
+                    kind: {
+                        "submitted": s.submitted,
+                        "completed": s.completed,
+                        "failed": s.failed,
+                        "rejected": s.rejected,
+                        "avg_wait_ms": round(s.wait_ms / s.completed, 1) if s.completed else 0.0,
+                        "max_wait_ms": round(s.max_wait_ms, 1),
+                        "avg_run_ms": round(s.run_ms / s.completed, 1) if s.completed else 0.0,
+                    } for kind, s in self._stats.items()
+                },
+            }
+
+
+class _ResultFuture:
+    """Future view that strips the worker's start timestamp from the result"""
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    def result(self, timeout=None):
+        return self._inner.result(timeout)[1]
+
+    def done(self):
+        return self._inner.done()
+
+    def add_done_callback(self, fn):
+        self._inner.add_done_callback(lambda _: fn(self))
+
+
+# ── Process-wide pool (created on first job) ──
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ComputePool()
+        return _pool
@@ -0,0 +1,98 @@
+"""
+MerQPrime Engine Loop
+One asyncio event loop per engine process for session lifecycles, timers
+and reconciliation, plus a bounded thread pool for blocking calls
+(SmartAPI, backend HTTP).
+
+Sessions no longer own login / standby / OCO / reconnect threads: those
+are coroutines on this loop, sleeping with asyncio.sleep and handing
+blocking work to `run_blocking`. The thread count stays at the loop thread
+plus the executor size however many sessions are running.
+
+Usage:
+    import engine_loop
+    task = engine_loop.submit(session._run())      # from any thread
+    result = await engine_loop.run_blocking(smart_api.orderBook)
+    engine_loop.cancel(task)
+"""
+
+import os
+import asyncio
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from logzero import logger
+
+BLOCKING_WORKERS = int(os.getenv('ENGINE_BLOCKING_WORKERS', '32'))
+
+
+class EngineLoop:
+    """Event loop running in a daemon thread with a bounded blocking executor."""
+
+    def __init__(self, workers=BLOCKING_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="engine-io")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.loop.set_exception_handler(self._on_exception)
+        self._pending = 0           # Blocking calls queued or running
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="engine-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @staticmethod
+    def _on_exception(loop, context):
+        logger.error(f"Engine loop error: {context.get('exception') or context.get('message')}")
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking call on the bounded executor and await its result"""
+        with self._lock:
+            self._pending += 1
+        try:
+            return await self.loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        return {
+            "tasks": len(asyncio.all_tasks(self.loop)),
+            "blocking_pending": self._pending,
+            "blocking_workers": self.workers,
+            "threads": threading.active_count(),
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EngineLoop()
+        return _engine
+
+
+def submit(coro):
+    return get_engine().submit(coro)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    return await get_engine().run_blocking(fn, *args, **kwargs)
+
+
+def cancel(future):
+    """Cancel a task started with `submit` (safe from any thread, None allowed)"""
+    if future is not None and not future.done():
+        future.cancel()
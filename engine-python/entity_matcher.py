@@ -0,0 +1,93 @@
+"""
+MerQPrime Entity Matcher
+Aho-Corasick keyword automaton for finding stock mentions in news text.
+
+The automaton is built once from {keyword: symbols}; each text is then
+matched in a single linear scan regardless of how many keywords exist.
+Matching is case-insensitive and only accepts whole words (the characters
+either side of a hit must not be letters or digits), so "ITC" does not
+fire inside "switch".
+"""
+
+from collections import deque
+
+
+def _is_word_char(ch):
+    return ch.isalnum()
+
+
+class EntityMatcher:
+    """Case-insensitive, word-boundary multi-keyword matcher."""
+
+    def __init__(self, keyword_map):
+        # Trie as parallel lists: goto[state] = {char: state}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]          # [(keyword_length, symbols)] ending at this state
+        self.keywords = 0
+
+        for keyword, symbols in keyword_map.items():
+            key = keyword.strip().lower()
+            if not key:
+                continue
+            self._add(key, tuple(symbols))
+            self.keywords += 1
+        self._build_links()
+
+    # ═══════════════════════════════════════════
+    # CONSTRUCTION
+    # ═══════════════════════════════════════════
+
+    def _add(self, key, symbols):
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(key), symbols))
+
+    def _build_links(self):
+        """Breadth-first failure links; outputs are merged along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    # ═══════════════════════════════════════════
+    # MATCHING
+    # ═══════════════════════════════════════════
+
+    def match(self, text):
+        """Return the set of symbols whose keywords appear as whole words in `text`"""
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        n = len(text)
+
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            # Hit ends at i; accept only if the next char closes the word
+            if i + 1 < n and _is_word_char(text[i + 1]):
+                continue
+            for length, symbols in out[state]:
+                start = i - length + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                found.update(symbols)
+        return found
@@ -0,0 +1,215 @@
+"""
+MerQPrime HTTP Client
+Shared keep-alive HTTP sessions for everything the engine sends out.
+
+Each call class gets its own requests.Session with per-host connection
+pools, a default timeout and a retry budget:
+
+    orders    - broker order/REST calls; short connect timeout, retries only
+                on connect failures (an order POST is never resent)
+    backend   - webhooks to the Node backend (trades, ticks, sentiments)
+    shards    - front router -> engine shard processes (long read timeout
+                for synchronous backtests, never retried)
+    alerts    - WhatsApp / third-party notifications
+    feeds     - news RSS polling for the sentiment worker
+
+Connection reuse is measured by counting the sockets urllib3 actually
+opens, so `metrics()` shows how many requests skipped the TCP/TLS handshake.
+
+Usage:
+    import http_client
+    http_client.post("backend", url, json=payload)
+    http_client.attach(smart_api)          # route SmartConnect through the orders pool
+"""
+
+import time
+import types
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from logzero import logger
+
+ANGEL_API_ROOT = "https://apiconnect.angelbroking.com"
+
+CALL_CLASSES = {
+    "orders": {
+        "timeout": (3.05, 15),
+        "retry": Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.1, allowed_methods=None),
+        "pool_maxsize": 32,
+    },
+    "backend": {
+        "timeout": (2, 5),
+        "retry": Retry(total=1, connect=1, read=0, status=0, backoff_factor=0.2),
+        "pool_maxsize": 8,
+    },
+    "shards": {
+        "timeout": (3.05, 600),
+        "retry": Retry(total=0),
+        "pool_maxsize": 32,
+    },
+    "alerts": {
+        "timeout": (5, 10),
+        "retry": Retry(total=2, connect=2, read=1, status=0, backoff_factor=0.5),
+        "pool_maxsize": 4,
+    },
+    "feeds": {
+        "timeout": (5, 15),
+        "retry": Retry(total=2, connect=2, read=1, status=0, backoff_factor=0.5),
+        "pool_maxsize": 4,
+    },
+}
+
+
+# ═══════════════════════════════════════════
+# CONNECTION ACCOUNTING
+# ═══════════════════════════════════════════
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.total_ms = 0.0
+
+    def snapshot(self):
+        with self.lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+                "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            }
+
+
+def _counting_pool(base, metrics):
+    class _CountingPool(base):
+        def _new_conn(self):
+            with metrics.lock:
+                metrics.new_connections += 1
+            return super()._new_conn()
+    return _CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools report every newly opened socket"""
+
+    def __init__(self, metrics, **kwargs):
+        self._metrics = metrics
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._metrics),
+            "https": _counting_pool(HTTPSConnectionPool, self._metrics),
+        }
+
+
+class ClassSession(requests.Session):
+    """requests.Session with a default timeout and request/latency metrics"""
+
+    def __init__(self, name, timeout, retry, pool_maxsize):
+        super().__init__()
+        self.name = name
+        self.default_timeout = timeout
+        self.metrics = _Metrics()
+        adapter = _CountingAdapter(self.metrics, pool_connections=8, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        started = time.perf_counter()
+        try:
+            return super().request(method, url, **kwargs)
+        except Exception:
+            with self.metrics.lock:
+                self.metrics.errors += 1
+            raise
+        finally:
+            with self.metrics.lock:
+                self.metrics.requests += 1
+                self.metrics.total_ms += (time.perf_counter() - started) * 1000
+
+
+# ═══════════════════════════════════════════
+# PUBLIC API
+# ═══════════════════════════════════════════
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session(call_class):
+    """Shared Session for a call class (created on first use)"""
+    with _sessions_lock:
+        s = _sessions.get(call_class)
+        if s is None:
+            spec = CALL_CLASSES[call_class]
+            s = _sessions[call_class] = ClassSession(call_class, spec["timeout"], spec["retry"], spec["pool_maxsize"])
+        return s
+
+
+def get(call_class, url, **kwargs):
+    return session(call_class).get(url, **kwargs)
+
+
+def post(call_class, url, **kwargs):
+    return session(call_class).post(url, **kwargs)
+
+
+class _PooledRequests:
+    """Stands in for the `requests` module inside SmartConnect._request: requests.request goes to a pooled session"""
+
+    def __init__(self, call_class):
+        self._call_class = call_class
+
+    def request(self, method, url, **kwargs):
+        return session(self._call_class).request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+_pooled_request = None
+
+
+def _smartconnect_request():
+    """SmartConnect._request bound to the orders pool (the SDK calls the module-level requests.request, not reqsession)"""
+    global _pooled_request
+    if _pooled_request is None:
+        import SmartApi.smartConnect as sdk
+        fn = sdk.SmartConnect._request
+        _pooled_request = types.FunctionType(fn.__code__, {**vars(sdk), "requests": _PooledRequests("orders")},
+                                             fn.__name__, fn.__defaults__, fn.__closure__)
+    return _pooled_request
+
+
+def attach(smart_api):
+    """Make a SmartConnect instance send every call through the pooled orders session"""
+    smart_api.reqsession = session("orders")
+    smart_api._request = types.MethodType(_smartconnect_request(), smart_api)
+    return smart_api
+
+
+def warm(call_class, url=ANGEL_API_ROOT):
+    """Open a pooled connection ahead of time (e.g. right after broker login) so the first order skips the handshake"""
+    def _warm():
+        try:
+            session(call_class).head(url, timeout=5)
+        except Exception as e:
+            logger.debug(f"HTTP warm-up for {url} failed: {e}")
+    threading.Thread(target=_warm, name=f"http-warm-{call_class}", daemon=True).start()
+
+
+def metrics():
+    """Per call class request counts, errors, latency and connection reuse"""
+    with _sessions_lock:
+        return {name: s.metrics.snapshot() for name, s in _sessions.items()}
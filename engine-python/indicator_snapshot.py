@@ -0,0 +1,333 @@
+"""
+MerQPrime End-of-Day Indicator Snapshot
+Per-symbol indicator state table maintained incrementally from the daily bar cache.
+
+ATR(14), EMA(50/150/200), the 52-week high and ATR from 10 sessions ago are all
+carried forward from yesterday's state plus today's bar, so a post-close run
+only processes the new session(s). Scans then become a vectorized filter over
+one row per stock instead of recomputing indicators over 2 years of history.
+
+Run after market close (or leave running as a daemon):
+    python indicator_snapshot.py
+"""
+
+import os
+import time
+import threading
+import datetime
+
+import numpy as np
+from logzero import logger
+
+import bar_cache
+import market_clock
+
+STATE_PATH = os.path.join(bar_cache.DATA_DIR, 'indicator_state.npz')
+
+ATR_PERIOD = 14
+ATR_LOOKBACK = 11       # Today's ATR plus the value 10 sessions ago
+HIGH_LOOKBACK = 252     # 52 weeks of trading sessions
+EMA_SPANS = (50, 150, 200)
+STATE_FIELDS = ['close', 'prev_close', 'volume', 'atr14', 'ema50', 'ema150', 'ema200', 'count']
+READJUST_TOLERANCE = 0.01   # Cached close moved under us (split/bonus) → rebuild that symbol
+
+
+def last_completed_session(now=None):
+    """Most recent trading day whose 15:30 IST close has passed"""
+    return np.datetime64(market_clock.get_clock().last_completed_session(now), 'D')
+
+
+class IndicatorSnapshot:
+    """Columnar per-symbol indicator state (one slot per ticker)."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._lock_path = path + '.lock'
+        self.tickers = []
+        self.as_of = None
+        self.updated_at = 0
+        self.state = {f: np.empty(0) for f in STATE_FIELDS}
+        self.atr_hist = np.empty((ATR_LOOKBACK, 0))
+        self.close_hist = np.empty((HIGH_LOOKBACK, 0))
+        self._index = {}
+        self._lock = threading.RLock()
+        self._loaded_stamp = None   # File's stamp when last read or written by this process
+        self._load()
+
+    # ═══════════════════════════════════════════
+    # DISK I/O
+    # ═══════════════════════════════════════════
+
+    def _stamp(self):
+        """(mtime, size) of the state file; None if there is none yet"""
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        with bar_cache.file_lock(self._lock_path, shared=True):
+            self._read()
+
+    def _reload_if_changed(self):
+        """Caller holds the file lock"""
+        if self._stamp() != self._loaded_stamp:
+            logger.info("Indicator snapshot changed on disk; reloading")
+            self._read()
+
+    def _read(self):
+        """Load the state file (caller holds the file lock)"""
+        stamp = self._stamp()
+        if stamp is None:
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.tickers = [str(t) for t in data['tickers']]
+                self.state = {f: data[f].astype(float) for f in STATE_FIELDS}
+                self.atr_hist = data['atr_hist']
+                self.close_hist = data['close_hist']
+                as_of = data['as_of']
+                self.as_of = as_of[0] if len(as_of) else None
+                self.updated_at = float(data['updated_at'][0])
+            self._index = {t: j for j, t in enumerate(self.tickers)}
+            self._loaded_stamp = stamp
+            logger.info(f"Indicator snapshot loaded: {len(self.tickers)} symbols as of {self.as_of}")
+        except Exception as e:
+            logger.error(f"Indicator snapshot unreadable, will rebuild: {e}")
+            self.tickers, self._index, self.as_of = [], {}, None
+            self.state = {f: np.empty(0) for f in STATE_FIELDS}
+            self.atr_hist = np.empty((ATR_LOOKBACK, 0))
+            self.close_hist = np.empty((HIGH_LOOKBACK, 0))
+
+    def save(self):
+        # Cross-process lock: the engine and compute workers both update the snapshot
+        with self._lock, bar_cache.file_lock(self._lock_path):
+            self._write()
+
+    def _write(self):
+        """Caller holds the exclusive file lock, with state read after any newer save"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path[:-len('.npz')] + '.tmp.npz'
+            np.savez(
+                tmp,
+                tickers=np.array(self.tickers, dtype=str),
+                as_of=np.array([self.as_of] if self.as_of is not None else [], dtype='datetime64[D]'),
+                updated_at=np.array([self.updated_at]),
+                atr_hist=self.atr_hist,
+                close_hist=self.close_hist,
+                **self.state
+            )
+            os.replace(tmp, self.path)
+            self._loaded_stamp = self._stamp()
+
+    # ═══════════════════════════════════════════
+    # INCREMENTAL UPDATE
+    # ═══════════════════════════════════════════
+
+    def _add_tickers(self, tickers):
+        new = [t for t in tickers if t not in self._index]
+        if not new:
+            return
+        n = len(new)
+        for f in STATE_FIELDS:
+            pad = np.zeros(n) if f == 'count' else np.full(n, np.nan)
+            self.state[f] = np.concatenate([self.state[f], pad])
+        self.atr_hist = np.hstack([self.atr_hist, np.full((ATR_LOOKBACK, n), np.nan)])
+        self.close_hist = np.hstack([self.close_hist, np.full((HIGH_LOOKBACK, n), np.nan)])
+        for t in new:
+            self._index[t] = len(self.tickers)
+            self.tickers.append(t)
+
+    def _reset(self, cols):
+        for f in STATE_FIELDS:
+            self.state[f][cols] = 0 if f == 'count' else np.nan
+        self.atr_hist[:, cols] = np.nan
+        self.close_hist[:, cols] = np.nan
+
+    def _step(self, high, low, close, volume):
+        """Advance every slot with a finite close by one session"""
+        s = self.state
+        m = np.isfinite(close)
+        prev = s['close']
+
+        # True range — first bar has no previous close, so TR = high - low
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+        atr = s['atr14']
+        new_atr = np.where(np.isnan(atr), tr, atr + (tr - atr) / ATR_PERIOD)  # Wilder's RMA
+        s['atr14'] = np.where(m & np.isfinite(tr), new_atr, atr)
+
+        for span in EMA_SPANS:
+            ema = s[f'ema{span}']
+            alpha = 2 / (span + 1)
+            s[f'ema{span}'] = np.where(m, np.where(np.isnan(ema), close, ema + alpha * (close - ema)), ema)
+
+        self.atr_hist[:-1, m] = self.atr_hist[1:, m]
+        self.atr_hist[-1, m] = s['atr14'][m]
+        self.close_hist[:-1, m] = self.close_hist[1:, m]
+        self.close_hist[-1, m] = close[m]
+
+        s['prev_close'] = np.where(m, prev, s['prev_close'])
+        s['close'] = np.where(m, close, prev)
+        s['volume'] = np.where(m, volume, s['volume'])
+        s['count'] = s['count'] + m
+
+    def update(self, cache, through=None):
+        """
+        Advance the snapshot to the last completed session in `cache`.
+        New symbols and symbols whose cached history was re-adjusted are
+        rebuilt from the full cached history; everyone else only steps
+        through the sessions after `as_of`.
+        """
+        through = through if through is not None else last_completed_session()
+        # Read-modify-write under the exclusive file lock, starting from the newest
+        # saved state and bars (another process may have advanced either)
+        cache.reload_if_changed()
+        with bar_cache.file_lock(self._lock_path), cache._lock, self._lock:
+            self._reload_if_changed()
+            dates = cache.dates
+            cols = {f: cache.columns[f] for f in bar_cache.FIELDS}
+            self._add_tickers(cache.tickers)
+            slots = np.array([self._index[t] for t in cache.tickers], dtype=int)
+            if not len(dates) or not len(slots):
+                return 0
+
+            rebuild = self.state['count'][slots] == 0
+            start = 0
+            if self.as_of is not None:
+                start = int(np.searchsorted(dates, self.as_of, side='right'))
+                row = start - 1
+                if row >= 0 and dates[row] == self.as_of:
+                    cached = cols['close'][row]
+                    stored = self.state['close'][slots]
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        moved = np.abs(cached - stored) / stored > READJUST_TOLERANCE
+                    rebuild |= moved
+            else:
+                rebuild[:] = True
+            end = int(np.searchsorted(dates, through, side='right'))
+
+            if rebuild.any():
+                self._reset(slots[rebuild])
+            first = 0 if rebuild.any() else start
+            n = len(self.tickers)
+            for r in range(first, end):
+                active = rebuild if r < start else np.ones(len(slots), dtype=bool)
+                if not active.any():
+                    continue
+                bar = {}
+                for f in ('high', 'low', 'close', 'volume'):
+                    full = np.full(n, np.nan)
+                    full[slots[active]] = cols[f][r, active]
+                    bar[f] = full
+                self._step(bar['high'], bar['low'], bar['close'], bar['volume'])
+
+            stepped = max(end - start, 0)
+            if end > 0:
+                self.as_of = max(dates[end - 1], self.as_of) if self.as_of is not None else dates[end - 1]
+            self.updated_at = time.time()
+            self._write()
+
+        logger.info(f"Indicator snapshot updated to {self.as_of}: {stepped} new sessions, "
+                    f"{int(rebuild.sum())} symbols rebuilt")
+        return stepped
+
+    # ═══════════════════════════════════════════
+    # READ
+    # ═══════════════════════════════════════════
+
+    def is_current(self):
+        return self.as_of is not None and self.as_of >= last_completed_session()
+
+    def columns(self, tickers=None):
+        """
+        Indicator columns for `tickers` (default: all), as equal-length arrays.
+        Returns (tickers_present, {name: np.ndarray}).
+        """
+        with self._lock:
+            if tickers is None:
+                present = list(self.tickers)
+            else:
+                present = [t for t in tickers if t in self._index]
+            idx = np.array([self._index[t] for t in present], dtype=int)
+            s = {f: self.state[f][idx] for f in STATE_FIELDS}
+            count = s['count']
+            atr_10d_ago = np.where(count > ATR_LOOKBACK, self.atr_hist[0, idx], s['atr14'] + 1)
+            window = self.close_hist[:, idx]
+            high_52w = np.max(np.where(np.isnan(window), -np.inf, window), axis=0) if len(idx) else np.empty(0)
+
+        close, prev_close, volume = s['close'], s['prev_close'], s['volume']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change_pct = np.where(prev_close > 0, (close - prev_close) / prev_close * 100, 0.0)
+            atr_ratio = np.where(close > 0, s['atr14'] / close, 0.0)
+            pct_from_52w = np.where(high_52w > 0, close / high_52w * 100, 0.0)
+
+        return present, {
+            "close": close,
+            "prev_close": prev_close,
+            "volume": volume,
+            "change_pct": change_pct,
+            "atr14": s['atr14'],
+            "atr14_10d_ago": atr_10d_ago,
+            "atr_ratio": atr_ratio,
+            "ema50": s['ema50'],
+            "ema150": s['ema150'],
+            "ema200": s['ema200'],
+            "high_52w": high_52w,
+            "pct_from_52w": pct_from_52w,
+            "listing_days": count,
+            "turnover": close * volume,
+        }
+
+
+# ── Process-wide snapshot instance ──
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Return the shared IndicatorSnapshot (loaded from disk on first use)"""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = IndicatorSnapshot()
+        return _snapshot
+
+
+def run_eod_update():
+    """Post-close job: refresh the daily bar cache for the universe, then advance the snapshot"""
+    from scanner import load_stock_universe
+
+    tickers = []
+    for stock in load_stock_universe():
+        sym = stock.get("symbol", "").replace("-EQ", "")
+        if sym:
+            tickers.append(f"{sym}.NS")
+
+    cache = bar_cache.get_cache()
+    failed = cache.refresh(tickers)
+    stepped = get_snapshot().update(cache)
+    logger.info(f"EOD indicator update done: {len(tickers)} tickers, {failed} download failures, {stepped} sessions applied")
+
+
+def _seconds_until_next_run(run_at=datetime.time(16, 0)):
+    """Until `run_at` on the next trading day (today's if it has not passed yet)"""
+    now = market_clock.ist_now()
+    clock = market_clock.get_clock()
+    day = now.date()
+    if now.time() >= run_at or not clock.is_trading_day(day):
+        day = clock.next_trading_day(day)
+    return (datetime.datetime.combine(day, run_at) - now).total_seconds()
+
+
+if __name__ == "__main__":
+    logger.info("Starting EOD indicator snapshot job...")
+    while True:
+        try:
+            run_eod_update()
+        except Exception as e:
+            logger.error(f"EOD indicator update failed: {e}")
+        wait = _seconds_until_next_run()
+        logger.info(f"Sleeping {wait / 3600:.1f}h until next post-close run...")
+        time.sleep(wait)
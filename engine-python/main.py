@@ -1,7 +1,9 @@
 from dotenv import load_dotenv
 load_dotenv()  # Load .env before anything else reads os.getenv()
 
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import hmac
 import hashlib
@@ -41,6 +43,14 @@ def health_check():
     return {"status": "active", "engine": "python-v1"}
 
 import session_manager
+import trade_outbox
+import compute_pool
+import backtest_runner
+
+@app.on_event("startup")
+def resume_trade_outbox():
+    """Start the outbox sender so trades left undelivered by a previous run are retried"""
+    trade_outbox.get_outbox()
 
 @app.post("/engine/start")
 def start_engine(request: StrategyStartRequest):
@@ -70,20 +80,35 @@ def stop_engine(data: dict):
 
 @app.post("/backtest")
 def run_backtest(data: dict):
-    import importlib
-    import backtest_runner
-    importlib.reload(backtest_runner)
-    results = backtest_runner.login_and_run_backtest(data)
+    # Broker calls stay in the engine (shared login and rate limits); the
+    # strategy runs in the niced compute pool, off the live trading interpreter
+    fetched = backtest_runner.fetch_backtest_data(data)
+    try:
+        results = compute_pool.get_pool().run("backtest", compute_pool.run_backtest_job, data, fetched)
+    except compute_pool.ComputePoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return {
         "status": "success",
         "results": results
     }
 
 @app.get("/engine/status/{user_id}")
-def get_status(user_id: str):
+def get_status(user_id: str, since: int = None, compact: bool = False, version: str = None,
+               if_none_match: str = Header(None)):
+    """
+    Session state. `since` (the previous `log_cursor`) returns only new log lines;
+    `compact` drops config and history. Unchanged state answers 304 to a matching
+    If-None-Match, or {"unchanged": true} when the previous `version` is passed.
+    """
     session = session_manager.get_session(user_id)
     if session:
-        return session.get_state()
+        etag = session.state_etag(since, compact)
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        if version == etag:
+            return {"unchanged": True, "version": etag}
+        state = session.get_state(since=since, compact=compact)
+        return JSONResponse(content=jsonable_encoder(state), headers={"ETag": state["version"]})
     
     # Return empty/stopped state if no session exists
     return {
@@ -91,28 +116,101 @@ def get_status(user_id: str):
         "pnl": 0.0, 
         "positions": [], 
         "trades_history": [],
-        "logs": []
+        "logs": [],
+        "log_cursor": 0
     }
 
+@app.get("/engine/http_metrics")
+def http_metrics():
+    """Outbound HTTP stats per call class (requests, errors, latency, connection reuse)"""
+    import http_client
+    return {"status": "success", "classes": http_client.metrics()}
+
+@app.get("/engine/prices")
+def prices(tokens: str = ""):
+    """Rows from the shared price table for comma-separated instrument tokens"""
+    import price_table
+    table = price_table.get_table()
+    return {"status": "success", "table": table.stats(),
+            "prices": {t: table.read(t) for t in tokens.split(",") if t}}
+
+@app.get("/engine/compute_metrics")
+def compute_metrics():
+    """Backtest/scan pool: running and queued jobs, queue wait and run time per job kind"""
+    return {"status": "success", "pool": compute_pool.get_pool().metrics()}
+
+@app.get("/engine/preopen")
+def preopen_status():
+    """Pre-open warm-up scheduler: next window, pending sessions, warm-up timings"""
+    import preopen_scheduler
+    return {"status": "success", "preopen": preopen_scheduler.get_scheduler().status()}
+
+@app.get("/engine/loop_metrics")
+def loop_metrics():
+    """Engine event loop: task count, blocking calls in flight, process thread count"""
+    import engine_loop
+    return {"status": "success", "loop": engine_loop.get_engine().stats()}
+
+@app.get("/engine/broker_metrics")
+def broker_metrics():
+    """SmartAPI queue wait per priority lane and endpoint class"""
+    import broker_gateway
+    return {"status": "success", "lanes": broker_gateway.get_gateway().metrics()}
+
+@app.get("/engine/paper_matching")
+def paper_matching_stats():
+    """Shared PAPER TP/SL trigger book: tokens, registered positions, fills, stale entries skipped"""
+    import paper_matching
+    return {"status": "success", "book": paper_matching.get_book().stats()}
+
+@app.post("/engine/kill_switch")
+def kill_switch(data: dict = None):
+    """
+    Admin kill switch: stop every session (no new entries), then exit all open
+    positions concurrently. Returns per-position exit latency.
+    """
+    import square_off
+    data = data or {}
+    if data.get("stop_sessions", True):
+        for session in list(session_manager.sessions.values()):
+            if session.active:
+                session.stop()
+    squarer = square_off.start_square_off(lambda: list(session_manager.sessions.values()))
+    return {"status": "success", "report": squarer.kill_switch(data.get("reason") or "KILL_SWITCH")}
+
+@app.get("/engine/square_off")
+def square_off_status():
+    """Scheduled square-off / kill switch: last run report with per-position exit latency"""
+    import square_off
+    squarer = square_off.get_square_off()
+    return {"status": "success", "square_off": squarer.status() if squarer else None}
+
 @app.get("/engine/all_sessions")
-def get_all_sessions():
-    """Return trades and status from ALL active sessions (for admin panel)"""
-    result = []
-    for user_id, session in session_manager.sessions.items():
-        try:
-            state = session.get_state()
-            # Include both open positions and closed trades
-            for trade in state.get('trades_history', []):
-                trade['user_id'] = user_id
-                trade['session_mode'] = state.get('mode', 'PAPER')
-                result.append(trade)
-            for pos in state.get('positions', []):
-                pos['user_id'] = user_id
-                pos['session_mode'] = state.get('mode', 'PAPER')
-                result.append(pos)
-        except Exception as e:
-            print(f"Error getting state for user {user_id}: {e}")
-    return {"sessions": list(session_manager.sessions.keys()), "trades": result}
+def get_all_sessions(offset: int = 0, limit: int = None, mode: str = None, strategy: str = None,
+                     user_id: str = None, status: str = None):
+    """
+    Trades from ALL sessions (for admin panel), served from the maintained trade index.
+    Optional pagination (offset/limit) and filters: mode (PAPER/LIVE), strategy, user_id,
+    status (OPEN/CLOSED). Without parameters every trade is returned, as before.
+    """
+    import trade_index
+    index = trade_index.get_index()
+    total, trades = index.query(
+        status=status.upper() if status else None,
+        offset=offset,
+        limit=limit,
+        user_id=user_id,
+        session_mode=mode.upper() if mode else None,
+        strategy=strategy.upper() if strategy else None
+    )
+    return {
+        "sessions": list(session_manager.sessions.keys()),
+        "trades": trades,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "summary": index.summary()
+    }
 
 @app.post("/engine/update_position")
 def update_position(data: dict):
@@ -160,8 +258,7 @@ def execute_test_order(data: dict):
     Bypasses all strategy logic for diagnostic purposes
     """
     try:
-        from SmartApi import SmartConnect
-        import pyotp
+        import broker_sessions
         
         # Extract request data
         symbol = data.get("symbol")
@@ -178,16 +275,13 @@ def execute_test_order(data: dict):
         if not all([api_key, client_code, password, totp_key]):
             raise HTTPException(status_code=400, detail="Missing Angel API credentials")
         
-        smart_api = SmartConnect(api_key=api_key)
-        
-        # Generate TOTP and login
-        totp = pyotp.TOTP(totp_key).now()
-        session_data = smart_api.generateSession(client_code, password, totp)
-        
-        if not session_data or not session_data.get('status'):
+        # Reuse the account's cached broker session (logs in only if needed)
+        try:
+            smart_api = broker_sessions.get_cache().get(credentials).smart_api
+        except broker_sessions.BrokerLoginError as e:
             return {
                 "success": False,
-                "message": f"Login failed: {session_data.get('message', 'Unknown error')}"
+                "message": f"Login failed: {e}"
             }
         
         # Get symbol token
@@ -301,27 +395,31 @@ def list_scanners():
     }
 
 @app.post("/engine/scanner/run")
-def run_scanner(data: dict, background_tasks: BackgroundTasks):
-    """Run a stock scanner"""
+def run_scanner(data: dict):
+    """Run a stock scanner (every scanner is evaluated in the same pass; "all" returns them together)"""
     scanner_id = data.get("scanner_id", "vcp")
-    credentials = data.get("broker_credentials", {})
     sentiment_map = data.get("sentiment_map", {})
     filter_sentiment = data.get("filter_sentiment", False)
     
-    if scanner_id not in scanner_module.SCANNERS:
+    if scanner_id not in scanner_module.SCANNERS and scanner_id != scanner_module.ALL_SCANNERS:
         raise HTTPException(status_code=400, detail=f"Unknown scanner: {scanner_id}")
     
     try:
         # Check if already running to prevent overlap
-        current_progress = scanner_module.get_scan_progress(scanner_id)
-        if current_progress.get("status") == "running":
+        current_progress = scanner_progress(scanner_id)
+        if current_progress.get("status") in ("running", "queued"):
             return {"status": "started", "scanner_id": scanner_id, "message": "Scan already running"}
-            
-        background_tasks.add_task(
-            scanner_module.run_scanner, 
-            scanner_id, credentials, sentiment_map, filter_sentiment
-        )
+        
+        # Fresh cached results need no new pass
+        ids = list(scanner_module.SCANNERS) if scanner_id == scanner_module.ALL_SCANNERS else [scanner_id]
+        if all(scanner_module._cached_results(sid) for sid in ids):
+            return {"status": "started", "scanner_id": scanner_id, "message": "Cached results available"}
+        
+        # The pass runs in the compute pool; results are cached here when it finishes
+        compute_pool.get_pool().submit_scan(scanner_id, sentiment_map, filter_sentiment, scanner_module.store_results)
         return {"status": "started", "scanner_id": scanner_id}
+    except compute_pool.ComputePoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -333,8 +431,13 @@ def scanner_results(scanner_id: str):
 @app.get("/engine/scanner/progress/{scanner_id}")
 def scanner_progress(scanner_id: str):
     """Get progress of a running scan"""
-    return scanner_module.get_scan_progress(scanner_id)
+    return compute_pool.get_pool().progress(scanner_id) or scanner_module.get_scan_progress(scanner_id)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=5002)
+    if int(os.getenv("ENGINE_SHARDS", "1")) > 1:
+        # Multi-process mode: this process becomes the router in front of N engine shards
+        import shard_router
+        shard_router.main()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5002)
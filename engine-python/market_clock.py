@@ -0,0 +1,197 @@
+"""
+MerQPrime Market Clock
+Central IST trading calendar and per-day session schedule for NSE equities.
+
+Each day's schedule (pre-open, open, close, plus any session-specific
+times such as square-off or signal cutoff) is computed once, from the NSE
+holiday calendar, and anchored to time.monotonic(). Per-tick checks are
+then float comparisons instead of re-reading the wall clock, converting to
+IST and re-parsing "HH:MM" strings. The schedule rolls over at IST
+midnight.
+
+Weekends and NSE trading holidays are closed days: standby sessions,
+pre-open warm-ups, backtest data fetches and the EOD snapshot skip them.
+The built-in holiday list follows the NSE circulars for 2025-2026 only.
+NSE_HOLIDAYS_FILE names a JSON list of "YYYY-MM-DD" strings that adds
+later years (and corrections) to the built-in list, and must be updated
+when NSE publishes each year's calendar. It is required when
+ENGINE_ENV=production: the engine refuses to start without it. Elsewhere
+a missing file is only a warning. An unreadable file always stops the
+engine at import; a current or next year without any holiday data is
+logged as an error at start-up and at each year rollover, since its
+holidays would be treated as trading days.
+"""
+
+import os
+import json
+import time
+import datetime
+import threading
+
+from logzero import logger
+
+IST_OFFSET = datetime.timedelta(hours=5, minutes=30)
+PREOPEN = datetime.time(9, 0)
+MARKET_OPEN = datetime.time(9, 15)
+MARKET_CLOSE = datetime.time(15, 30)
+SQUARE_OFF = datetime.time(15, 5)     # Hard intraday safety exit
+PRODUCTION = os.getenv('ENGINE_ENV', '').lower() == 'production'
+
+NSE_HOLIDAYS = {
+    # 2025
+    "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14", "2025-04-18",
+    "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02", "2025-10-21", "2025-10-22",
+    "2025-11-05", "2025-12-25",
+    # 2026
+    "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31", "2026-04-03", "2026-04-14",
+    "2026-05-01", "2026-05-28", "2026-06-26", "2026-09-14", "2026-10-02", "2026-10-20",
+    "2026-11-10", "2026-11-24", "2026-12-25",
+}
+
+
+def _load_holidays():
+    holidays = {datetime.date.fromisoformat(d) for d in NSE_HOLIDAYS}
+    path = os.getenv('NSE_HOLIDAYS_FILE')
+    if path:
+        try:
+            with open(path) as f:
+                holidays |= {datetime.date.fromisoformat(d) for d in json.load(f)}
+        except Exception as e:
+            raise RuntimeError(f"Could not load NSE holidays from NSE_HOLIDAYS_FILE={path}: {e}") from e
+    elif PRODUCTION:
+        raise RuntimeError("NSE_HOLIDAYS_FILE is required with ENGINE_ENV=production")
+    else:
+        logger.warning("NSE_HOLIDAYS_FILE not set: using the built-in NSE holidays only")
+    return holidays
+
+
+def missing_holiday_years(holidays, date):
+    """Of `date`'s year and the next, those without any holiday data (logged as an error)"""
+    covered = {d.year for d in holidays}
+    missing = [year for year in (date.year, date.year + 1) if year not in covered]
+    if missing:
+        logger.error(f"No NSE holiday data for {', '.join(map(str, missing))}: holidays will be treated as "
+                     f"trading days. Add them to the NSE_HOLIDAYS_FILE list.")
+    return missing
+
+
+def ist_now():
+    return datetime.datetime.utcnow() + IST_OFFSET
+
+
+def parse_hhmm(value, default=None):
+    """'HH:MM' config string -> datetime.time (default on empty/invalid)"""
+    try:
+        h, m = map(int, str(value).split(':'))
+        return datetime.time(h, m)
+    except (TypeError, ValueError):
+        return default
+
+
+class DaySchedule:
+    """One IST calendar day with its session times as monotonic instants."""
+
+    def __init__(self, date, trading, midnight_mono):
+        self.date = date
+        self.key = date.isoformat()
+        self.trading = trading
+        self._midnight = midnight_mono
+        self._instants = {}
+        self.end = midnight_mono + 86400
+        self.preopen = self.at(PREOPEN)
+        self.open = self.at(MARKET_OPEN)
+        self.close = self.at(MARKET_CLOSE)
+
+    def at(self, t):
+        """Monotonic instant of wall time `t` (IST) on this day"""
+        instant = self._instants.get(t)
+        if instant is None:
+            instant = self._instants[t] = self._midnight + t.hour * 3600 + t.minute * 60 + t.second
+        return instant
+
+    def time_of(self, mono=None):
+        """IST wall time for a monotonic instant within this day"""
+        seconds = int((mono if mono is not None else time.monotonic()) - self._midnight)
+        seconds = min(max(seconds, 0), 86399)
+        return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+    def is_open(self, mono=None):
+        mono = mono if mono is not None else time.monotonic()
+        return self.trading and self.open <= mono <= self.close
+
+    def in_preopen(self, mono=None):
+        mono = mono if mono is not None else time.monotonic()
+        return self.trading and self.preopen <= mono < self.open
+
+
+class MarketClock:
+    """NSE calendar plus a cached schedule for the current IST day."""
+
+    def __init__(self, holidays=None):
+        self.holidays = holidays if holidays is not None else _load_holidays()
+        self._today = None
+        self._lock = threading.Lock()
+        self._checked_year = None   # Holiday coverage is re-checked when the IST year rolls over
+
+    def is_trading_day(self, date):
+        return date.weekday() < 5 and date not in self.holidays
+
+    def next_trading_day(self, date, include=False):
+        day = date if include else date + datetime.timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += datetime.timedelta(days=1)
+        return day
+
+    def previous_trading_day(self, date, include=False):
+        day = date if include else date - datetime.timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= datetime.timedelta(days=1)
+        return day
+
+    def today(self):
+        """Schedule for the current IST day (recomputed only after IST midnight)"""
+        today = self._today
+        if today is not None and time.monotonic() < today.end:
+            return today
+        with self._lock:
+            if self._today is None or time.monotonic() >= self._today.end:
+                mono, now = time.monotonic(), ist_now()
+                midnight = datetime.datetime.combine(now.date(), datetime.time())
+                if now.year != self._checked_year:
+                    self._checked_year = now.year
+                    missing_holiday_years(self.holidays, now.date())
+                self._today = DaySchedule(now.date(), self.is_trading_day(now.date()),
+                                          mono - (now - midnight).total_seconds())
+            return self._today
+
+    def is_open(self):
+        return self.today().is_open()
+
+    def next_preopen(self, now=None):
+        """Start of the next pre-open window: today's if the market has not opened yet, else the next trading day's"""
+        now = now or ist_now()
+        day = now.date()
+        if now.time() >= MARKET_OPEN or not self.is_trading_day(day):
+            day = self.next_trading_day(day)
+        return datetime.datetime.combine(day, PREOPEN)
+
+    def last_completed_session(self, now=None):
+        """Most recent trading day whose 15:30 IST close has passed"""
+        now = now or ist_now()
+        day = now.date()
+        if now.time() < MARKET_CLOSE:
+            day -= datetime.timedelta(days=1)
+        return self.previous_trading_day(day, include=True)
+
+    def trading_range(self, start, end):
+        """Clamp [start, end] dates to trading days; None if the range has none"""
+        first = self.next_trading_day(start, include=True)
+        last = self.previous_trading_day(end, include=True)
+        return (first, last) if first <= last else None
+
+
+_clock = MarketClock()
+
+
+def get_clock():
+    return _clock
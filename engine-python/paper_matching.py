@@ -0,0 +1,144 @@
+"""
+MerQPrime Paper Matching Engine
+Process-wide TP/SL trigger book for PAPER positions of every session.
+
+Paper TP/SL used to be checked by looping over each session's positions
+on every tick of the symbol, so thousands of paper users on the same
+liquid names repeated identical comparisons per tick. Now each open paper
+position registers its two exit levels once, per instrument token, in two
+heaps: levels that fire when the price rises to them (BUY target, SELL
+stop) and levels that fire when it falls to them (BUY stop, SELL target).
+A tick peeks at the heap tops and pops only the crossed levels, so its
+cost depends on the fills, not on how many positions are open.
+
+Deletion is lazy: a closed, re-levelled or abandoned position just retires
+its registration, and stale heap entries are skipped when they surface
+(the book is compacted once they outnumber the live ones). Unrealized P&L
+of paper positions is computed when state is read, not on every tick.
+
+Usage:
+    book = paper_matching.get_book()
+    book.add(session, pos, token)                     # on a paper fill / TP-SL edit
+    for session, pos, reason in book.on_tick(token, ltp):
+        ...                                           # hand to the owning session to close
+"""
+
+import heapq
+import threading
+import itertools
+
+UP, DOWN = 0, 1   # Fires when the price rises to / falls to the level
+
+
+def marked_pnl(pos, ltp):
+    """Unrealized P&L of an open position at `ltp` (paper positions are marked on read)"""
+    return (ltp - pos['entry']) * pos['qty'] if pos['type'] == 'BUY' else (pos['entry'] - ltp) * pos['qty']
+
+
+class _TokenBook:
+    __slots__ = ("heaps", "stale")
+
+    def __init__(self):
+        self.heaps = ([], [])   # UP: min-heap of level; DOWN: min-heap of -level
+        self.stale = 0
+
+
+class PaperMatchingEngine:
+    """Per-token trigger heaps with lazy deletion."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._books = {}           # token -> _TokenBook
+        self._live = {}            # id(pos) -> registration seq
+        self._seq = itertools.count()
+        self.ticks = 0
+        self.fills = 0
+        self.stale_skipped = 0
+
+    @staticmethod
+    def _levels(pos):
+        """(side, level, reason) for both exits of a position"""
+        if pos['type'] == 'BUY':
+            return (UP, pos['tp'], "TARGET"), (DOWN, pos['sl'], "SL")
+        return (DOWN, pos['tp'], "TARGET"), (UP, pos['sl'], "SL")
+
+    def add(self, session, pos, token):
+        """Register (or re-register after a TP/SL change) an open paper position"""
+        token = str(token)
+        with self._lock:
+            book = self._books.get(token)
+            if book is None:
+                book = self._books[token] = _TokenBook()
+            if id(pos) in self._live:
+                book.stale += 2   # The previous registration's two entries
+            seq = self._live[id(pos)] = next(self._seq)
+            for side, level, reason in self._levels(pos):
+                key = float(level) if side == UP else -float(level)
+                heapq.heappush(book.heaps[side], (key, seq, session, pos, reason))
+
+    def remove(self, pos, token):
+        """Retire a position's triggers (closed elsewhere); heap entries go lazily"""
+        with self._lock:
+            if self._live.pop(id(pos), None) is not None:
+                book = self._books.get(str(token))
+                if book is not None:
+                    book.stale += 2
+                    self._maybe_compact(book)
+
+    def _is_live(self, seq, session, pos):
+        return self._live.get(id(pos)) == seq and pos['status'] == 'OPEN' and session.active
+
+    def on_tick(self, token, ltp):
+        """Pop the levels `ltp` crossed; returns [(session, pos, reason)] to close"""
+        book = self._books.get(str(token))
+        if book is None:
+            return []
+        up, down = book.heaps
+        fills = []
+        with self._lock:
+            # Peek under the lock: another socket's pops or a compaction may empty a heap
+            if not ((up and up[0][0] <= ltp) or (down and down[0][0] <= -ltp)):
+                return []
+            self.ticks += 1
+            for heap, crossed in ((up, lambda key: key <= ltp), (down, lambda key: key <= -ltp)):
+                while heap and crossed(heap[0][0]):
+                    _, seq, session, pos, reason = heapq.heappop(heap)
+                    if not self._is_live(seq, session, pos):
+                        if self._live.get(id(pos)) == seq:
+                            del self._live[id(pos)]   # Closed elsewhere or session stopped
+                        self.stale_skipped += 1
+                        book.stale = max(book.stale - 1, 0)
+                        continue
+                    del self._live[id(pos)]   # The other leg is now stale
+                    book.stale += 1
+                    fills.append((session, pos, reason))
+            self.fills += len(fills)
+            self._maybe_compact(book)
+        return fills
+
+    def _maybe_compact(self, book):
+        """Drop stale entries once they outnumber live ones"""
+        if book.stale <= len(book.heaps[UP]) + len(book.heaps[DOWN]) - book.stale:
+            return
+        for heap in book.heaps:
+            heap[:] = [e for e in heap if self._is_live(e[1], e[2], e[3])]
+            heapq.heapify(heap)
+        book.stale = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens": len(self._books),
+                "positions": len(self._live),
+                "entries": sum(len(b.heaps[UP]) + len(b.heaps[DOWN]) for b in self._books.values()),
+                "ticks_matched": self.ticks,
+                "fills": self.fills,
+                "stale_skipped": self.stale_skipped,
+            }
+
+
+_book = PaperMatchingEngine()
+
+
+def get_book():
+    return _book
@@ -0,0 +1,92 @@
+"""
+MerQPrime Pre-Open Scheduler
+Warms up sessions that are waiting for the market during the pre-open
+window (09:00-09:14 IST) so they are live on the first tick at 09:15.
+
+Standby sessions used to poll every 30s and do the websocket connect,
+subscription and strategy warm-up only once the market had opened, so the
+whole startup cost of every pending session landed on the busiest moment
+of the day. Now each pending session waits on the engine loop for the
+pre-open window, then warms up (fresh broker login, missing instruments,
+strategy history, websocket subscription) with bounded parallelism; the
+per-account broker gateway keeps the SmartAPI calls within rate limits.
+"""
+
+import os
+import time
+import asyncio
+
+import market_clock
+from market_clock import ist_now
+
+WARMUP_CONCURRENCY = int(os.getenv('PREOPEN_WARMUP_CONCURRENCY', '8'))
+
+
+def next_preopen(now=None):
+    """Start of the next pre-open window, skipping weekends and NSE holidays"""
+    return market_clock.get_clock().next_preopen(now)
+
+
+class PreOpenScheduler:
+    """Holds pending sessions until pre-open, then warms them up in bounded parallel."""
+
+    def __init__(self, concurrency=WARMUP_CONCURRENCY):
+        self.concurrency = concurrency
+        self._semaphore = None
+        self.pending = {}          # user_id -> scheduled warm-up (IST)
+        self.warmed = 0
+        self.failed = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_finished = None
+
+    async def warm(self, session):
+        """Wait for the pre-open window, then run the session's warm-up; True on success"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        start_at = next_preopen()
+        self.pending[session.user_id] = start_at
+        try:
+            delay = (start_at - ist_now()).total_seconds()
+            if delay > 0:
+                session.log(f"🌅 Pre-open warm-up scheduled for {start_at.strftime('%a %d %b %H:%M')} IST", "INFO")
+                await asyncio.sleep(delay)
+
+            async with self._semaphore:
+                started = time.monotonic()
+                try:
+                    ok = await session._pre_open_warm_up()
+                except Exception as e:
+                    session.log(f"Pre-open warm-up failed: {e}", "ERROR")
+                    ok = False
+                elapsed_ms = (time.monotonic() - started) * 1000
+
+            if ok:
+                self.warmed += 1
+                self.total_ms += elapsed_ms
+                self.max_ms = max(self.max_ms, elapsed_ms)
+            else:
+                self.failed += 1
+            self.last_finished = ist_now().strftime("%Y-%m-%d %H:%M:%S")
+            return ok
+        finally:
+            self.pending.pop(session.user_id, None)
+
+    def status(self):
+        return {
+            "next_preopen": next_preopen().strftime("%Y-%m-%d %H:%M"),
+            "pending": len(self.pending),
+            "concurrency": self.concurrency,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "avg_warmup_ms": round(self.total_ms / self.warmed, 1) if self.warmed else 0.0,
+            "max_warmup_ms": round(self.max_ms, 1),
+            "last_finished": self.last_finished,
+        }
+
+
+_scheduler = PreOpenScheduler()
+
+
+def get_scheduler():
+    return _scheduler
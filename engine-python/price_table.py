@@ -0,0 +1,208 @@
+"""
+MerQPrime Shared Price Table
+Last-price table for every subscribed instrument, held in
+multiprocessing.shared_memory and indexed by a dense slot per token.
+
+Sessions used to keep their own ltp caches, so a liquid symbol traded by
+500 users was stored (and serialized for status) 500 times. Now the
+engine's feed writes each tick once here and sessions, the status endpoint
+and other processes (shards, workers) read it in place. The table holds
+the latest price only: each session keeps its own previous LTP for
+crossover detection, since its socket sees ticks in its own order.
+
+Layout (one shared block):
+    header  int64[4]             magic, capacity, slots used, -
+    tokens  int64[capacity]      instrument token per slot
+    seq     uint64[capacity]     per-slot seqlock (odd while a write is in progress)
+    values  float64[capacity,5]  LTP, PREV_LTP (table's prior value), VWAP, VOLUME, EXCH_TS
+
+There is a single writer per table (the engine process owning the feed;
+its websocket threads serialize on a process-local lock). Readers never
+lock: they retry a slot read until the sequence number is even and
+unchanged across the read.
+
+Usage:
+    table = price_table.get_table()                   # writer, in the engine
+    table.update(token, ltp, vwap, volume, exch_ts)
+    reader = price_table.PriceTable.attach(table.name)  # any process
+    reader.read(token)  # {"ltp", "prev_ltp", "vwap", "volume", "exch_ts"}
+"""
+
+import os
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+from logzero import logger
+
+MAGIC = 0x4D5150524943   # "MQPRIC"
+CAPACITY = int(os.getenv('PRICE_TABLE_SLOTS', '8192'))
+SHARD_ID = os.getenv('ENGINE_SHARD_ID')
+TABLE_NAME = os.getenv('PRICE_TABLE_NAME', 'merq_prices') + (f'_{SHARD_ID}' if SHARD_ID else '')
+
+LTP, PREV_LTP, VWAP, VOLUME, EXCH_TS = range(5)
+COLUMNS = ("ltp", "prev_ltp", "vwap", "volume", "exch_ts")
+HEADER_SLOTS = 4
+
+
+def _size(capacity):
+    return 8 * (HEADER_SLOTS + capacity * (2 + len(COLUMNS)))
+
+
+class PriceTable:
+    """Seqlock-protected per-instrument price rows in shared memory."""
+
+    def __init__(self, shm, writer):
+        self.shm = shm
+        self.name = shm.name
+        self.writer = writer
+        buf = shm.buf
+        self._header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=buf)
+        capacity = self.capacity = int(self._header[1])
+        offset = 8 * HEADER_SLOTS
+        self._tokens = np.ndarray((capacity,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += 8 * capacity
+        self._seq = np.ndarray((capacity,), dtype=np.uint64, buffer=buf, offset=offset)
+        offset += 8 * capacity
+        self._values = np.ndarray((capacity, len(COLUMNS)), dtype=np.float64, buffer=buf, offset=offset)
+        self._slots = {}                 # token -> slot (process-local view of the token directory)
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, name=TABLE_NAME, capacity=CAPACITY):
+        """Create (or recreate, dropping a stale block from a previous run) the writer's table"""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_size(capacity))
+        np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)[:] = (MAGIC, capacity, 0, 0)
+        table = cls(shm, writer=True)
+        table._seq[:] = 0
+        table._values[:] = 0.0
+        return table
+
+    @classmethod
+    def attach(cls, name=TABLE_NAME):
+        """Read-only view of a table created by another process"""
+        shm = shared_memory.SharedMemory(name=name)
+        # The creator owns the block; keep this process's tracker from unlinking it at exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        if int(np.ndarray((1,), dtype=np.int64, buffer=shm.buf)[0]) != MAGIC:
+            shm.close()
+            raise ValueError(f"Shared memory block {name} is not a price table")
+        return cls(shm, writer=False)
+
+    # ═══════════════════════════════════════════
+    # TOKEN DIRECTORY
+    # ═══════════════════════════════════════════
+
+    def _slot(self, token, create=False):
+        try:
+            key = int(token)
+        except (TypeError, ValueError):
+            return None
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        # Pick up slots the writer added since we last looked
+        used = int(self._header[2])
+        for i in range(len(self._slots), used):
+            self._slots[int(self._tokens[i])] = i
+        slot = self._slots.get(key)
+        if slot is None and create:
+            if used >= self.capacity:
+                logger.error(f"Price table full ({self.capacity} slots); token {token} not stored")
+                return None
+            slot = used
+            self._tokens[slot] = key
+            self._header[2] = used + 1   # Publish after the token is in place
+            self._slots[key] = slot
+        return slot
+
+    # ═══════════════════════════════════════════
+    # WRITE / READ
+    # ═══════════════════════════════════════════
+
+    @staticmethod
+    def _is_stale(row, exch_ts, volume):
+        """
+        Tick already stored or older than the stored one. Several sessions'
+        sockets deliver the same feed with different lag, so order by exchange
+        timestamp, then by cumulative day volume (which only grows) within
+        one timestamp or when the tick carries no timestamp.
+        """
+        if exch_ts:
+            if exch_ts != row[EXCH_TS]:
+                return exch_ts < row[EXCH_TS]
+            return volume <= row[VOLUME]
+        return bool(volume) and volume < row[VOLUME]
+
+    def update(self, token, ltp, vwap=0.0, volume=0.0, exch_ts=0.0):
+        """
+        Store a tick if it is newer than the stored one; returns True if
+        written. The same exchange tick arriving on several sessions'
+        sockets is written once, and a lagging socket never rolls it back.
+        """
+        with self._write_lock:
+            slot = self._slot(token, create=True)
+            if slot is None:
+                return False
+            row = self._values[slot]
+            if self._is_stale(row, exch_ts, volume):
+                return False
+            self._seq[slot] += 1
+            row[PREV_LTP] = row[LTP]
+            row[LTP] = ltp
+            row[VWAP] = vwap
+            row[VOLUME] = volume
+            row[EXCH_TS] = exch_ts
+            self._seq[slot] += 1
+            return True
+
+    def _read_row(self, slot):
+        while True:
+            before = self._seq[slot]
+            if before & 1:
+                continue
+            row = self._values[slot].copy()
+            if self._seq[slot] == before:
+                return row
+
+    def read(self, token):
+        """Consistent snapshot of one instrument's row; None if it never ticked"""
+        slot = self._slot(token)
+        if slot is None:
+            return None
+        row = self._read_row(slot)
+        return dict(zip(COLUMNS, map(float, row))) if row[LTP] else None
+
+    def ltp(self, token, default=None):
+        slot = self._slot(token)
+        if slot is None:
+            return default
+        value = float(self._values[slot, LTP])   # A single aligned float64 read needs no retry
+        return value if value else default
+
+    def stats(self):
+        return {"name": self.name, "capacity": self.capacity, "slots_used": int(self._header[2])}
+
+    def close(self):
+        self.shm.close()
+        if self.writer:
+            self.shm.unlink()
+
+
+# ── Process-wide writer table (created by the engine on first use) ──
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = PriceTable.create()
+        return _table
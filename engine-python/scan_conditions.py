@@ -0,0 +1,188 @@
+"""
+MerQPrime Scanner Condition Engine
+Compiles the declarative `rules` of a scanner definition (see scanner.SCANNERS)
+into vectorized numpy expressions over indicator columns.
+
+Rules are a small, safe subset of Python expressions over column names:
+    atr14 < atr14_10d_ago
+    close > 0 and atr14 / close < 0.08
+    close * volume > 1000000
+
+Supported: numbers, column names, + - * /, unary -, comparisons (chains
+allowed), and / or / not, parentheses. Anything else is rejected at compile
+time. Columns may be scalars, (tickers,) rows or (dates × tickers) matrices —
+numpy broadcasting does the rest.
+"""
+
+import ast
+
+import numpy as np
+
+
+class ConditionError(ValueError):
+    """Raised when a scanner rule cannot be compiled or evaluated."""
+
+
+_BINOPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+
+_CMPOPS = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+# ═══════════════════════════════════════════
+# COMPILER
+# ═══════════════════════════════════════════
+
+def _compile_node(node, source):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        return lambda cols: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+
+        def _column(cols):
+            try:
+                return cols[name]
+            except KeyError:
+                raise ConditionError(f"Unknown column '{name}' in rule '{source}'")
+        return _column
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, source)
+        if isinstance(node.op, ast.USub):
+            return lambda cols: np.negative(operand(cols))
+        if isinstance(node.op, ast.Not):
+            return lambda cols: np.logical_not(operand(cols))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        op = _BINOPS[type(node.op)]
+        left = _compile_node(node.left, source)
+        right = _compile_node(node.right, source)
+        return lambda cols: op(left(cols), right(cols))
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(v, source) for v in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+
+        def _boolop(cols):
+            result = parts[0](cols)
+            for part in parts[1:]:
+                result = combine(result, part(cols))
+            return result
+        return _boolop
+
+    if isinstance(node, ast.Compare) and all(type(op) in _CMPOPS for op in node.ops):
+        operands = [_compile_node(node.left, source)] + [_compile_node(c, source) for c in node.comparators]
+        ops = [_CMPOPS[type(op)] for op in node.ops]
+
+        def _compare(cols):
+            values = [f(cols) for f in operands]
+            result = ops[0](values[0], values[1])
+            for i in range(1, len(ops)):
+                result = np.logical_and(result, ops[i](values[i], values[i + 1]))
+            return result
+        return _compare
+
+    raise ConditionError(f"Unsupported syntax '{ast.dump(node)[:40]}' in rule '{source}'")
+
+
+def compile_rule(source):
+    """Compile one rule string into a function of {column: array} → bool array"""
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ConditionError(f"Invalid rule '{source}': {e.msg}")
+    return _compile_node(tree.body, source)
+
+
+def compile_scanner(spec):
+    """
+    Compile a scanner definition.
+    `rules` pair up with the human-readable `conditions`; `min_history`
+    becomes a leading 'listing_days >= N' rule.
+    """
+    rules = list(spec.get("rules", []))
+    labels = list(spec.get("conditions", []))
+    labels += rules[len(labels):]
+
+    compiled = []
+    if spec.get("min_history"):
+        rule = f"listing_days >= {int(spec['min_history'])}"
+        compiled.append({"label": f"At least {int(spec['min_history'])} sessions of history", "rule": rule, "fn": compile_rule(rule)})
+    for label, rule in zip(labels, rules):
+        compiled.append({"label": label, "rule": rule, "fn": compile_rule(rule)})
+
+    return {
+        "id": spec["id"],
+        "rules": compiled,
+        "outputs": [tuple(o) for o in spec.get("outputs", [])],
+    }
+
+
+# ═══════════════════════════════════════════
+# EVALUATION
+# ═══════════════════════════════════════════
+
+def evaluate(compiled, cols, memo=None):
+    """
+    Evaluate a compiled scanner over indicator columns.
+    `memo` ({rule: result}) lets several scanners share identical rules in one pass.
+    Returns: (mask, stats) with per-condition pass counts and the running funnel.
+    """
+    memo = {} if memo is None else memo
+    mask = None
+    stats = []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for rule in compiled["rules"]:
+            result = memo.get(rule["rule"])
+            if result is None:
+                result = np.asarray(rule["fn"](cols), dtype=bool)
+                memo[rule["rule"]] = result
+            mask = result if mask is None else (mask & result)
+            stats.append({
+                "label": rule["label"],
+                "rule": rule["rule"],
+                "passed": int(np.count_nonzero(result)),
+                "remaining": int(np.count_nonzero(mask)),
+            })
+
+    if mask is None:
+        mask = np.asarray(True)
+    return mask, {
+        "evaluated": int(mask.size),
+        "matched": int(np.count_nonzero(mask)),
+        "conditions": stats,
+    }
+
+
+def evaluate_all(compiled_scanners, cols):
+    """Evaluate every compiled scanner over the same columns in one pass (shared rule results)"""
+    memo = {}
+    return {sid: evaluate(compiled, cols, memo) for sid, compiled in compiled_scanners.items()}
+
+
+def format_outputs(compiled, cols, index=None):
+    """Build the rounded indicator dict for one stock (`index` into column arrays, or scalars)"""
+    out = {}
+    for key, column, digits in compiled["outputs"]:
+        value = cols[column]
+        if index is not None:
+            value = value[index]
+        value = float(value)
+        if digits is None:
+            out[key] = int(value) if np.isfinite(value) else 0
+        else:
+            out[key] = round(value, digits)
+    return out
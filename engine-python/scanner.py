@@ -2,20 +2,27 @@
 MerQPrime Custom Stock Scanner Engine
 Computes ATR, EMA, SMA indicators using pandas/numpy and applies
 VCP (Volatility Contraction Pattern) and IPO Base filter conditions.
+Scanner conditions are declared as `rules` in SCANNERS and compiled by
+scan_conditions into vectorized column expressions.
 """
 
 import pandas as pd
 import yfinance as yf
 import numpy as np
-from SmartApi import SmartConnect
-import pyotp
 import time
 import json
 import os
 from datetime import datetime, timedelta
 from logzero import logger
 
-# ── Cache for scan results (in-memory, 30 min TTL) ──
+import bar_cache
+import broker_sessions
+import broker_gateway
+import indicator_snapshot
+import market_clock
+import scan_conditions
+
+# ── Cache for scan results (in-memory, 30 min TTL, on top of the daily bar cache) ──
 _scan_cache = {}
 CACHE_TTL_SECONDS = 1800  # 30 minutes
 
@@ -35,6 +42,23 @@ SCANNERS = {
             "Close > ₹10 (no penny stocks)",
             "Close × Volume > ₹10,00,000 (liquidity filter)"
         ],
+        "rules": [
+            "atr14 < atr14_10d_ago",
+            "close > 0 and atr_ratio < 0.08",
+            "close > high_52w * 0.75",
+            "ema50 > ema150",
+            "ema150 > ema200",
+            "close > ema50",
+            "close > 10",
+            "close * volume > 1000000"
+        ],
+        "min_history": 210,  # Need at least 210 days for EMA(200)
+        "outputs": [
+            ["close", "close", 2], ["volume", "volume", None], ["change_pct", "change_pct", 2],
+            ["atr_14", "atr14", 2], ["atr_10d_ago", "atr14_10d_ago", 2], ["atr_ratio", "atr_ratio", 4],
+            ["ema50", "ema50", 2], ["ema150", "ema150", 2], ["ema200", "ema200", 2],
+            ["high_52w", "high_52w", 2], ["pct_from_52w", "pct_from_52w", 1], ["turnover", "turnover", 0]
+        ],
         "condition_count": 8,
         "segment": "Cash (NSE Equity)"
     },
@@ -47,11 +71,27 @@ SCANNERS = {
             "Close > ₹50 (no penny stocks)",
             "Volume > 1,00,000 (minimum liquidity)"
         ],
+        "rules": [
+            "listing_days < 400",
+            "close > 50",
+            "volume > 100000"
+        ],
+        "min_history": 50,
+        "outputs": [
+            ["close", "close", 2], ["volume", "volume", None], ["change_pct", "change_pct", 2],
+            ["listing_days", "listing_days", None], ["turnover", "turnover", 0]
+        ],
         "condition_count": 3,
         "segment": "Cash (NSE Equity)"
     }
 }
 
+# Pseudo scanner id: run / fetch every registered scanner in one pass
+ALL_SCANNERS = "all"
+
+# Compiled once at import; new scanners only need an entry in SCANNERS
+COMPILED_SCANNERS = {sid: scan_conditions.compile_scanner(spec) for sid, spec in SCANNERS.items()}
+
 # ── Progress tracking ──
 _scan_progress = {}
 
@@ -61,7 +101,12 @@ def get_scan_progress(scanner_id):
     return _scan_progress.get(scanner_id, {"status": "not_started"})
 
 def get_scan_results(scanner_id):
-    """Get the cached results of a scan"""
+    """Get the cached results of a scan ("all" returns every cached scanner)"""
+    if scanner_id == ALL_SCANNERS:
+        found = {sid: c['data'] for sid, c in _scan_cache.items() if sid in SCANNERS}
+        if found:
+            return {"status": "success", "scanner": ALL_SCANNERS, "scanners": found}
+        return {"status": "error", "message": "Results not found or expired"}
     cached = _scan_cache.get(scanner_id)
     if cached:
         return cached['data']
@@ -102,135 +147,127 @@ def calculate_sma(series, period):
 # SCANNER FILTER FUNCTIONS
 # ═══════════════════════════════════════════
 
-def scan_vcp(df):
+def compute_indicators(df):
     """
-    VCP (Volatility Contraction Pattern) Scanner
+    Indicator columns for one stock's daily frame.
+    Same names as indicator_snapshot columns, so the same compiled rules apply.
+    """
+    close = df['close'].iloc[-1]
+    volume = df['volume'].iloc[-1]
+    prev_close = df['close'].iloc[-2] if len(df) > 1 else close
+    
+    atr = calculate_atr(df, 14)
+    atr_today = atr.iloc[-1]
+    atr_10d_ago = atr.iloc[-11] if len(atr) > 11 else atr_today + 1
+    
+    # 52-week high (252 trading days)
+    # Chartink uses max of weekly close, using daily close max as a close proxy
+    high_52w = df['close'].tail(min(252, len(df))).max()
+    
+    return {
+        "close": close,
+        "prev_close": prev_close,
+        "volume": volume,
+        "change_pct": ((close - prev_close) / prev_close * 100) if prev_close > 0 else 0,
+        "atr14": atr_today,
+        "atr14_10d_ago": atr_10d_ago,
+        "atr_ratio": (atr_today / close) if close > 0 else 0,
+        "ema50": calculate_ema(df['close'], 50).iloc[-1],
+        "ema150": calculate_ema(df['close'], 150).iloc[-1],
+        "ema200": calculate_ema(df['close'], 200).iloc[-1],
+        "high_52w": high_52w,
+        "pct_from_52w": (close / high_52w * 100) if high_52w > 0 else 0,
+        "listing_days": len(df),
+        "turnover": close * volume
+    }
+
+
+def stack_indicators(rows):
+    """Turn a list of compute_indicators() dicts into {column: np.ndarray}"""
+    if not rows:
+        return {}
+    return {k: np.array([r[k] for r in rows], dtype=float) for k in rows[0]}
+
+
+def scan_frame(scanner_id, df, listing_days=None):
+    """
+    Evaluate one scanner's compiled rules against a single daily frame.
     Returns: (match: bool, indicators: dict)
     """
     try:
-        if df is None or len(df) < 210:  # Need at least 210 days for EMA(200)
+        if df is None or len(df) < 2:
             return False, {}
-        
-        close = df['close'].iloc[-1]
-        volume = df['volume'].iloc[-1]
-        prev_close = df['close'].iloc[-2] if len(df) > 1 else close
-        change_pct = ((close - prev_close) / prev_close * 100) if prev_close > 0 else 0
-        
-        # Calculate indicators
-        atr = calculate_atr(df, 14)
-        atr_today = atr.iloc[-1]
-        atr_10d_ago = atr.iloc[-11] if len(atr) > 11 else atr_today + 1
-        
-        ema50 = calculate_ema(df['close'], 50).iloc[-1]
-        ema150 = calculate_ema(df['close'], 150).iloc[-1]
-        ema200 = calculate_ema(df['close'], 200).iloc[-1]
-        
-        # 52-week high (252 trading days)
-        lookback = min(252, len(df))
-        # Chartink uses max of weekly close, using daily close max as a close proxy
-        high_52w = df['close'].tail(lookback).max()
-        
-        indicators = {
-            "close": round(close, 2),
-            "volume": int(volume),
-            "change_pct": round(change_pct, 2),
-            "atr_14": round(atr_today, 2),
-            "atr_10d_ago": round(atr_10d_ago, 2),
-            "atr_ratio": round(atr_today / close, 4) if close > 0 else 0,
-            "ema50": round(ema50, 2),
-            "ema150": round(ema150, 2),
-            "ema200": round(ema200, 2),
-            "high_52w": round(high_52w, 2),
-            "pct_from_52w": round((close / high_52w * 100), 1) if high_52w > 0 else 0,
-            "turnover": round(close * volume, 0)
-        }
-        
-        # ── Apply 8 VCP Conditions ──
-        
-        # 1. ATR contracting: today's ATR < 10 days ago ATR
-        if atr_today >= atr_10d_ago:
-            logger.info(f"VCP Failed 1: ATR {atr_today} >= {atr_10d_ago}")
-            return False, indicators
-        
-        # 2. Tight range: ATR / Close < 0.08
-        if close <= 0 or (atr_today / close) >= 0.08:
-            logger.info(f"VCP Failed 2: ATR/Close {(atr_today/close) if close>0 else 0} >= 0.08")
-            return False, indicators
-        
-        # 3. Near 52-week high: Close > 75% of 52W high
-        if close <= high_52w * 0.75:
-            logger.info(f"VCP Failed 3: Close {close} <= {high_52w * 0.75}")
-            return False, indicators
-        
-        # 4. EMA stack: EMA(50) > EMA(150)
-        if ema50 <= ema150:
-            logger.info(f"VCP Failed 4: EMA50 {ema50} <= EMA150 {ema150}")
-            return False, indicators
-        
-        # 5. EMA stack: EMA(150) > EMA(200)
-        if ema150 <= ema200:
-            logger.info(f"VCP Failed 5: EMA150 {ema150} <= EMA200 {ema200}")
-            return False, indicators
-        
-        # 6. Price above short-term: Close > EMA(50)
-        if close <= ema50:
-            logger.info(f"VCP Failed 6: Close {close} <= EMA50 {ema50}")
-            return False, indicators
-        
-        # 7. Min price: Close > 10
-        if close <= 10:
-            return False, indicators
-        
-        # 8. Liquidity: Close × Volume > 10,00,000
-        if (close * volume) <= 1000000:
-            return False, indicators
-        
-        return True, indicators  # ✅ All 8 conditions passed
-        
+        compiled = COMPILED_SCANNERS[scanner_id]
+        cols = compute_indicators(df)
+        if listing_days is not None:
+            cols["listing_days"] = listing_days
+        mask, _ = scan_conditions.evaluate(compiled, cols)
+        return bool(mask), scan_conditions.format_outputs(compiled, cols)
     except Exception as e:
-        logger.error(f"VCP scan error: {e}")
+        logger.error(f"{scanner_id} scan error: {e}")
         return False, {}
 
 
+def scan_vcp(df):
+    """
+    VCP (Volatility Contraction Pattern) Scanner
+    Returns: (match: bool, indicators: dict)
+    """
+    return scan_frame("vcp", df)
+
+
 def scan_ipo_base(df, total_days):
     """
     IPO Base Scanner — Recently listed stocks forming a base
     Returns: (match: bool, indicators: dict)
     """
-    try:
-        if df is None or len(df) < 5:
-            return False, {}
-        
-        close = df['close'].iloc[-1]
-        volume = df['volume'].iloc[-1]
-        prev_close = df['close'].iloc[-2] if len(df) > 1 else close
-        change_pct = ((close - prev_close) / prev_close * 100) if prev_close > 0 else 0
-        
-        indicators = {
-            "close": round(close, 2),
-            "volume": int(volume),
-            "change_pct": round(change_pct, 2),
-            "listing_days": total_days,
-            "turnover": round(close * volume, 0)
-        }
-        
-        # 1. Stock listed < 400 trading days
-        if total_days >= 400:
-            return False, indicators
-        
-        # 2. Close > 50
-        if close <= 50:
-            return False, indicators
-        
-        # 3. Volume > 100,000
-        if volume <= 100000:
-            return False, indicators
-        
-        return True, indicators  # ✅ All 3 conditions passed
-        
-    except Exception as e:
-        logger.error(f"IPO Base scan error: {e}")
-        return False, {}
+    return scan_frame("ipo_base", df, listing_days=total_days)
+
+
+def scan_columns(scanner_id, tickers, cols):
+    """
+    Vectorized scan over indicator columns aligned with `tickers`.
+    Returns: (matches: list of (ticker, indicators), stats: dict of per-condition pass counts)
+    """
+    compiled = COMPILED_SCANNERS[scanner_id]
+    if not tickers:
+        return [], {"evaluated": 0, "matched": 0, "conditions": []}
+    mask, stats = scan_conditions.evaluate(compiled, cols)
+    matches = [
+        (tickers[j], scan_conditions.format_outputs(compiled, cols, j))
+        for j in np.flatnonzero(np.broadcast_to(mask, (len(tickers),)))
+    ]
+    return matches, stats
+
+
+def scan_snapshot(scanner_id, snapshot, tickers):
+    """
+    Vectorized scan over the end-of-day indicator snapshot (one row per stock).
+    Returns: (matches: list of (ticker, indicators), stats: dict)
+    """
+    present, cols = snapshot.columns(tickers)
+    return scan_columns(scanner_id, present, cols)
+
+
+def merge_stats(total, stats):
+    """Accumulate per-chunk condition stats into a running total"""
+    if not total:
+        return {**stats, "conditions": [dict(c) for c in stats["conditions"]]}
+    total["evaluated"] += stats["evaluated"]
+    total["matched"] += stats["matched"]
+    for acc, c in zip(total["conditions"], stats["conditions"]):
+        acc["passed"] += c["passed"]
+        acc["remaining"] += c["remaining"]
+    return total
+
+
+def log_stats(scanner_id, stats):
+    """One summary line per condition instead of per-stock failure logs"""
+    if not stats:
+        return
+    logger.info(f"[{scanner_id.upper()}] {stats['matched']}/{stats['evaluated']} matched")
+    for c in stats["conditions"]:
+        logger.info(f"[{scanner_id.upper()}]   {c['rule']:<36} passed={c['passed']:<5} remaining={c['remaining']}")
 
 
 # ═══════════════════════════════════════════
@@ -238,36 +275,9 @@ def scan_ipo_base(df, total_days):
 # ═══════════════════════════════════════════
 
 def login_smart_api(credentials):
-    """Login to Angel One SmartAPI and return the session"""
+    """Return a logged-in SmartAPI client from the shared broker session cache"""
     try:
-        api_key = credentials.get("api_key") or credentials.get("apiKey")
-        client_code = credentials.get("client_code") or credentials.get("clientCode")
-        password = credentials.get("password")
-        totp_key = credentials.get("totp")
-        access_token = credentials.get("access_token")
-        
-        if not api_key or not client_code:
-            raise ValueError("Missing API key or Client Code")
-            
-        smart_api = SmartConnect(api_key=api_key)
-        
-        if access_token:
-            smart_api.access_token = access_token
-            logger.info("Using OAuth access token for scanner")
-            return smart_api
-            
-        if not all([password, totp_key]):
-            raise ValueError("Missing broker credentials (password/totp or access_token)")
-            
-        totp = pyotp.TOTP(totp_key).now()
-        session_data = smart_api.generateSession(client_code, password, totp)
-        
-        if not session_data.get('status'):
-            raise ValueError(f"Login failed: {session_data.get('message', 'Unknown error')}")
-        
-        logger.info("SmartAPI login successful for scanner")
-        return smart_api
-        
+        return broker_gateway.in_lane(broker_sessions.get_cache().get(credentials).smart_api, broker_gateway.BULK)
     except Exception as e:
         logger.error(f"SmartAPI login failed: {e}")
         raise
@@ -378,35 +388,85 @@ def load_stock_universe():
 
 
 
+def _cached_results(scanner_id):
+    cached = _scan_cache.get(scanner_id)
+    if cached and time.time() - cached['timestamp'] < CACHE_TTL_SECONDS:
+        return cached['data']
+    return None
+
+
 def run_scanner(scanner_id, broker_credentials, sentiment_map={}, filter_sentiment=False):
-    """Execute scan over entire universe using yfinance bulk download (Chunked)"""
-    global _scan_cache, _scan_progress
+    """
+    Execute a scan over the entire universe.
+    The data load dominates the cost, so every registered scanner is evaluated
+    in the same pass and cached separately; `scanner_id="all"` returns them all.
+    """
+    if scanner_id == ALL_SCANNERS:
+        return run_all_scanners(broker_credentials, sentiment_map, filter_sentiment)
     
     # Check cache first
-    cache_key = scanner_id
-    if cache_key in _scan_cache:
-        cached = _scan_cache[cache_key]
-        if time.time() - cached['timestamp'] < CACHE_TTL_SECONDS:
-            logger.info(f"Returning cached results for {scanner_id}")
-            return cached['data']
+    cached = _cached_results(scanner_id)
+    if cached:
+        logger.info(f"Returning cached results for {scanner_id}")
+        return cached
+    
+    return run_scanners(list(SCANNERS), sentiment_map, filter_sentiment, progress_keys=[scanner_id])[scanner_id]
+
+
+def run_all_scanners(broker_credentials, sentiment_map={}, filter_sentiment=False):
+    """Evaluate every registered scanner over one data load; returns {scanner_id: results}"""
+    cached = {sid: _cached_results(sid) for sid in SCANNERS}
+    if all(cached.values()):
+        logger.info("Returning cached results for all scanners")
+        return get_scan_results(ALL_SCANNERS)
+    
+    run_scanners(list(SCANNERS), sentiment_map, filter_sentiment)
+    return get_scan_results(ALL_SCANNERS)
+
+
+def store_results(final):
+    """Cache per-scanner results produced elsewhere (e.g. by a compute pool worker)"""
+    for sid, data in final.items():
+        _scan_cache[sid] = {"timestamp": time.time(), "data": data}
+
+
+def run_scanners(scanner_ids, sentiment_map={}, filter_sentiment=False, progress_keys=None, publish=None):
+    """
+    Single pass over the universe from the local daily bar cache (refreshed
+    incrementally and pipelined via yfinance) or the EOD indicator snapshot.
+    Every scanner in `scanner_ids` is evaluated on the same indicator columns;
+    each result set is cached under its own scanner id. `publish`, if given,
+    receives a copy of the progress dict whenever it changes.
+    """
+    global _scan_cache, _scan_progress
     
     # Load universe
     universe = load_stock_universe()
     total_stocks = len(universe)
     
-    scan_id = f"{scanner_id}_{int(time.time())}"
-    _scan_progress[scanner_id] = {
+    # One progress dict shared by every scanner in the pass (and "all"),
+    # so whichever id the frontend polls sees the same scan
+    progress = {
         "status": "running",
         "current": 0,
         "total": total_stocks,
         "symbol": "Initializing...",
         "matches": 0
     }
+    for key in set(scanner_ids) | set(progress_keys or []) | {ALL_SCANNERS}:
+        _scan_progress[key] = progress
     
-    results = []
+    def _publish():
+        if publish:
+            publish(dict(progress))
+    _publish()
+    
+    results = {sid: [] for sid in scanner_ids}
+    stats = {sid: {} for sid in scanner_ids}
+    compiled = {sid: COMPILED_SCANNERS[sid] for sid in scanner_ids}
     errors = 0
     
-    logger.info(f"Starting {scanner_id} scan on {total_stocks} stocks via yfinance...")
+    logger.info(f"Starting {', '.join(scanner_ids)} scan on {total_stocks} stocks...")
     
     # Prepare tickers
     tickers = []
@@ -419,92 +479,99 @@ def run_scanner(scanner_id, broker_credentials, sentiment_map={}, filter_sentime
         tickers.append(yf_ticker)
         ticker_to_info[yf_ticker] = stock
     
-    days_to_fetch = "2y"
-    batch_size = 50
-    
-    for i in range(0, len(tickers), batch_size):
-        batch_tickers = tickers[i:i+batch_size]
-        
-        try:
-            data = yf.download(batch_tickers, period=days_to_fetch, group_by="ticker", threads=True, progress=False)
-        except Exception as e:
-            logger.error(f"yfinance download failed for batch {i}: {e}")
-            errors += len(batch_tickers)
-            continue
-            
-        for j, yf_ticker in enumerate(batch_tickers):
-            try:
-                stock_info = ticker_to_info[yf_ticker]
+    def _evaluate(present, cols):
+        """Run all scanners over one block of indicator columns"""
+        if not present:
+            return
+        for sid, (mask, block_stats) in scan_conditions.evaluate_all(compiled, cols).items():
+            stats[sid] = merge_stats(stats[sid], block_stats)
+            for j in np.flatnonzero(np.broadcast_to(mask, (len(present),))):
+                stock_info = ticker_to_info[present[j]]
                 symbol = stock_info.get('symbol', '').replace('-EQ', '')
-                name = stock_info.get('name', symbol)
-                
-                # Update progress
-                current_idx = i + j + 1
-                _scan_progress[scanner_id] = {
-                    "status": "running",
-                    "current": current_idx,
-                    "total": total_stocks,
+                sentiment = sentiment_map.get(symbol, 0.0)
+                if filter_sentiment and sentiment < 0.05:
+                    continue
+                results[sid].append({
+                    "sr": len(results[sid]) + 1,
                     "symbol": symbol,
-                    "matches": len(results)
-                }
-                
-                if len(batch_tickers) == 1:
-                    df = data
-                else:
-                    if yf_ticker not in data:
+                    "name": stock_info.get('name', symbol),
+                    "sentiment": sentiment,
+                    **scan_conditions.format_outputs(compiled[sid], cols, j)
+                })
+                logger.info(f"[{sid.upper()}] MATCH: {symbol}")
+        progress["matches"] = sum(len(r) for r in results.values())
+        _publish()
+    
+    # Fast path: filter the end-of-day indicator snapshot when it is up to date.
+    # EOD scans only: while the market is open it would miss today's bars.
+    snapshot = indicator_snapshot.get_snapshot()
+    pending = tickers
+    processed = 0
+    if snapshot.is_current() and not market_clock.get_clock().is_open():
+        logger.info(f"Scanning indicator snapshot as of {snapshot.as_of}")
+        present, cols = snapshot.columns(tickers)
+        _evaluate(present, cols)
+        in_snapshot = set(present)
+        pending = [t for t in tickers if t not in in_snapshot]
+        processed = len(present)
+        if pending:
+            logger.warning(f"{len(pending)} tickers missing from the indicator snapshot; scanning them from the bar cache")
+        progress.update({"current": processed, "symbol": "Snapshot"})
+        _publish()
+    
+    if pending:
+        # Pipeline: the bar cache keeps the next batches downloading while we
+        # evaluate the batch that just landed. Progress is published per chunk.
+        cache = bar_cache.get_cache()
+        
+        for ready, failed in cache.iter_refresh(pending):
+            errors += failed
+            processed += len(ready) + failed
+            
+            chunk_tickers, rows = [], []
+            for yf_ticker in ready:
+                try:
+                    df = cache.frame(yf_ticker)
+                    if df is None or len(df) < 50:
                         errors += 1
                         continue
-                    df = data[yf_ticker]
-                    
-                df = df.dropna(how='all')
-                if df.empty or len(df) < 50:
+                    rows.append(compute_indicators(df))
+                    chunk_tickers.append(yf_ticker)
+                except Exception as e:
+                    logger.error(f"Error processing {yf_ticker}: {e}")
                     errors += 1
-                    continue
-                    
-                df.columns = [c.lower() for c in df.columns]
-                
-                # Apply scanner filter
-                match = False
-                indicators = {}
-                
-                if scanner_id == "vcp":
-                    match, indicators = scan_vcp(df)
-                elif scanner_id == "ipo_base":
-                    match, indicators = scan_ipo_base(df, len(df))
-                
-                if match:
-                    sentiment = sentiment_map.get(symbol, 0.0)
-                    if filter_sentiment and sentiment < 0.05:
-                        continue
-                        
-                    results.append({
-                        "sr": len(results) + 1,
-                        "symbol": symbol,
-                        "name": name,
-                        "sentiment": sentiment,
-                        **indicators
-                    })
-                    logger.info(f"[{scanner_id.upper()}] MATCH: {symbol}")
-                
-            except Exception as e:
-                logger.error(f"Error processing {yf_ticker}: {e}")
-                errors += 1
-                
-    logger.info(f"Scan complete. Found {len(results)} matches, {errors} errors.")
+            
+            # Evaluate the whole chunk at once, for every scanner
+            _evaluate(chunk_tickers, stack_indicators(rows))
+            
+            progress["current"] = min(processed, total_stocks)
+            progress["symbol"] = ready[-1].replace('.NS', '') if ready else progress["symbol"]
+            _publish()
+        
+        # Advance the snapshot so the next scan can take the fast path
+        try:
+            snapshot.update(cache)
+        except Exception as e:
+            logger.error(f"Indicator snapshot update failed: {e}")
     
-    final_data = {
-        "status": "success",
-        "scanner": scanner_id,
-        "matches": len(results),
-        "results": results
-    }
+    final = {}
+    for sid in scanner_ids:
+        log_stats(sid, stats[sid])
+        final[sid] = {
+            "status": "success",
+            "scanner": sid,
+            "matches": len(results[sid]),
+            "results": results[sid],
+            "funnel": stats[sid].get("conditions", [])
+        }
+        _scan_cache[sid] = {
+            "timestamp": time.time(),
+            "data": final[sid]
+        }
     
-    _scan_cache[cache_key] = {
-        "timestamp": time.time(),
-        "data": final_data
-    }
+    logger.info(f"Scan complete. {', '.join(f'{sid}={len(r)}' for sid, r in results.items())} matches, {errors} errors.")
     
-    _scan_progress[scanner_id]["status"] = "completed"
+    progress["status"] = "completed"
+    _publish()
     
-    return final_data
-
+    return final
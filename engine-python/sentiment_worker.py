@@ -1,11 +1,34 @@
 import os
+import re
 import time
 import json
-import requests
+import hashlib
 import feedparser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from logzero import logger
 
+import http_client
+from entity_matcher import EntityMatcher
+
+FEEDS = [
+    'https://www.moneycontrol.com/rss/MCtopnews.xml',
+    'https://www.moneycontrol.com/rss/latestnews.xml',
+    'https://economictimes.indiatimes.com/markets/stocks/rssfeeds/2146842.cms'
+]
+
+DATA_DIR = os.getenv('ENGINE_DATA_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+STATE_PATH = os.path.join(DATA_DIR, 'sentiment_state.json')
+
+CYCLE_SECONDS = int(os.getenv('SENTIMENT_CYCLE_SECONDS', '60'))
+SEEN_TTL_SECONDS = 48 * 3600        # Forget headline hashes after 2 days
+HALF_LIFE_SECONDS = 6 * 3600        # Weight of a headline halves every 6 hours
+SYMBOL_TTL_SECONDS = 7 * 24 * 3600  # Drop symbols not mentioned for a week
+POLARITY_CACHE_SIZE = 20000         # LRU entries (normalized headline -> compound score)
+POOL_THRESHOLD = 200                # Uncached headlines before scoring moves to a process pool
+POOL_CHUNK = 50
+
 # Add custom financial words to VADER lexicon
 finance_words = {
     'upgrade': 2.0,
@@ -49,79 +72,222 @@ def get_company_keywords(stock):
     
     return [symbol, first_word]
 
-def scrape_and_analyze():
-    feeds = [
-        'https://www.moneycontrol.com/rss/MCtopnews.xml',
-        'https://www.moneycontrol.com/rss/latestnews.xml',
-        'https://economictimes.indiatimes.com/markets/stocks/rssfeeds/2146842.cms'
-    ]
-    
-    logger.info("Scraping news feeds...")
-    headlines = []
-    for url in feeds:
+def build_matcher(universe):
+    """Compile every stock's keywords into one automaton (keyword -> symbols)"""
+    keyword_map = {}
+    for stock in universe:
+        symbol = stock.get('symbol')
+        if not symbol:
+            continue
+        for keyword in get_company_keywords(stock):
+            keyword_map.setdefault(keyword.lower(), set()).add(symbol)
+    matcher = EntityMatcher(keyword_map)
+    logger.info(f"Entity matcher built: {matcher.keywords} keywords for {len(universe)} stocks")
+    return matcher
+
+# Built once from stock_universe.json on first use
+_matcher = None
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = build_matcher(load_universe())
+    return _matcher
+
+# ═══════════════════════════════════════════
+# PERSISTENT STATE
+# ═══════════════════════════════════════════
+
+def load_state():
+    """Feed validators, seen headline hashes and per-symbol running sentiment"""
+    state = {"feeds": {}, "seen": {}, "symbols": {}}
+    if os.path.exists(STATE_PATH):
         try:
-            feed = feedparser.parse(url)
-            for entry in feed.entries:
-                headlines.append(entry.title + ". " + getattr(entry, 'description', ''))
+            with open(STATE_PATH, 'r') as f:
+                state.update(json.load(f))
         except Exception as e:
-            logger.error(f"Failed to parse {url}: {e}")
-            
-    if not headlines:
-        logger.warning("No headlines found.")
-        return
-        
-    logger.info(f"Found {len(headlines)} headlines.")
+            logger.error(f"Sentiment state unreadable, starting fresh: {e}")
+    return state
+
+def save_state(state):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(STATE_PATH + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(STATE_PATH + '.tmp', STATE_PATH)
+
+def headline_hash(text):
+    """Stable hash of a headline, ignoring case and whitespace differences"""
+    normalized = re.sub(r'\s+', ' ', text.lower()).strip()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def expire_state(state, now):
+    state["seen"] = {h: ts for h, ts in state["seen"].items() if now - ts < SEEN_TTL_SECONDS}
+    state["symbols"] = {s: v for s, v in state["symbols"].items() if now - v["updated"] < SYMBOL_TTL_SECONDS}
+
+# ═══════════════════════════════════════════
+# FEED FETCHING
+# ═══════════════════════════════════════════
+
+def fetch_feed(url, validators):
+    """
+    Conditional GET of one feed (ETag / Last-Modified) on the pooled
+    "feeds" session; feedparser only parses the body.
+    Returns: (headlines, new_validators); headlines is empty on 304 Not Modified.
+    Network and HTTP errors raise, keeping the old validators.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("modified"):
+        headers["If-Modified-Since"] = validators["modified"]
+    res = http_client.get("feeds", url, headers=headers)
+    if res.status_code == 304:
+        return [], validators
+    res.raise_for_status()
+    feed = feedparser.parse(res.content, response_headers={k.lower(): v for k, v in res.headers.items()})
+    headlines = [entry.title + ". " + getattr(entry, 'description', '') for entry in feed.entries]
+    return headlines, {
+        "etag": res.headers.get("ETag"),
+        "modified": res.headers.get("Last-Modified")
+    }
+
+def fetch_all_feeds(state):
+    """Fetch every feed concurrently; updates the stored validators in `state`"""
+    headlines = []
+    with ThreadPoolExecutor(max_workers=len(FEEDS)) as pool:
+        futures = {url: pool.submit(fetch_feed, url, state["feeds"].get(url, {})) for url in FEEDS}
+        for url, fut in futures.items():
+            try:
+                items, validators = fut.result()
+                state["feeds"][url] = validators
+                headlines.extend(items)
+            except Exception as e:
+                logger.error(f"Failed to parse {url}: {e}")
+    return headlines
+
+# ═══════════════════════════════════════════
+# SCORING
+# ═══════════════════════════════════════════
+
+_polarity_cache = OrderedDict()
+_score_pool = None
+
+def polarity_key(text):
+    """Cache key that ignores case, punctuation and spacing (wire services republish with tiny edits)"""
+    normalized = ' '.join(re.findall(r'\w+', text.lower()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def _score_batch(texts):
+    return [analyzer.polarity_scores(t)['compound'] for t in texts]
+
+def score_headlines(headlines):
+    """
+    Compound VADER score per headline, memoized in an LRU cache.
+    Large backlogs (e.g. first run, new feeds) are scored across a process pool.
+    """
+    global _score_pool
+    keys = [polarity_key(h) for h in headlines]
+    
+    missing = {}
+    for key, headline in zip(keys, headlines):
+        if key in _polarity_cache:
+            _polarity_cache.move_to_end(key)
+        elif key not in missing:
+            missing[key] = headline
+    
+    if missing:
+        texts = list(missing.values())
+        if len(texts) >= POOL_THRESHOLD:
+            if _score_pool is None:
+                _score_pool = ProcessPoolExecutor(max_workers=max((os.cpu_count() or 2) - 1, 1))
+            chunks = [texts[i:i + POOL_CHUNK] for i in range(0, len(texts), POOL_CHUNK)]
+            scores = [score for batch in _score_pool.map(_score_batch, chunks) for score in batch]
+        else:
+            scores = _score_batch(texts)
+        for key, score in zip(missing, scores):
+            _polarity_cache[key] = score
     
-    universe = load_universe()
-    sentiment_map = {}
+    result = [_polarity_cache[key] for key in keys]
+    while len(_polarity_cache) > POLARITY_CACHE_SIZE:
+        _polarity_cache.popitem(last=False)
     
+    logger.info(f"Scored {len(headlines)} headlines ({len(missing)} uncached)")
+    return result
+
+# ═══════════════════════════════════════════
+# AGGREGATION
+# ═══════════════════════════════════════════
+
+def _decay(entry, now):
+    """Age a symbol's running sums to `now`"""
+    factor = 0.5 ** (max(now - entry["updated"], 0) / HALF_LIFE_SECONDS)
+    for key in ("score_sum", "weight", "bullish", "bearish"):
+        entry[key] *= factor
+    entry["updated"] = now
+
+def add_mention(symbols_state, symbol, score, now):
+    """Fold one scored headline into the symbol's exponentially decayed averages"""
+    entry = symbols_state.get(symbol)
+    if entry is None:
+        entry = symbols_state[symbol] = {"score_sum": 0.0, "weight": 0.0, "bullish": 0.0, "bearish": 0.0, "updated": now}
+    _decay(entry, now)
+    entry["score_sum"] += score
+    entry["weight"] += 1.0
+    if score > 0.05:
+        entry["bullish"] += 1.0
+    elif score < -0.05:
+        entry["bearish"] += 1.0
+
+def sentiment_record(symbol, entry):
+    return {
+        "symbol": symbol,
+        "score": entry["score_sum"] / entry["weight"] if entry["weight"] else 0.0,
+        "bullish_mentions": int(round(entry["bullish"])),
+        "bearish_mentions": int(round(entry["bearish"]))
+    }
+
+def scrape_and_analyze(state=None):
+    """One cycle: fetch changed feeds, score only unseen headlines, push updated symbols"""
+    state = state if state is not None else load_state()
+    now = time.time()
+    expire_state(state, now)
+    
+    logger.info("Scraping news feeds...")
+    headlines = fetch_all_feeds(state)
+    
+    fresh = []
     for headline in headlines:
-        score = analyzer.polarity_scores(headline)['compound']
+        h = headline_hash(headline)
+        if h not in state["seen"]:
+            state["seen"][h] = now
+            fresh.append(headline)
+    
+    if not fresh:
+        logger.info(f"No new headlines ({len(headlines)} fetched).")
+        save_state(state)
+        return
         
-        # Determine which stocks are mentioned in this headline
-        # This is a naive substring match. In production, Named Entity Recognition (NER) is better.
-        for stock in universe:
-            symbol = stock['symbol']
-            keywords = get_company_keywords(stock)
-            
-            for keyword in keywords:
-                if keyword.lower() in headline.lower():
-                    if symbol not in sentiment_map:
-                        sentiment_map[symbol] = {
-                            "symbol": symbol,
-                            "score": 0.0,
-                            "bullish_mentions": 0,
-                            "bearish_mentions": 0,
-                            "count": 0
-                        }
-                    
-                    sentiment_map[symbol]["score"] += score
-                    sentiment_map[symbol]["count"] += 1
-                    
-                    if score > 0.05:
-                        sentiment_map[symbol]["bullish_mentions"] += 1
-                    elif score < -0.05:
-                        sentiment_map[symbol]["bearish_mentions"] += 1
-                        
-                    break # Found a match for this stock in this headline, move to next stock
-                    
-    # Average the scores
-    final_sentiments = []
-    for symbol, data in sentiment_map.items():
-        avg_score = data["score"] / data["count"]
-        final_sentiments.append({
-            "symbol": symbol,
-            "score": avg_score,
-            "bullish_mentions": data["bullish_mentions"],
-            "bearish_mentions": data["bearish_mentions"]
-        })
+    logger.info(f"Found {len(fresh)} new headlines ({len(headlines)} fetched).")
+    
+    matcher = get_matcher()
+    touched = set()
+    
+    for headline, score in zip(fresh, score_headlines(fresh)):
+        # One linear scan per headline finds every stock mentioned in it
+        for symbol in matcher.match(headline):
+            add_mention(state["symbols"], symbol, score, now)
+            touched.add(symbol)
+    
+    final_sentiments = [sentiment_record(symbol, state["symbols"][symbol]) for symbol in touched]
+    save_state(state)
         
-    logger.info(f"Analyzed sentiments for {len(final_sentiments)} stocks.")
+    logger.info(f"Updated sentiments for {len(final_sentiments)} stocks.")
     
     # Send to Node.js backend
     if final_sentiments:
         try:
-            res = requests.post(
+            res = http_client.post(
+                "backend",
                 'http://localhost:3002/internal/sentiments',
                 json={
                     "secret": "super_secret_python_worker",
@@ -135,7 +301,11 @@ def scrape_and_analyze():
 
 if __name__ == "__main__":
     logger.info("Starting sentiment worker...")
+    state = load_state()
     while True:
-        scrape_and_analyze()
-        logger.info("Sleeping for 15 minutes...")
-        time.sleep(15 * 60)
+        try:
+            scrape_and_analyze(state)
+        except Exception as e:
+            logger.error(f"Sentiment cycle failed: {e}")
+        logger.info(f"Sleeping for {CYCLE_SECONDS}s...")
+        time.sleep(CYCLE_SECONDS)
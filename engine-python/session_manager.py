@@ -1,5 +1,5 @@
+import asyncio
 import threading
-import requests
 import time
 import pandas as pd
 from logzero import logger
@@ -12,7 +12,6 @@ from strategies.ema_pullback_strategy import LiveEMAPullback
 from strategies.engulfing_strategy import LiveEngulfing
 from strategies.time_based_strategy import LiveTimeBased
 from strategies.vwap_volume_failure import LiveVWAPFailure
-from SmartApi import SmartConnect
 from SmartApi.smartWebSocketV2 import SmartWebSocketV2
 
 # Monkey patch for websocket client compatibility
@@ -26,9 +25,23 @@ if hasattr(SmartWebSocketV2, '_on_close'):
             return None
     SmartWebSocketV2._on_close = _patched_on_close
 
-import pyotp
 import datetime
 import os
+import uuid
+from collections import deque
+
+import broker_sessions
+import broker_gateway
+import engine_loop
+import http_client
+import trade_outbox
+import tick_publisher
+import trade_index
+import price_table
+import preopen_scheduler
+import market_clock
+import square_off
+import paper_matching
 
 # WhatsApp Alerts (per-user, optional)
 try:
@@ -39,6 +52,33 @@ except ImportError:
 
 # Configuration
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:3002')
+LOG_BUFFER_SIZE = 500
+DEBUG_LOGS = os.getenv('ENGINE_DEBUG_LOGS', '0') == '1'
+
+IST_OFFSET = datetime.timedelta(hours=5, minutes=30)
+
+
+def format_log_record(record):
+    """'HH:MM:SS - LEVEL - message' (IST), formatting the template only now"""
+    _, ts, level, message, args = record
+    stamp = (datetime.datetime.utcfromtimestamp(ts) + IST_OFFSET).strftime("%H:%M:%S")
+    if args:
+        try:
+            message = message.format(*args)
+        except Exception:
+            message = f"{message} {args}"
+    return f"{stamp} - {level} - {message}"
+
+
+class _LazyLogLine:
+    """Defers formatting until the console logger actually emits the line"""
+    __slots__ = ('record',)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        return format_log_record(self.record)
 
 class TradingSession:
     def __init__(self, user_id, config, credentials):
@@ -52,12 +92,35 @@ class TradingSession:
         # State
         self.pnl = 0.0
         self.positions = []  # {symbol, qty, entry, type, pnl, status, time}
-        self.logs = []
+        # Status snapshot versioning: bumped on fills, edits and ticks that move an open
+        # position, so pollers can skip unchanged state
+        self.state_version = 0
+        self._positions_version = 0
+        self._views_version = -1
+        self._open_view = []
+        self._open_symbols = set()
+        self._closed_view = []
+        self._marked_ltp = {}   # {symbol: LTP at the last version bump} - open positions only
+        
+        self.logs = deque(maxlen=LOG_BUFFER_SIZE)  # (seq, ts, level, message, args)
+        self.log_seq = 0
+        self.debug_logs = DEBUG_LOGS or bool(config.get('debug_logs', False))
         self.trades_history = []
         self.signals_triggered = {}  # Track which symbols fired today {symbol_date: True}
         
-        self.ltp_cache = {}   # {symbol: last_traded_price}
-        self.prev_ltp_cache = {}  # {symbol: previous_ltp} - for crossover detection
+        # Session times parsed once; _check_signal compares them as monotonic instants
+        self.clock = market_clock.get_clock()
+        config_stop = market_clock.parse_hhmm(config.get('stopTime', '15:15'), market_clock.SQUARE_OFF)
+        self.square_off_time = min(config_stop, market_clock.SQUARE_OFF)   # Hard safety stop at 15:05, or earlier
+        self.signal_cutoff_time = market_clock.parse_hhmm(config.get('signalCutoffTime', ''))
+        self._cutoff_logged = None   # Day key the cutoff notice was logged for
+        
+        # LTP / previous LTP / VWAP live in the process-wide shared price table
+        self.prices = price_table.get_table()
+        # PAPER TP/SL levels live in the process-wide trigger book
+        self.paper_book = paper_matching.get_book()
+        self._ticked = set()  # Symbols that delivered a tick to this session
+        self._prev_ltp = {}   # {symbol: this session's last LTP} - for crossover detection
         
         # Connection
         self.smartApi = None
@@ -65,23 +128,26 @@ class TradingSession:
         self.auth_token = None
         self.feed_token = None
         self.stop_event = threading.Event()
-        self.thread = None
-        self.ws_thread = None
-        self.oco_monitor_thread = None  # OCO (One-Cancels-Other) monitoring thread
+        # Tick TP/SL, OCO, square-off and manual exits run on different threads;
+        # whichever claims an OPEN position under this lock books (and exits) it
+        self._close_lock = threading.Lock()
+        self.ws_thread = None           # websocket-client's own receive thread
+        # Coroutines on the shared engine loop (no per-session threads)
+        self._task = None               # Lifecycle: login, warm-up, standby
+        self._oco_task = None           # OCO (One-Cancels-Other) monitor
+        self._reconnect_task = None
         
         # Symbol Token Mapping
         self.symbol_tokens = {}  # {symbol: token}
         
         # Strategy (initialized after symbol tokens are loaded)
         self.strategy = None
+        self._strategy_day = None   # Trading day the strategy was last initialized for
         
         # OCO Tracking: positions with both TP and SL orders pending
         # Format: {position_id: {"pos": pos_ref, "tp_order_id": ..., "sl_order_id": ...}}
         self.pending_oco_positions = {}
         
-        # Sync Throttle
-        self.last_sync_time = 0
-        
         # WhatsApp Alerter (per-user)
         if WHATSAPP_AVAILABLE:
             wa_phone = credentials.get('whatsapp_phone', '')
@@ -90,13 +156,26 @@ class TradingSession:
         else:
             self.wa_alerter = None
 
-    def log(self, message, type="INFO"):
-        timestamp = self._get_ist_time().strftime("%H:%M:%S")
-        log_entry = f"{timestamp} - {type} - {message}"
-        self.logs.append(log_entry)
-        logger.info(log_entry)  # Also log to console
-        # Keep only last 100 logs
-        if len(self.logs) > 100: self.logs.pop(0)
+    def log(self, message, type="INFO", *args):
+        """
+        Record a log line. `message` may be a str.format template filled from
+        `args` only when the line is read, so hot-path DEBUG calls cost almost
+        nothing unless DEBUG logging is enabled.
+        """
+        if type == "DEBUG" and not self.debug_logs:
+            return
+        self.log_seq += 1
+        record = (self.log_seq, time.time(), type, message, args)
+        self.logs.append(record)  # deque(maxlen) drops the oldest line in O(1)
+        logger.info("%s", _LazyLogLine(record))  # Also log to console
+
+    def get_logs(self, since=None):
+        """Formatted log lines, optionally only those after cursor `since`"""
+        records = list(self.logs)
+        if since is not None and records:
+            # Sequence numbers are contiguous, so the cursor maps straight to an offset
+            records = records[max(since - records[0][0] + 1, 0):]
+        return [format_log_record(r) for r in records]
 
     def start(self):
         if self.active: return
@@ -111,51 +190,29 @@ class TradingSession:
             symbols = self.config.get('symbols', [])
             self.wa_alerter.session_started(self.user_id, self.mode, self.strategy_name, symbols)
         
-        # Start background thread which will handle login + WebSocket
-        self.thread = threading.Thread(target=self._login_and_run, daemon=True)
-        self.thread.start()
+        # Login + WebSocket run as a coroutine on the shared engine loop
+        self._task = engine_loop.submit(self._run())
 
-    def _login_and_run(self):
-        """Background thread: login, calculate ORB, then start WebSocket"""
+    async def _run(self):
+        """Session lifecycle: login, calculate ORB, then start WebSocket (blocking steps on the engine executor)"""
         try:
                 # 1. Login
             try:
-                api_key = self.credentials.get('apiKey')
-                client_code = self.credentials.get('clientCode')
-                password = self.credentials.get('password')
-                totp_secret = self.credentials.get('totp')
-                
-                self.smartApi = SmartConnect(api_key=api_key)
-                
-                # if access_token:
-                #     # OAuth Flow (commented out as per user request)
-                #     self.smartApi.access_token = access_token
-                #     self.auth_token = access_token
-                #     self.feed_token = self.credentials.get('feedToken')
-                #     self.log("Angel One OAuth Login Successful", "SUCCESS")
-                # else:
-
-                if password and totp_secret:
-                    # Legacy Login Flow
-                    try:
-                        totp = pyotp.TOTP(totp_secret).now()
-                        data = self.smartApi.generateSession(client_code, password, totp)
-                        if data['status']:
-                            self.auth_token = data['data']['jwtToken']
-                            self.feed_token = data['data']['feedToken']
-                            self.log("Angel One Login Successful", "SUCCESS")
-                        else:
-                            self.log(f"Login failed: {data['message']}", "ERROR")
-                            self.active = False
-                            return
-                    except Exception as e:
-                        self.log(f"Session generation failed: {str(e)}", "ERROR")
-                        self.active = False
-                        return
-                else:
-                    self.log("Missing password or totp for legacy login", "ERROR")
+                # Shared per-client-code broker session: reuses a live login
+                # (or waits on one in flight) instead of logging in again
+                try:
+                    broker = await engine_loop.run_blocking(broker_sessions.get_cache().get, self.credentials, allow_oauth=False)
+                except broker_sessions.BrokerLoginError as e:
+                    self.log(f"Login failed: {e}", "ERROR")
                     self.active = False
                     return
+                
+                self.smartApi = broker.smart_api
+                self.auth_token = broker.auth_token
+                self.feed_token = broker.feed_token
+                self.log("Angel One Login Successful", "SUCCESS")
+                # Open the order connection now so the first order skips the handshake
+                http_client.warm("orders")
                     
             except Exception as e:
                 self.log(f"Login Exception: {e}", "ERROR")
@@ -163,7 +220,7 @@ class TradingSession:
                 return
             
             # 2. Load Symbol Tokens
-            self._load_symbol_tokens()
+            await engine_loop.run_blocking(self._load_symbol_tokens)
             
             # 3. Initialize Strategy (AFTER tokens are loaded)
             class StrategyLogger:
@@ -191,10 +248,9 @@ class TradingSession:
             self.strategy = StrategyClass(self.config, strat_logger, self.symbol_tokens)
             self.log(f"Loaded Strategy: {self.strategy_name}", "INFO")
             
-            self.strategy.initialize(self.smartApi)
-            
-            # 4. Start WebSocket for Live Data
-            self._start_websocket()
+            # 4. Start WebSocket for Live Data (initializes the strategy before connecting;
+            # outside market hours the pre-open warm-up does it instead)
+            await self._start_websocket()
             
             # 5. Start OCO Monitor (for LIVE mode only)
             if self.mode == "LIVE":
@@ -203,58 +259,56 @@ class TradingSession:
         except Exception as e:
             self.log(f"CRITICAL SESSION ERROR: {e}", "ERROR")
             import traceback
-            self.log(f"{traceback.format_exc()}", "DEBUG")
+            self.log("{}", "DEBUG", traceback.format_exc())
             self.active = False
 
-    def _sync_to_backend(self):
-        """Send live PnL and trades to Node.js backend via webhook"""
-        try:
-            # Throttle: Max 1 update per second
-            if time.time() - self.last_sync_time < 1.0:
-                return
+    def tick_snapshot(self):
+        """Open positions (frontend field names), unrealized PnL and LTPs for the tick publisher"""
+        open_positions = [p for p in list(self.positions) if p['status'] == 'OPEN']
+        total_pnl = self._open_pnl(open_positions)
+        clean_trades = []
+        for p in open_positions:
+            # Get live LTP for this symbol
+            symbol_ltp = self._ltp(p['symbol'], p['entry'])
+            
+            # Map fields to match what frontend expects
+            clean_trades.append({
+                "entry_order_id": p.get('order_id') or p.get('id', f"pos_{p['symbol']}"),
+                "symbol": p['symbol'],
+                "quantity": p['qty'],
+                "entry_price": p['entry'],
+                "ltp": round(symbol_ltp, 2),  # Live LTP for this position
+                "tp": p.get('tp'),
+                "sl": p.get('sl'),
+                "pnl": round(p['pnl'], 2),
+                "status": p['status'],
+                "mode": p['type'], # matches frontend expectation
+                "timestamp": f"{p.get('date')} {p.get('time')}"
+            })
 
-            total_pnl = sum([p['pnl'] for p in self.positions if p['status'] == 'OPEN'])
-            
-            # Format trades for frontend
-            clean_trades = []
-            for p in self.positions:
-                if p['status'] == 'OPEN':
-                     # Get live LTP for this symbol
-                     symbol_ltp = self.ltp_cache.get(p['symbol'], p['entry'])
-                     
-                     # Map fields to match what frontend expects
-                     clean_trades.append({
-                         "entry_order_id": p.get('order_id', p.get('id', f"pos_{p['symbol']}")),
-                         "symbol": p['symbol'],
-                         "quantity": p['qty'],
-                         "entry_price": p['entry'],
-                         "ltp": round(symbol_ltp, 2),  # Live LTP for this position
-                         "tp": p.get('tp'),
-                         "sl": p.get('sl'),
-                         "pnl": round(p['pnl'], 2),
-                         "status": p['status'],
-                         "mode": p['type'], # matches frontend expectation
-                         "timestamp": f"{p.get('date')} {p.get('time')}"
-                     })
-
-            payload = {
-                "user_id": self.user_id,
-                "pnl": round(total_pnl, 2),
-                "trades": clean_trades,
-                "ltp_cache": {k: round(v, 2) for k, v in self.ltp_cache.items()}  # Full LTP cache
-            }
-            
-            # Use backend internal URL
-            requests.post(f'{BACKEND_URL}/webhook/tick', json=payload, timeout=2.0)
-            self.last_sync_time = time.time()
-            
-        except Exception:
-            pass # Silent fail to avoid interrupting trading loop
-        
-        # 5. Keep thread alive while active
-        while self.active and not self.stop_event.is_set():
-            self._sync_to_backend()
-            time.sleep(1)
+        return {
+            "pnl": round(total_pnl, 2),
+            "trades": clean_trades,
+            "ltp": self._ltp_map(self._ticked)
+        }
+
+    def _ltp(self, symbol, default=None):
+        """Last traded price from the shared price table"""
+        token = self.symbol_tokens.get(symbol)
+        return self.prices.ltp(token, default) if token else default
+
+    def _open_pnl(self, positions):
+        """Unrealized PnL of open positions; PAPER ones are marked to the LTP here, on read, not per tick"""
+        if self.mode != 'LIVE':
+            for p in positions:
+                ltp = self._ltp(p['symbol'])
+                if ltp is not None:
+                    p['pnl'] = paper_matching.marked_pnl(p, ltp)
+        return sum(p.get('pnl', 0) for p in positions)
+
+    def _ltp_map(self, symbols):
+        ltps = {s: self._ltp(s) for s in list(symbols)}
+        return {s: round(v, 2) for s, v in ltps.items() if v is not None}
 
     def _load_symbol_tokens(self):
         """
@@ -333,7 +387,6 @@ class TradingSession:
         for sym in symbols:
             try:
                 clean = sym.upper().replace("-EQ", "")
-                time.sleep(1.0)  # Required: Angel One API rate limit (without this, lookups fail)
                 
                 search = self.smartApi.searchScrip("NSE", clean)
                 
@@ -364,7 +417,7 @@ class TradingSession:
                     # ALSO store the actual trading symbol to use in orders
                     self.symbol_tokens[f"{sym}_TS"] = selected_script['tradingsymbol'] 
                     
-                    self.log(f"✓ {sym} -> {selected_script['tradingsymbol']} (Token: {selected_script['symboltoken']})", "DEBUG")
+                    self.log("✓ {} -> {} (Token: {})", "DEBUG", sym, selected_script['tradingsymbol'], selected_script['symboltoken'])
                 else:
                     self.log(f"⚠️ Could not find token for {sym}: {search}", "WARNING")
                     
@@ -373,22 +426,13 @@ class TradingSession:
 
     def _get_ist_time(self):
         """Get current time in Indian Standard Time (UTC+5:30)"""
-        utc_now = datetime.datetime.utcnow()
-        ist_now = utc_now + datetime.timedelta(hours=5, minutes=30)
-        return ist_now
-
-
-
+        return market_clock.ist_now()
 
     def _is_market_hours(self):
-        """Check if current time is within market hours (9:15 AM - 3:30 PM IST)"""
-        ist_now = self._get_ist_time()
-        current_time = ist_now.time()
-        market_open = datetime.time(9, 15)
-        market_close = datetime.time(15, 30)
-        return market_open <= current_time <= market_close
-
-    def _cleanup_old_websocket(self):
+        """Check if the market is open (9:15 AM - 3:30 PM IST on an NSE trading day)"""
+        return self.clock.is_open()
+
+    async def _cleanup_old_websocket(self):
         """Close any existing WebSocket connection before creating a new one"""
         if self.sws:
             try:
@@ -397,9 +441,28 @@ class TradingSession:
                 pass
             self.sws = None
             # Give Angel One time to release the connection slot
-            time.sleep(2)
+            await asyncio.sleep(2)
+
+    def _connect_websocket(self):
+        """Create the SmartWebSocketV2 and start its receive thread"""
+        self.sws = SmartWebSocketV2(
+            auth_token=self.auth_token,
+            api_key=self.credentials.get('apiKey'),
+            client_code=self.credentials.get('clientCode'),
+            feed_token=self.feed_token
+        )
+        
+        # Callbacks
+        self.sws.on_open = self._on_ws_open
+        self.sws.on_data = self._on_ws_data
+        self.sws.on_error = self._on_ws_error
+        self.sws.on_close = self._on_ws_close
+        
+        # websocket-client's run_forever blocks, so the socket keeps its own thread
+        self.ws_thread = threading.Thread(target=self.sws.connect, daemon=True)
+        self.ws_thread.start()
 
-    def _start_websocket(self):
+    async def _start_websocket(self):
         """Initialize and connect Angel One WebSocket for live data"""
         try:
             # Check if market is open
@@ -407,51 +470,68 @@ class TradingSession:
                 self.log("⏸️ Market is CLOSED. Engine running in STANDBY mode.", "WARNING")
                 self.log("Engine will remain active. No trades will be taken outside market hours.", "INFO")
                 # Run standby loop instead of WebSocket
-                self._run_standby_loop()
+                await self._run_standby_loop()
                 return
             
-            # Close any existing connection first to avoid 429 rate limit
-            self._cleanup_old_websocket()
-            
-            api_key = self.credentials.get('apiKey')
-            client_code = self.credentials.get('clientCode')
-            
-            self.sws = SmartWebSocketV2(
-                auth_token=self.auth_token,
-                api_key=api_key,
-                client_code=client_code,
-                feed_token=self.feed_token
-            )
-            
-            # Callbacks
-            self.sws.on_open = self._on_ws_open
-            self.sws.on_data = self._on_ws_data
-            self.sws.on_error = self._on_ws_error
-            self.sws.on_close = self._on_ws_close
-            
-            # Connect in separate thread
-            self.ws_thread = threading.Thread(target=self.sws.connect, daemon=True)
-            self.ws_thread.start()
+            # Never trade on an uninitialized strategy (e.g. after a failed pre-open warm-up)
+            await self._initialize_strategy(force=False)
             
+            # Close any existing connection first to avoid 429 rate limit
+            await self._cleanup_old_websocket()
+            self._connect_websocket()
             self.log("WebSocket Connecting...", "INFO")
             
         except Exception as e:
             self.log(f"WebSocket Init Error: {e}", "ERROR")
             # Fallback to standby if WebSocket fails
             self.log("Falling back to standby mode", "WARNING")
-            self._run_standby_loop()
+            await self._wait_for_open()
     
-    def _run_standby_loop(self):
-        """Keep engine alive in standby mode when market is closed"""
-        self.log("🔄 Standby mode active. Waiting for market hours...", "INFO")
+    async def _initialize_strategy(self, force=True):
+        """Load strategy history/levels for today; with force=False only if not done yet today"""
+        day = self.clock.today().key
+        if not force and self._strategy_day == day:
+            return
+        await engine_loop.run_blocking(self.strategy.initialize, self.smartApi)
+        self._strategy_day = day
+
+    async def _run_standby_loop(self):
+        """Keep engine alive in standby mode until the pre-open warm-up connects it"""
+        self.log("🔄 Standby mode active. Waiting for pre-open warm-up...", "INFO")
+        if await preopen_scheduler.get_scheduler().warm(self):
+            return
+        await self._wait_for_open()
+
+    async def _wait_for_open(self):
+        """Fallback standby: poll for market hours, then connect"""
         while self.active and not self.stop_event.is_set():
-            # Check every 30 seconds if market opened
+            # Check every 30 seconds if market opened (stop() cancels the sleep)
+            await asyncio.sleep(30)
             if self._is_market_hours():
                 self.log("🔔 Market is now OPEN! Connecting WebSocket...", "SUCCESS")
-                self._start_websocket()
+                await self._start_websocket()
                 return
-            # Just keep alive, no data fetching
-            self.stop_event.wait(30)
+
+    async def _pre_open_warm_up(self):
+        """
+        Pre-open (09:00-09:14): fresh broker tokens, missing instruments,
+        strategy history and websocket subscription, ahead of the 09:15 open.
+        """
+        if not self.active or self.stop_event.is_set():
+            return False
+        broker = await engine_loop.run_blocking(broker_sessions.get_cache().get, self.credentials, allow_oauth=False)
+        self.smartApi = broker.smart_api
+        self.auth_token = broker.auth_token
+        self.feed_token = broker.feed_token
+        
+        if any(s not in self.symbol_tokens for s in self.config.get('symbols', [])):
+            await engine_loop.run_blocking(self._load_symbol_tokens)
+        await self._initialize_strategy()
+        
+        await self._cleanup_old_websocket()
+        self._connect_websocket()
+        self.log("🌅 Pre-open warm-up complete. WebSocket subscribing ahead of the open", "SUCCESS")
+        return True
 
     def _on_ws_open(self, wsapp):
         """Called when WebSocket connects - subscribe to symbols"""
@@ -471,7 +551,7 @@ class TradingSession:
         try:
             self.sws.subscribe("live_feed", 2, token_list)  # Quote mode for LTP + VWAP
             self.log(f"✅ Subscribed to {len(tokens)} symbols (Quote Mode)", "SUCCESS")
-            self.log(f"Tokens: {tokens[:10]}{'...' if len(tokens) > 10 else ''}", "DEBUG")
+            self.log("Tokens: {}{}", "DEBUG", tokens[:10], '...' if len(tokens) > 10 else '')
         except Exception as e:
             self.log(f"Subscribe Error: {e}", "ERROR")
 
@@ -492,6 +572,8 @@ class TradingSession:
             ltp = raw_ltp / 100 if raw_ltp else 0  # Angel sends price * 100
             raw_vwap = message.get('average_traded_price', 0)
             vwap = raw_vwap / 100 if raw_vwap else 0  # VWAP
+            volume = message.get('volume_trade_for_the_day', 0) or 0
+            exch_ts = message.get('exchange_timestamp', 0) or 0
             
             # Find symbol for this token (skip _TS helper keys)
             symbol = None
@@ -504,19 +586,23 @@ class TradingSession:
                 return
             
             # Log first tick for each symbol (confirmation that data is flowing)
-            if symbol not in self.ltp_cache:
-                self.log(f"📊 First tick: {symbol} LTP=₹{ltp:.2f} VWAP=₹{vwap:.2f}", "DEBUG")
-            
-            # Track previous LTP for crossover detection
-            prev_ltp = self.prev_ltp_cache.get(symbol, 0)
-            self.prev_ltp_cache[symbol] = ltp
+            if symbol not in self._ticked:
+                self._ticked.add(symbol)
+                self.log("📊 First tick: {} LTP=₹{:.2f} VWAP=₹{:.2f}", "DEBUG", symbol, ltp, vwap)
             
-            # Update LTP cache
-            self.ltp_cache[symbol] = ltp
+            # Shared price table holds the latest price; the previous LTP for
+            # crossover detection is this session's own, in its socket's order
+            self.prices.update(token, ltp, vwap, volume, exch_ts)
+            prev_ltp = self._prev_ltp.get(symbol, 0)
+            self._prev_ltp[symbol] = ltp
             
             # Update positions with live PnL
             self._update_position_pnl(symbol, ltp)
             
+            # Pre-open ticks (socket warmed before 09:15) only update prices
+            if not self._is_market_hours():
+                return
+            
             # Check for signals (Strategy decides logic)
             self._check_signal(symbol, ltp, vwap, prev_ltp)
                 
@@ -533,15 +619,16 @@ class TradingSession:
     def _on_ws_error(self, wsapp, error, *args):
         self.log(f"WebSocket Error: {error}", "ERROR")
         import traceback
-        self.log(f"WS Error Details: {traceback.format_exc()}", "DEBUG")
+        self.log("WS Error Details: {}", "DEBUG", traceback.format_exc())
 
     def _on_ws_close(self, wsapp, *args):
         self.log("WebSocket Disconnected", "WARNING")
-        # Attempt reconnect if still active
+        # Attempt reconnect if still active (one reconnect coroutine at a time)
         if self.active and not self.stop_event.is_set():
-            self._reconnect_websocket()
+            if self._reconnect_task is None or self._reconnect_task.done():
+                self._reconnect_task = engine_loop.submit(self._reconnect_websocket())
 
-    def _reconnect_websocket(self):
+    async def _reconnect_websocket(self):
         """Reconnect WebSocket with exponential backoff"""
         retry_delays = [5, 10, 30, 60]  # Seconds between retries
         
@@ -550,58 +637,49 @@ class TradingSession:
                 return
             
             self.log(f"Reconnecting WebSocket in {delay}s (attempt {attempt + 1}/{len(retry_delays)})...", "INFO")
-            time.sleep(delay)
+            await asyncio.sleep(delay)
             
             try:
                 # Close old connection first to avoid 429 rate limit
-                self._cleanup_old_websocket()
+                await self._cleanup_old_websocket()
+                
+                # Current tokens from the shared broker session: a background renewal
+                # since login has revoked the ones this session copied then
+                try:
+                    broker = await engine_loop.run_blocking(broker_sessions.get_cache().get, self.credentials, allow_oauth=False)
+                    self.smartApi = broker.smart_api
+                    self.auth_token = broker.auth_token
+                    self.feed_token = broker.feed_token
+                except broker_sessions.BrokerLoginError as e:
+                    self.log(f"Broker session unavailable for reconnect: {e}", "WARNING")
                 
-                # Re-login to get fresh tokens
-                api_key = self.credentials.get('apiKey')
-                client_code = self.credentials.get('clientCode')
                 # With OAuth, we just rely on the existing token.
                 # If it's expired, the Node.js backend needs to refresh it.
                 if not getattr(self, 'auth_token', None):
                     self.log("Cannot reconnect: No OAuth auth_token", "ERROR")
                     return
-                    
-                    # Create new WebSocket
-                    self.sws = SmartWebSocketV2(
-                        auth_token=self.auth_token,
-                        api_key=api_key,
-                        client_code=client_code,
-                        feed_token=self.feed_token
-                    )
-                    
-                    self.sws.on_open = self._on_ws_open
-                    self.sws.on_data = self._on_ws_data
-                    self.sws.on_error = self._on_ws_error
-                    self.sws.on_close = self._on_ws_close
-                    
-                    self.ws_thread = threading.Thread(target=self.sws.connect, daemon=True)
-                    self.ws_thread.start()
-                    
-                    self.log("WebSocket Reconnected", "SUCCESS")
-                    return  # Success
-                else:
-                    self.log(f"Re-login failed: {data.get('message')}", "ERROR")
+                
+                # Create new WebSocket
+                self._connect_websocket()
+                self.log("WebSocket Reconnected", "SUCCESS")
+                return  # Success
                     
             except Exception as e:
                 self.log(f"Reconnection attempt {attempt + 1} failed: {e}", "ERROR")
         
         # All retries failed, fall back to polling
         self.log("WebSocket reconnection failed. Falling back to polling mode.", "WARNING")
-        self._run_polling_loop()
+        await self._run_polling_loop()
 
     def _check_signal(self, symbol, ltp, vwap=0, prev_ltp=0):
         """Check if price breaks ORB levels and generate signal"""
         if not self.active: return
         
-        current_date = datetime.date.today()
-        ist_now = self._get_ist_time()
-        current_time = ist_now.time()
+        # One monotonic read per tick against today's precomputed schedule
+        day = self.clock.today()
+        now = time.monotonic()
         
-        today_key = f"{symbol}_{current_date}"
+        today_key = f"{symbol}_{day.key}"
         
         # Check if already triggered today (Common for ALL strategies)
         if today_key in self.signals_triggered:
@@ -615,34 +693,10 @@ class TradingSession:
         # ==========================================
         # AUTO SQUARE OFF CHECK (3:05 PM Safety)
         # ==========================================
-        # Parse stop time from config or default to 15:15 (3:15 PM)
-        # But per user request: "Auto Square off at 3:05 PM"
-        
-        # Hard safety stop at 15:05
-        square_off_time = datetime.time(15, 5)
-        
-        # Or use config stop time if it's earlier
-        config_stop_str = self.config.get('stopTime', '15:15')
-        try:
-            h, m = map(int, config_stop_str.split(':'))
-            config_stop = datetime.time(h, m)
-            if config_stop < square_off_time:
-                square_off_time = config_stop
-        except:
-            pass
-
-        if current_time >= square_off_time:
-            # 1. Close all OPEN positions for this symbol
-            active_smart_orders = 0
-            for p in self.positions:
-                 if p['symbol'] == symbol and p['status'] == 'OPEN':
-                     self._close_position(p, ltp, "AUTO_SQUARE_OFF")
-                     active_smart_orders += 1
-            
-            if active_smart_orders > 0:
-                 self.log(f"⏰ Auto Square Off Triggered for {symbol} at {current_time}", "WARNING")
-            
-            # 2. Block new signals
+        # Hard safety stop at 15:05, or the config stop time if earlier
+        # Open positions are exited on the clock by the bulk square-off (square_off.py),
+        # not on the next tick of their symbol; here only new signals are blocked
+        if now >= day.at(self.square_off_time):
             return
 
         # ==========================================
@@ -650,20 +704,12 @@ class TradingSession:
         # ==========================================
         # After this time, stop finding NEW signals but keep
         # existing positions alive for TP/SL monitoring
-        signal_cutoff_str = self.config.get('signalCutoffTime', '')
-        if signal_cutoff_str:
-            try:
-                ch, cm = map(int, signal_cutoff_str.split(':'))
-                signal_cutoff = datetime.time(ch, cm)
-                if current_time >= signal_cutoff:
-                    # Log once per day when cutoff activates
-                    cutoff_key = f"_cutoff_logged_{current_date}"
-                    if not hasattr(self, cutoff_key):
-                        setattr(self, cutoff_key, True)
-                        self.log(f"🔶 Signal Cutoff Active ({signal_cutoff_str}). No new signals will be generated. Existing positions will continue TP/SL monitoring.", "WARNING")
-                    return
-            except:
-                pass
+        if self.signal_cutoff_time and now >= day.at(self.signal_cutoff_time):
+            # Log once per day when cutoff activates
+            if self._cutoff_logged != day.key:
+                self._cutoff_logged = day.key
+                self.log(f"🔶 Signal Cutoff Active ({self.signal_cutoff_time.strftime('%H:%M')}). No new signals will be generated. Existing positions will continue TP/SL monitoring.", "WARNING")
+            return
 
         # (TEST strategy logic has been moved to strategies/test.py)
 
@@ -671,7 +717,7 @@ class TradingSession:
         # STRATEGY EXECUTION (Delegated)
         # ==========================================
         if self.strategy:
-            signal = self.strategy.on_tick(symbol, ltp, prev_ltp, vwap, current_time)
+            signal = self.strategy.on_tick(symbol, ltp, prev_ltp, vwap, day.time_of(now))
             if signal:
                 self._place_order(
                     symbol, 
@@ -686,6 +732,24 @@ class TradingSession:
 
     def _update_position_pnl(self, symbol, ltp):
         """Update unrealized PnL for open positions"""
+        # Only a new LTP of an open position (hence its P&L) changes what status pollers
+        # see; other symbols' LTPs reach clients through the tick publisher
+        self._refresh_views()
+        if symbol in self._open_symbols and self._marked_ltp.get(symbol) != ltp:
+            self._marked_ltp[symbol] = ltp
+            self._mark_changed()
+        
+        # PAPER exits: the shared trigger book returns only the crossed TP/SL levels
+        # (of any session trading this token); their PnL is marked on read.
+        # Other sessions' fills are closed on the engine loop, not on this socket's thread
+        for session, p, reason in self.paper_book.on_tick(self.symbol_tokens.get(symbol, symbol), ltp):
+            if session is self:
+                self._close_position(p, ltp, reason)
+            else:
+                engine_loop.submit(engine_loop.run_blocking(session._close_position, p, ltp, reason))
+        if self.mode != 'LIVE':
+            return
+        
         for p in self.positions:
             if p['symbol'] == symbol and p['status'] == 'OPEN':
                 if p['type'] == 'BUY':
@@ -771,6 +835,8 @@ class TradingSession:
                 # Order was confirmed by broker - NOW add to positions
                 self.positions.append(pos)
                 self.trades_history.append(pos)
+                self._mark_changed(positions=True)
+                trade_index.get_index().record(self, pos)
                 self.log(f"✅ REAL {type} Order CONFIRMED for {symbol} @ {price:.2f}", "SUCCESS")
                 # WhatsApp Alert: Order Placed (LIVE)
                 if self.wa_alerter:
@@ -784,6 +850,9 @@ class TradingSession:
             # PAPER mode - add immediately (no broker validation needed)
             self.positions.append(pos)
             self.trades_history.append(pos)
+            self._mark_changed(positions=True)
+            trade_index.get_index().record(self, pos)
+            self.paper_book.add(self, pos, self.symbol_tokens.get(symbol, symbol))
             self.log(f"📄 PAPER {type} Order for {symbol} @ {price:.2f}", "SUCCESS")
             # WhatsApp Alert: Order Placed (PAPER)
             if self.wa_alerter:
@@ -793,18 +862,12 @@ class TradingSession:
     def _execute_live_order(self, pos, symbol, order_type, qty, price, retry_count=0):
         """Execute a live order on Angel One with retry and re-auth logic"""
         try:
-            # Rate limit protection - wait between order attempts
-            if retry_count > 0:
-                delay = 3 * retry_count  # 3s, 6s delays
-                self.log(f"⏳ Waiting {delay}s before retry to avoid rate limits...", "INFO")
-                time.sleep(delay)
-            
             # Validate symbol token exists
             token = self.symbol_tokens.get(symbol)
-            self.log(f"🔍 Token lookup for {symbol}: {token}", "DEBUG")
+            self.log("🔍 Token lookup for {}: {}", "DEBUG", symbol, token)
             if not token:
                 self.log(f"❌ LIVE ORDER BLOCKED: No symbol token for {symbol}. Check token mapping.", "ERROR")
-                self.log(f"Available tokens: {list(self.symbol_tokens.keys())}", "DEBUG")
+                self.log("Available tokens: {}", "DEBUG", list(self.symbol_tokens.keys()))
                 return False
             
             # Clean trading symbol (remove -EQ suffix)
@@ -843,7 +906,7 @@ class TradingSession:
             except Exception as sdk_error:
                 self.log(f"⚠️ SDK placeOrder exception: {sdk_error}", "WARNING")
             
-            self.log(f"📥 Angel API Response: {response}", "DEBUG")
+            self.log("📥 Angel API Response: {}", "DEBUG", response)
             
             # If SDK returns None, try direct HTTP API call
             if response is None:
@@ -892,6 +955,7 @@ class TradingSession:
                     if actual_fill_price and actual_fill_price > 0:
                         old_price = pos['entry']
                         pos['entry'] = round(actual_fill_price, 2)
+                        self._mark_changed()
                         
                         # Recalculate TP/SL based on actual entry price if needed
                         # (Keeping original TP/SL levels as they were calculated 
@@ -904,8 +968,6 @@ class TradingSession:
                     # =====================================================
                     # PLACE SL-M AND TARGET ORDERS AFTER SUCCESSFUL ENTRY
                     # =====================================================
-                    time.sleep(0.5)  # Small delay to avoid rate limiting
-                    
                     # Place SL-M Order (Stop Loss Market)
                     sl_order_id = self._place_sl_order(pos, symbol, token, trading_symbol, order_type, qty)
                     if sl_order_id:
@@ -914,8 +976,6 @@ class TradingSession:
                     else:
                         self.log(f"⚠️ Failed to place SL order - Position unprotected!", "WARNING")
                     
-                    time.sleep(0.3)  # Small delay between orders
-                    
                     # Place Target Limit Order
                     tp_order_id = self._place_tp_order(pos, symbol, token, trading_symbol, order_type, qty)
                     if tp_order_id:
@@ -950,6 +1010,7 @@ class TradingSession:
                 if actual_fill_price and actual_fill_price > 0:
                     old_price = pos['entry']
                     pos['entry'] = round(actual_fill_price, 2)
+                    self._mark_changed()
                     self.log(f"📊 Entry Price Updated: Signal={old_price:.2f} → Actual={pos['entry']:.2f}", "INFO")
                 else:
                     self.log(f"⚠️ Could not fetch fill price, using signal price: {pos['entry']:.2f}", "WARNING")
@@ -957,8 +1018,6 @@ class TradingSession:
                 # =====================================================
                 # PLACE SL-M AND TARGET ORDERS AFTER SUCCESSFUL ENTRY
                 # =====================================================
-                time.sleep(0.5)  # Small delay to avoid rate limiting
-                
                 # Place SL-M Order (Stop Loss Market)
                 sl_order_id = self._place_sl_order(pos, symbol, token, trading_symbol, order_type, qty)
                 if sl_order_id:
@@ -967,8 +1026,6 @@ class TradingSession:
                 else:
                     self.log(f"⚠️ Failed to place SL order - Position unprotected!", "WARNING")
                 
-                time.sleep(0.3)  # Small delay between orders
-                
                 # Place Target Limit Order
                 tp_order_id = self._place_tp_order(pos, symbol, token, trading_symbol, order_type, qty)
                 if tp_order_id:
@@ -985,7 +1042,7 @@ class TradingSession:
         except Exception as e:
             import traceback
             self.log(f"❌ Order Exception: {e}", "ERROR")
-            self.log(f"Traceback: {traceback.format_exc()}", "DEBUG")
+            self.log("Traceback: {}", "DEBUG", traceback.format_exc())
             return False
 
     def _get_current_token(self):
@@ -1027,14 +1084,14 @@ class TradingSession:
                                         return price
                             else:
                                 # Order not yet filled, wait and retry
-                                self.log(f"📊 Order {order_id} status: {status}, waiting...", "DEBUG")
+                                self.log("📊 Order {} status: {}, waiting...", "DEBUG", order_id, status)
                 
                 # Wait before retry
                 if attempt < max_retries - 1:
                     time.sleep(0.5)
                     
             except Exception as e:
-                self.log(f"⚠️ Error fetching entry fill price (attempt {attempt+1}): {e}", "DEBUG")
+                self.log("⚠️ Error fetching entry fill price (attempt {}): {}", "DEBUG", attempt+1, e)
                 if attempt < max_retries - 1:
                     time.sleep(0.5)
         
@@ -1066,10 +1123,10 @@ class TradingSession:
                 "quantity": str(qty)
             }
             
-            self.log(f"📤 Placing SL-M Order: {order_params}", "DEBUG")
+            self.log("📤 Placing SL-M Order: {}", "DEBUG", order_params)
             
             response = self.smartApi.placeOrder(order_params)
-            self.log(f"📥 SL-M API Response: {response}", "DEBUG")
+            self.log("📥 SL-M API Response: {}", "DEBUG", response)
             
             if response is None:
                 return None
@@ -1114,10 +1171,10 @@ class TradingSession:
                 "quantity": str(qty)
             }
             
-            self.log(f"📤 Placing TP LIMIT Order: {order_params}", "DEBUG")
+            self.log("📤 Placing TP LIMIT Order: {}", "DEBUG", order_params)
             
             response = self.smartApi.placeOrder(order_params)
-            self.log(f"📥 TP LIMIT API Response: {response}", "DEBUG")
+            self.log("📥 TP LIMIT API Response: {}", "DEBUG", response)
             
             if response is None:
                 return None
@@ -1144,8 +1201,6 @@ class TradingSession:
         This bypasses the SDK to get actual error messages
         """
         try:
-            import requests as req
-            
             # Get fresh token if requested or use current
             current_token = self._get_current_token()
             
@@ -1167,12 +1222,14 @@ class TradingSession:
                 "X-PrivateKey": self.credentials.get('apiKey', '')
             }
             
-            self.log(f"📡 Direct API call with token: {current_token[:20]}...", "DEBUG")
+            self.log("📡 Direct API call with token: {}...", "DEBUG", current_token[:20])
             
-            resp = req.post(url, json=order_params, headers=headers, timeout=30)
+            # Same per-account order bucket as the SDK path; pooled keep-alive connection (warmed at login)
+            broker_gateway.get_gateway().acquire(self.credentials.get('clientCode'), "orders", broker_gateway.LIVE)
+            resp = http_client.post("orders", url, json=order_params, headers=headers)
             
-            self.log(f"📥 Direct API Status: {resp.status_code}", "DEBUG")
-            self.log(f"📥 Direct API Response: {resp.text}", "DEBUG")
+            self.log("📥 Direct API Status: {}", "DEBUG", resp.status_code)
+            self.log("📥 Direct API Response: {}", "DEBUG", resp.text)
             
             if resp.status_code == 200:
                 json_resp = resp.json()
@@ -1195,26 +1252,18 @@ class TradingSession:
             return None
 
     def _refresh_session(self):
-        """Re-authenticate with Angel One to get fresh tokens"""
+        """Get fresh tokens from the shared broker session (refresh token first, re-login as fallback)"""
         try:
-            api_key = self.credentials.get('apiKey')
-            client_code = self.credentials.get('clientCode')
-            access_token = self.credentials.get('accessToken')
-            
             self.log("🔐 Attempting to refresh Angel One session...", "INFO")
-            
-            # With OAuth, the engine cannot generate a new session via TOTP/Password.
-            # The backend should push a new token if expired, or we just rely on it.
-            if not access_token:
-                self.log("❌ Cannot refresh: No OAuth access token", "ERROR")
-                return False
-                
-            self.smartApi = SmartConnect(api_key=api_key)
-            self.smartApi.access_token = access_token
-            self.auth_token = access_token
-            self.feed_token = "mock_feed_token_if_oauth"
-            self.log("✅ Session restored with OAuth token", "SUCCESS")
+            broker = broker_sessions.get_cache().refresh(self.credentials)
+            self.smartApi = broker.smart_api
+            self.auth_token = broker.auth_token
+            self.feed_token = broker.feed_token
+            self.log("✅ Session refreshed", "SUCCESS")
             return True
+        except broker_sessions.BrokerLoginError as e:
+            self.log(f"❌ Cannot refresh: {e}", "ERROR")
+            return False
         except Exception as e:
             self.log(f"❌ Session refresh exception: {e}", "ERROR")
             return False
@@ -1224,7 +1273,8 @@ class TradingSession:
     def _persist_trade_to_db(self, pos, exit_reason=None):
         """
         Centralized method to persist a closed trade to the Node.js backend DB.
-        Includes retry logic to prevent data loss.
+        Writes to the local durable outbox only; delivery (batched, retried,
+        idempotent) happens on the outbox sender thread.
         """
         payload = {
             "user_id": self.user_id,
@@ -1237,7 +1287,7 @@ class TradingSession:
             "sl": pos.get('sl', 0),
             "pnl": round(pos.get('pnl', 0), 2),
             "status": "COMPLETED",
-            "date": pos.get('date', datetime.date.today().strftime('%Y-%m-%d')),
+            "date": pos.get('date', self.clock.today().key),
             "time": pos.get('time', self._get_ist_time().strftime("%H:%M:%S")),
             "trade_mode": self.mode,
             "strategy": self.strategy_name.upper()
@@ -1245,46 +1295,42 @@ class TradingSession:
         if exit_reason:
             payload["exit_reason"] = exit_reason
 
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                resp = requests.post(
-                    f'{BACKEND_URL}/webhook/save_trade',
-                    json=payload,
-                    timeout=5
-                )
-                if resp.status_code == 200:
-                    resp_data = resp.json()
-                    if resp_data.get('status') == 'success':
-                        self.log(f"✅ Trade {pos['symbol']} saved to DB (PnL: ₹{pos.get('pnl', 0):.2f})", "SUCCESS")
-                        return True
-                    else:
-                        self.log(f"⚠️ DB save returned non-success: {resp_data}", "WARNING")
-                else:
-                    self.log(f"⚠️ DB save HTTP {resp.status_code}: {resp.text[:200]}", "WARNING")
-            except requests.exceptions.ConnectionError as e:
-                self.log(f"❌ DB sync connection error (attempt {attempt+1}/{max_retries}): {e}", "ERROR")
-            except requests.exceptions.Timeout:
-                self.log(f"❌ DB sync timeout (attempt {attempt+1}/{max_retries})", "ERROR")
-            except Exception as e:
-                self.log(f"❌ DB sync error (attempt {attempt+1}/{max_retries}): {e}", "ERROR")
-            
-            if attempt < max_retries - 1:
-                time.sleep(1)  # Wait before retry
-        
-        self.log(f"🚨 CRITICAL: Failed to save trade {pos['symbol']} to DB after {max_retries} attempts! Trade data may be lost.", "ERROR")
-        self.log(f"🚨 Trade payload: {payload}", "ERROR")
-        return False
+        # Same position → same key, so a repeated close never double-books
+        key = pos.setdefault('trade_key', uuid.uuid4().hex)
+        try:
+            trade_outbox.get_outbox().enqueue(key, payload)
+            self.log(f"✅ Trade {pos['symbol']} queued for DB (PnL: ₹{pos.get('pnl', 0):.2f})", "SUCCESS")
+            return True
+        except Exception as e:
+            self.log(f"🚨 CRITICAL: Failed to queue trade {pos['symbol']} for DB: {e}", "ERROR")
+            self.log(f"🚨 Trade payload: {payload}", "ERROR")
+            return False
 
-    def _close_position(self, pos, price, reason):
-        pos['status'] = "CLOSED"
-        pos['exit'] = price
-        if pos['type'] == 'BUY':
-            pos['pnl'] = (price - pos['entry']) * pos['qty']
-        else:
-            pos['pnl'] = (pos['entry'] - price) * pos['qty']
-        
-        self.pnl += pos['pnl']
+    def _claim_close(self, pos, price):
+        """
+        Mark an OPEN position CLOSED at `price` and book its PnL, once.
+        Returns False if another exit path already closed it.
+        """
+        with self._close_lock:
+            if pos['status'] != 'OPEN':
+                return False
+            pos['status'] = "CLOSED"
+            pos['exit'] = price
+            if pos['type'] == 'BUY':
+                pos['pnl'] = (price - pos['entry']) * pos['qty']
+            else:
+                pos['pnl'] = (pos['entry'] - price) * pos['qty']
+            self.pnl += pos['pnl']
+        return True
+
+    def _close_position(self, pos, price, reason, place_exit=True):
+        """Close a position (TP/SL, manual or square-off); returns False if it was already closed"""
+        if not self._claim_close(pos, price):
+            return False
+        self._mark_changed(positions=True)
+        trade_index.get_index().record(self, pos)
+        if self.mode != 'LIVE':
+            self.paper_book.remove(pos, self.symbol_tokens.get(pos['symbol'], pos['symbol']))
         self.log(f"Closed {pos['symbol']} ({reason}) PnL: {pos['pnl']:.2f}", "INFO" if pos['pnl'] > 0 else "WARNING")
         
         # ----------------------------------------------------
@@ -1305,12 +1351,34 @@ class TradingSession:
                 self.wa_alerter.trade_closed(pos['symbol'], reason, pos['pnl'], self.mode)
 
         # Real Order Exit (Close position on Angel One)
-        if self.mode == "LIVE":
+        if self.mode == "LIVE" and place_exit:
             # Cancel pending SL and TP orders first (prevent double execution)
             self._cancel_pending_orders(pos)
             self._execute_exit_order(pos)
+        return True
 
-    def _execute_exit_order(self, pos, retry_count=0):
+    async def _square_off(self, pos, reason, broker_positions=None):
+        """
+        Bulk square-off exit (run concurrently across positions by square_off.py):
+        book the close, cancel SL and TP together, then place the exit order.
+        `broker_positions` is the account's position book fetched once for the run.
+        Returns None if the position was closed by another path (TP/SL, OCO, manual).
+        """
+        ltp = self._ltp(pos['symbol'], pos['entry'])
+        if not await engine_loop.run_blocking(self._close_position, pos, ltp, reason, place_exit=False):
+            return None
+        if self.mode != "LIVE":
+            return True
+
+        cancels = [(key, variety) for key, variety in (('sl_order_id', "STOPLOSS"), ('tp_order_id', "NORMAL")) if pos.get(key)]
+        await asyncio.gather(*(
+            engine_loop.run_blocking(self._cancel_order, pos[key], variety, pos['symbol']) for key, variety in cancels
+        ))
+        for key, _ in cancels:
+            pos[key] = None
+        return await engine_loop.run_blocking(self._execute_exit_order, pos, broker_positions=broker_positions)
+
+    def _execute_exit_order(self, pos, retry_count=0, broker_positions=None):
         """Execute an exit order on Angel One"""
         try:
             token = self.symbol_tokens.get(pos['symbol'])
@@ -1323,7 +1391,7 @@ class TradingSession:
             # Check if position actually exists at broker before exit
             # Prevents reverse position if user already manually exited
             # =====================================================
-            if not self._verify_position_exists_at_broker(pos['symbol']):
+            if not self._verify_position_exists_at_broker(pos['symbol'], broker_positions):
                 self.log(f"⚠️ EXIT BLOCKED: Position {pos['symbol']} not found at broker (already closed?)", "WARNING")
                 self.log(f"📝 Skipping exit order to prevent reverse position", "INFO")
                 return False  # Don't place exit - position doesn't exist
@@ -1361,13 +1429,13 @@ class TradingSession:
             self.log(f"📤 Placing EXIT ORDER: {order_params}", "INFO")
             
             response = self.smartApi.placeOrder(order_params)
-            self.log(f"📥 Exit API Response: {response}", "DEBUG")
+            self.log("📥 Exit API Response: {}", "DEBUG", response)
             
             if response is None:
                 if retry_count < 2:
                     self.log(f"⚠️ Exit API returned None. Attempting re-auth...", "WARNING")
                     if self._refresh_session():
-                        return self._execute_exit_order(pos, retry_count + 1)
+                        return self._execute_exit_order(pos, retry_count + 1, broker_positions)
                 self.log(f"❌ Exit Order Failed: API returned None", "ERROR")
                 return False
             
@@ -1383,7 +1451,7 @@ class TradingSession:
                     
                     if error_code in ['AB1010', 'AB1004', 'AG8002'] and retry_count < 2:
                         if self._refresh_session():
-                            return self._execute_exit_order(pos, retry_count + 1)
+                            return self._execute_exit_order(pos, retry_count + 1, broker_positions)
                     return False
             elif isinstance(response, str):
                 self.log(f"✅ EXIT ORDER PLACED: {response}", "SUCCESS")
@@ -1420,10 +1488,10 @@ class TradingSession:
                 "orderid": str(order_id)
             }
             
-            self.log(f"📤 Cancelling Order: {order_id}", "DEBUG")
+            self.log("📤 Cancelling Order: {}", "DEBUG", order_id)
             
             response = self.smartApi.cancelOrder(order_id, variety)
-            self.log(f"📥 Cancel API Response: {response}", "DEBUG")
+            self.log("📥 Cancel API Response: {}", "DEBUG", response)
             
             if response is None:
                 self.log(f"⚠️ Cancel order returned None for {order_id}", "WARNING")
@@ -1451,88 +1519,85 @@ class TradingSession:
     # =========================================================================
     
     def _start_oco_monitor(self):
-        """Start background thread to monitor OCO order pairs"""
-        self.oco_monitor_thread = threading.Thread(target=self._oco_monitor_loop, daemon=True)
-        self.oco_monitor_thread.start()
+        """Start the OCO monitor coroutine on the engine loop"""
+        self._oco_task = engine_loop.submit(self._oco_monitor_loop())
         self.log("🔄 OCO Monitor Started - Will track TP/SL order fills", "INFO")
     
-    def _oco_monitor_loop(self):
-        """Background loop that checks order statuses and implements OCO logic"""
+    async def _oco_monitor_loop(self):
+        """Timer that checks order statuses every 5s and implements OCO logic"""
         sync_counter = 0  # For less frequent position sync
         
         while self.active and not self.stop_event.is_set():
             try:
                 # Check every 5 seconds
-                time.sleep(5)
+                await asyncio.sleep(5)
                 
                 if not self.smartApi:
                     continue
                 
                 sync_counter += 1
-                
-                # =====================================================
-                # LAYER 1: POSITION SYNC (Every 30 seconds)
-                # Detect if user manually exited from broker app
-                # =====================================================
-                if sync_counter >= 6:  # 6 * 5 seconds = 30 seconds
+                # LAYER 1 position sync every 30 seconds (6 * 5s)
+                sync_positions = sync_counter >= 6
+                if sync_positions:
                     sync_counter = 0
-                    self._sync_with_broker_positions()
-                
-                # Get all open positions with pending TP/SL orders
-                for pos in self.positions:
-                    if pos['status'] != 'OPEN':
-                        continue
-                    
-                    tp_order_id = pos.get('tp_order_id')
-                    sl_order_id = pos.get('sl_order_id')
-                    
-                    # Skip if no TP/SL orders placed
-                    if not tp_order_id and not sl_order_id:
-                        continue
-                    
-                    # Check TP order status
-                    if tp_order_id:
-                        tp_status = self._get_order_status(tp_order_id)
-                        if tp_status in ['complete', 'filled', 'traded']:
-                            # TP HIT! Cancel SL order (OCO logic)
-                            self.log(f"🎯 TP ORDER FILLED for {pos['symbol']} - Cancelling SL order", "SUCCESS")
-                            if sl_order_id:
-                                self._cancel_order(sl_order_id, "STOPLOSS", pos['symbol'])
-                                pos['sl_order_id'] = None
-                            
-                            # Get actual fill price from TP order
-                            fill_price = self._get_order_fill_price(tp_order_id)
-                            if fill_price:
-                                self._close_position_oco(pos, fill_price, "TARGET_HIT")
-                            else:
-                                self._close_position_oco(pos, pos['tp'], "TARGET_HIT")
-                            
-                            pos['tp_order_id'] = None
-                            continue
-                    
-                    # Check SL order status
-                    if sl_order_id:
-                        sl_status = self._get_order_status(sl_order_id)
-                        if sl_status in ['complete', 'filled', 'traded', 'triggered']:
-                            # SL HIT! Cancel TP order (OCO logic)
-                            self.log(f"🛡️ SL ORDER TRIGGERED for {pos['symbol']} - Cancelling TP order", "WARNING")
-                            if tp_order_id:
-                                self._cancel_order(tp_order_id, "NORMAL", pos['symbol'])
-                                pos['tp_order_id'] = None
-                            
-                            # Get actual fill price from SL order
-                            fill_price = self._get_order_fill_price(sl_order_id)
-                            if fill_price:
-                                self._close_position_oco(pos, fill_price, "SL_HIT")
-                            else:
-                                self._close_position_oco(pos, pos['sl'], "SL_HIT")
-                            
-                            pos['sl_order_id'] = None
-                            continue
+                await engine_loop.run_blocking(self._oco_check, sync_positions)
                             
             except Exception as e:
                 self.log(f"⚠️ OCO Monitor Error: {e}", "WARNING")
-                time.sleep(10)  # Wait longer on error
+                await asyncio.sleep(10)  # Wait longer on error
+    
+    def _oco_check(self, sync_positions):
+        """One OCO pass: broker position sync (if due), then TP/SL order fills"""
+        # =====================================================
+        # LAYER 1: POSITION SYNC (Every 30 seconds)
+        # Detect if user manually exited from broker app
+        # =====================================================
+        if sync_positions:
+            self._sync_with_broker_positions()
+        
+        # Get all open positions with pending TP/SL orders
+        for pos in self.positions:
+            if pos['status'] != 'OPEN':
+                continue
+
+            tp_order_id = pos.get('tp_order_id')
+            sl_order_id = pos.get('sl_order_id')
+
+            # Skip if no TP/SL orders placed
+            if not tp_order_id and not sl_order_id:
+                continue
+
+            # Check TP order status
+            if tp_order_id:
+                tp_status = self._get_order_status(tp_order_id)
+                if tp_status in ['complete', 'filled', 'traded']:
+                    # TP HIT! Book the fill, then cancel SL order (OCO logic)
+                    fill_price = self._get_order_fill_price(tp_order_id)
+                    if not self._close_position_oco(pos, fill_price or pos['tp'], "TARGET_HIT"):
+                        continue   # Already closed (and its orders handled) by another exit path
+                    self.log(f"🎯 TP ORDER FILLED for {pos['symbol']} - Cancelling SL order", "SUCCESS")
+                    if sl_order_id:
+                        self._cancel_order(sl_order_id, "STOPLOSS", pos['symbol'])
+                        pos['sl_order_id'] = None
+
+                    pos['tp_order_id'] = None
+                    continue
+
+            # Check SL order status
+            if sl_order_id:
+                sl_status = self._get_order_status(sl_order_id)
+                if sl_status in ['complete', 'filled', 'traded', 'triggered']:
+                    # SL HIT! Book the fill, then cancel TP order (OCO logic)
+                    fill_price = self._get_order_fill_price(sl_order_id)
+                    if not self._close_position_oco(pos, fill_price or pos['sl'], "SL_HIT"):
+                        continue   # Already closed (and its orders handled) by another exit path
+                    self.log(f"🛡️ SL ORDER TRIGGERED for {pos['symbol']} - Cancelling TP order", "WARNING")
+                    if tp_order_id:
+                        self._cancel_order(tp_order_id, "NORMAL", pos['symbol'])
+                        pos['tp_order_id'] = None
+
+                    pos['sl_order_id'] = None
+                    continue
     
     def _sync_with_broker_positions(self):
         """
@@ -1579,8 +1644,12 @@ class TradingSession:
                 
                 if not position_exists:
                     # Position was manually closed by user from broker app!
+                    # Mark as closed with LTP (or entry as fallback)
+                    ltp = self._ltp(symbol, pos['entry'])
+                    if not self._close_position_manual(pos, ltp, "MANUAL_EXIT_BROKER"):
+                        continue   # Closed by another exit path meanwhile
                     self.log(f"🔍 MANUAL EXIT DETECTED: {symbol} not found in broker positions", "WARNING")
-                    self.log(f"📝 Marking position as CLOSED (no exit order will be placed)", "INFO")
+                    self.log(f"📝 Marked position as CLOSED (no exit order will be placed)", "INFO")
                     
                     # Cancel any pending TP/SL orders
                     if pos.get('sl_order_id'):
@@ -1590,39 +1659,37 @@ class TradingSession:
                         self._cancel_order(pos['tp_order_id'], "NORMAL", symbol)
                         pos['tp_order_id'] = None
                     
-                    # Mark as closed with LTP (or entry as fallback)
-                    ltp = self.ltp_cache.get(symbol, pos['entry'])
-                    self._close_position_manual(pos, ltp, "MANUAL_EXIT_BROKER")
-                    
         except Exception as e:
-            self.log(f"⚠️ Position Sync Error: {e}", "DEBUG")
+            self.log("⚠️ Position Sync Error: {}", "DEBUG", e)
     
     def _close_position_manual(self, pos, exit_price, reason):
         """
         Close a position that was manually exited from broker.
         Does NOT place any exit order (position already closed at broker).
+        Returns False if it was already closed.
         """
-        pos['status'] = "CLOSED"
-        pos['exit'] = exit_price
-        if pos['type'] == 'BUY':
-            pos['pnl'] = (exit_price - pos['entry']) * pos['qty']
-        else:
-            pos['pnl'] = (pos['entry'] - exit_price) * pos['qty']
-        
-        self.pnl += pos['pnl']
+        if not self._claim_close(pos, exit_price):
+            return False
+        self._mark_changed(positions=True)
+        trade_index.get_index().record(self, pos)
+        if self.mode != 'LIVE':
+            self.paper_book.remove(pos, self.symbol_tokens.get(pos['symbol'], pos['symbol']))
         self.log(f"🔄 Position {pos['symbol']} marked CLOSED ({reason}) | Approx PnL: ₹{pos['pnl']:.2f}", "INFO")
         
         # Persist to backend DB
         self._persist_trade_to_db(pos, exit_reason=reason)
+        return True
     
-    def _verify_position_exists_at_broker(self, symbol):
+    def _verify_position_exists_at_broker(self, symbol, broker_positions=None):
         """
         LAYER 3: Pre-Exit Validation
         Check if position actually exists at broker before placing exit order.
         Returns True if position exists, False if not (or on error).
+        `broker_positions` reuses an already fetched position book.
         """
         try:
-            broker_positions = self.smartApi.position()
+            if broker_positions is None:
+                broker_positions = self.smartApi.position()
             
             if not broker_positions or broker_positions.get('status') != True:
                 # Can't verify - assume position exists to be safe
@@ -1649,7 +1716,7 @@ class TradingSession:
             return False  # Position not found at broker
             
         except Exception as e:
-            self.log(f"⚠️ Error verifying broker position: {e}", "DEBUG")
+            self.log("⚠️ Error verifying broker position: {}", "DEBUG", e)
             # On error, assume position exists to prevent blocking legitimate exits
             return True
     
@@ -1667,7 +1734,7 @@ class TradingSession:
             
             return None
         except Exception as e:
-            self.log(f"⚠️ Error fetching order status for {order_id}: {e}", "DEBUG")
+            self.log("⚠️ Error fetching order status for {}: {}", "DEBUG", order_id, e)
             return None
     
     def _get_order_fill_price(self, order_id):
@@ -1689,26 +1756,40 @@ class TradingSession:
             
             return None
         except Exception as e:
-            self.log(f"⚠️ Error fetching fill price for {order_id}: {e}", "DEBUG")
+            self.log("⚠️ Error fetching fill price for {}: {}", "DEBUG", order_id, e)
             return None
     
     def _close_position_oco(self, pos, exit_price, reason):
         """Close position when OCO order fills (no need to place exit - already filled by TP/SL order)"""
-        pos['status'] = "CLOSED"
-        pos['exit'] = exit_price
-        if pos['type'] == 'BUY':
-            pos['pnl'] = (exit_price - pos['entry']) * pos['qty']
-        else:
-            pos['pnl'] = (pos['entry'] - exit_price) * pos['qty']
-        
-        self.pnl += pos['pnl']
+        if not self._claim_close(pos, exit_price):
+            return False
+        self._mark_changed(positions=True)
+        trade_index.get_index().record(self, pos)
         pnl_emoji = "💰" if pos['pnl'] > 0 else "📉"
         self.log(f"{pnl_emoji} Closed {pos['symbol']} ({reason}) @ {exit_price:.2f} | PnL: ₹{pos['pnl']:.2f}", 
                  "SUCCESS" if pos['pnl'] > 0 else "WARNING")
         
         # Persist to backend DB
         self._persist_trade_to_db(pos)
-    def _run_polling_loop(self):
+        return True
+
+    def _poll_symbol(self, symbol):
+        """Fetch one LTP over REST and process it like a tick"""
+        token = self.symbol_tokens.get(symbol)
+        if not token: return
+        
+        # Fetch LTP
+        ltp_data = self.smartApi.ltpData("NSE", symbol.replace("-EQ", ""), token)
+        if ltp_data and ltp_data.get('data'):
+            ltp = float(ltp_data['data']['ltp'])
+            self.prices.update(token, ltp)
+            self._ticked.add(symbol)
+            self._update_position_pnl(symbol, ltp)
+            
+            if symbol in self.orb_levels:
+                self._check_signal(symbol, ltp)
+
+    async def _run_polling_loop(self):
         """Fallback polling mode if WebSocket fails"""
         symbols = self.config.get('symbols', [])
         
@@ -1716,25 +1797,13 @@ class TradingSession:
             try:
                 for symbol in symbols:
                     if self.stop_event.is_set(): break
-                    
-                    token = self.symbol_tokens.get(symbol)
-                    if not token: continue
-                    
-                    # Fetch LTP
-                    ltp_data = self.smartApi.ltpData("NSE", symbol.replace("-EQ", ""), token)
-                    if ltp_data and ltp_data.get('data'):
-                        ltp = float(ltp_data['data']['ltp'])
-                        self.ltp_cache[symbol] = ltp
-                        self._update_position_pnl(symbol, ltp)
-                        
-                        if symbol in self.orb_levels:
-                            self._check_signal(symbol, ltp)
+                    await engine_loop.run_blocking(self._poll_symbol, symbol)
                 
                 # Poll every 5 seconds in fallback mode
-                self.stop_event.wait(5)
+                await asyncio.sleep(5)
             except Exception as e:
                 self.log(f"Polling Error: {e}", "ERROR")
-                time.sleep(5)
+                await asyncio.sleep(5)
 
     def stop(self):
         self.active = False
@@ -1747,8 +1816,9 @@ class TradingSession:
             except:
                 pass
         
-        if self.thread:
-            self.thread.join(timeout=5)
+        # Cancel lifecycle / OCO / reconnect coroutines (wakes any pending sleep)
+        for task in (self._task, self._oco_task, self._reconnect_task):
+            engine_loop.cancel(task)
         
         self.log("Session Stopped", "WARNING")
         
@@ -1757,30 +1827,68 @@ class TradingSession:
             closed_count = len([t for t in self.trades_history if t.get('status') == 'CLOSED'])
             self.wa_alerter.session_stopped(self.pnl, closed_count)
 
-    def get_state(self):
+    def _mark_changed(self, positions=False):
+        """Record a state change; `positions` when a position opened or closed"""
+        self.state_version += 1
+        if positions:
+            self._positions_version += 1
+
+    def state_etag(self, since=None, compact=False):
+        """
+        Changes whenever anything in get_state() could have changed, except
+        the full view's LTPs of symbols without an open position (those
+        stream through the tick publisher). The representation (`compact`,
+        log cursor `since`) is part of the tag, so a client switching
+        between them never gets a 304 for the other one.
+        """
+        view = f"{'c' if compact else 'f'}{'' if since is None else since}"
+        return f'"{self.state_version}.{self.log_seq}.{int(self.active)}.{view}"'
+
+    def _refresh_views(self):
+        # Open / closed lists only change on fills, not on every poll
+        if self._views_version != self._positions_version:
+            self._views_version = self._positions_version
+            self._open_view = [p for p in self.positions if p['status'] == 'OPEN']
+            self._open_symbols = {p['symbol'] for p in self._open_view}
+            self._closed_view = [t for t in self.trades_history if t.get('status') == 'CLOSED']
+
+    def get_state(self, since=None, compact=False):
+        """
+        Session state for status polling. `since` limits logs to new lines;
+        `compact` leaves out config, the closed-trade history and LTPs of
+        symbols without an open position.
+        """
+        self._refresh_views()
+        open_positions = self._open_view
         # Calculate live unrealized P&L from open positions
-        open_positions = [p for p in self.positions if p['status'] == 'OPEN']
-        unrealized_pnl = sum(p.get('pnl', 0) for p in open_positions)
+        unrealized_pnl = self._open_pnl(open_positions)
         
         # Total P&L = realized (closed) + unrealized (open)
         total_pnl = self.pnl + unrealized_pnl
         
-        # Order Book should only show CLOSED trades
-        closed_trades = [t for t in self.trades_history if t.get('status') == 'CLOSED']
-        
-        return {
+        state = {
             "active": self.active,
             "mode": self.mode,
+            "version": self.state_etag(since, compact),
             "pnl": round(total_pnl, 2),  # Live total P&L
             "realized_pnl": round(self.pnl, 2),
             "unrealized_pnl": round(unrealized_pnl, 2),
             "positions": open_positions,
-            "trades_history": closed_trades,  # Order Book - only CLOSED trades
-            "logs": self.logs,
+            "logs": self.get_logs(since),
+            "log_cursor": self.log_seq,
+        }
+        if compact:
+            state["trades_count"] = len(self._closed_view)
+            state["ltp"] = {p['symbol']: self._ltp(p['symbol']) for p in open_positions}
+            return state
+        
+        state.update({
+            "trades_history": self._closed_view,  # Order Book - only CLOSED trades
             "config": self.config,
             "orb_levels": getattr(self.strategy, 'orb_levels', {}) if self.strategy else {},
-            "ltp": self.ltp_cache
-        }
+            "ltp": self._ltp_map(self._ticked)
+        })
+        return state
 
     def update_position(self, position_id, new_tp=None, new_sl=None):
         """Update TP/SL for an open position - modifies Angel One orders in LIVE mode"""
@@ -1794,6 +1902,9 @@ class TradingSession:
                     p['tp'] = round(float(new_tp), 2)
                 if new_sl is not None:
                     p['sl'] = round(float(new_sl), 2)
+                self._mark_changed()
+                if self.mode != "LIVE":
+                    self.paper_book.add(self, p, self.symbol_tokens.get(p['symbol'], p['symbol']))
                 
                 # In LIVE mode, modify the actual pending orders on Angel One
                 if self.mode == "LIVE":
@@ -1866,10 +1977,10 @@ class TradingSession:
             if new_trigger and new_trigger > 0:
                 modify_params["triggerprice"] = str(new_trigger)
             
-            self.log(f"📤 Modifying Order: {modify_params}", "DEBUG")
+            self.log("📤 Modifying Order: {}", "DEBUG", modify_params)
             
             response = self.smartApi.modifyOrder(modify_params)
-            self.log(f"📥 Modify API Response: {response}", "DEBUG")
+            self.log("📥 Modify API Response: {}", "DEBUG", response)
             
             if response is None:
                 return False
@@ -1888,9 +1999,8 @@ class TradingSession:
         """Manually exit a position"""
         for p in self.positions:
             if str(p['id']) == str(position_id) and p['status'] == 'OPEN':
-                ltp = self.ltp_cache.get(p['symbol'], p['entry'])
-                self._close_position(p, ltp, "MANUAL")
-                return True
+                ltp = self._ltp(p['symbol'], p['entry'])
+                return self._close_position(p, ltp, "MANUAL")
         return False
 
     def dismiss_position(self, position_id):
@@ -1902,6 +2012,11 @@ class TradingSession:
             if str(p['id']) == str(position_id):
                 self.log(f"🗑️ Dismissing position {p['symbol']} (ID: {position_id}) - NO exit order placed", "INFO")
                 
+                # Mark as closed with LTP (unknown actual exit)
+                ltp = self._ltp(p['symbol'], p['entry'])
+                if not self._close_position_manual(p, ltp, "DISMISSED_BY_USER"):
+                    return True   # Already closed; its orders were handled by that exit
+                
                 # Cancel any pending TP/SL orders
                 if self.mode == "LIVE":
                     if p.get('sl_order_id'):
@@ -1910,10 +2025,6 @@ class TradingSession:
                     if p.get('tp_order_id'):
                         self._cancel_order(p['tp_order_id'], "NORMAL", p['symbol'])
                         p['tp_order_id'] = None
-                
-                # Mark as closed with entry price (unknown actual exit)
-                ltp = self.ltp_cache.get(p['symbol'], p['entry'])
-                self._close_position_manual(p, ltp, "DISMISSED_BY_USER")
                 return True
         return False
 
@@ -1933,6 +2044,10 @@ def create_session(user_id, config, creds):
     # Stop old session if it exists but is not active
     if existing:
         existing.stop()
+        trade_index.get_index().drop_user(user_id)
     
     sessions[user_id] = TradingSession(user_id, config, creds)
+    # Live P&L for all sessions goes out through one publisher thread
+    tick_publisher.start_publisher(lambda: list(sessions.values()))
+    square_off.start_square_off(lambda: list(sessions.values()))
     return sessions[user_id]
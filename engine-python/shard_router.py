@@ -0,0 +1,202 @@
+"""
+MerQPrime Shard Router
+Multi-process engine mode: N engine worker processes (main:app), each owning
+the sessions of the users that hash to it, behind a thin front process that
+routes /engine/* calls to the owning shard.
+
+Session state (session_manager.sessions, trade index, tick publisher) is
+per process, so a user must always land on the same worker. Users are
+placed on a consistent-hash ring, so changing the shard count only moves
+~1/N of them. Admin endpoints fan out to every shard and aggregate.
+Requests without a user_id (scanner, health) go to shard 0, which keeps
+scanner progress/results on the process that ran the scan.
+
+Usage:
+    ENGINE_SHARDS=4 python shard_router.py      # front on :5002, workers on :5101..5104
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from starlette.concurrency import run_in_threadpool
+from logzero import logger
+
+import http_client
+
+SHARD_COUNT = int(os.getenv('ENGINE_SHARDS', '1'))
+FRONT_PORT = int(os.getenv('ENGINE_PORT', '5002'))
+SHARD_BASE_PORT = int(os.getenv('ENGINE_SHARD_BASE_PORT', '5101'))
+VNODES = 64
+
+# Headers passed through to/from the shard
+FORWARD_HEADERS = ("content-type", "x-internal-sig", "x-timestamp", "if-none-match")
+RETURN_HEADERS = ("content-type", "etag")
+
+# Endpoints answered by aggregating every shard
+FAN_OUT = {"/engine/all_sessions", "/engine/http_metrics", "/engine/broker_metrics", "/engine/loop_metrics",
+           "/engine/compute_metrics", "/engine/square_off", "/engine/paper_matching"}
+FAN_OUT_POST = {"/engine/kill_switch"}
+
+
+class HashRing:
+    """Consistent-hash ring of shards with virtual nodes."""
+
+    def __init__(self, shards, vnodes=VNODES):
+        self.shards = list(shards)
+        points = sorted((self._hash(f"{shard}#{v}"), shard) for shard in self.shards for v in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+    def owner(self, user_id):
+        i = bisect.bisect(self._keys, self._hash(user_id)) % len(self._keys)
+        return self._owners[i]
+
+
+# ═══════════════════════════════════════════
+# ROUTING
+# ═══════════════════════════════════════════
+
+def _user_id(request, body):
+    """user_id from the path (/engine/status/{user_id}), query string or JSON body"""
+    path = request.url.path
+    if path.startswith("/engine/status/"):
+        return path.rsplit("/", 1)[-1]
+    if request.query_params.get("user_id"):
+        return request.query_params["user_id"]
+    if body and "json" in request.headers.get("content-type", ""):
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict) and data.get("user_id"):
+                return str(data["user_id"])
+        except ValueError:
+            pass
+    return None
+
+
+def _forward(shard, method, path, query, headers, body):
+    resp = http_client.session("shards").request(method, f"{shard}{path}", params=query, headers=headers, data=body)
+    out = {k: v for k, v in resp.headers.items() if k.lower() in RETURN_HEADERS}
+    return Response(content=resp.content, status_code=resp.status_code, headers=out)
+
+
+def _merge_all_sessions(results, offset, limit):
+    """Combine per-shard /engine/all_sessions pages: open trades first, then closed (per shard, newest first)"""
+    sessions, open_trades, closed_trades, total = [], [], [], 0
+    summary = {"open_positions": 0, "closed_trades": 0, "realized_pnl": 0.0, "unrealized_pnl": 0.0, "by_mode": {}}
+    for r in results:
+        sessions += r.get("sessions", [])
+        total += r.get("total", 0)
+        for t in r.get("trades", []):
+            (open_trades if t.get("status") == "OPEN" else closed_trades).append(t)
+        s = r.get("summary", {})
+        for key in ("open_positions", "closed_trades", "realized_pnl", "unrealized_pnl"):
+            summary[key] += s.get(key, 0)
+        for mode, counters in s.get("by_mode", {}).items():
+            merged = summary["by_mode"].setdefault(mode, dict.fromkeys(counters, 0))
+            for key, value in counters.items():
+                merged[key] = merged.get(key, 0) + value
+    for key in ("realized_pnl", "unrealized_pnl"):
+        summary[key] = round(summary[key], 2)
+    trades = open_trades + closed_trades
+    trades = trades[offset:offset + limit] if limit is not None else trades[offset:]
+    return {"sessions": sessions, "trades": trades, "total": total, "offset": offset, "limit": limit, "summary": summary}
+
+
+def create_app(shards):
+    """Front FastAPI app routing to the given shard base URLs"""
+    ring = HashRing(shards)
+    fan_out_pool = ThreadPoolExecutor(max_workers=max(len(shards), 1), thread_name_prefix="shard-fanout")
+    app = FastAPI(title="MerQ Engine Router", docs_url=None)
+
+    def _fan_out(path, query, headers, method="GET", body=None):
+        def _call(shard):
+            return http_client.session("shards").request(method, f"{shard}{path}", params=query,
+                                                         headers=headers, data=body).json()
+        return dict(zip(shards, fan_out_pool.map(_call, shards)))
+
+    @app.get("/")
+    def health_check():
+        return {"status": "active", "engine": "python-v1", "shards": len(shards)}
+
+    @app.get("/engine/shard/{user_id}")
+    def shard_for(user_id: str):
+        return {"user_id": user_id, "shard": ring.owner(user_id)}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def route(path: str, request: Request):
+        body = await request.body()
+        headers = {k: v for k, v in request.headers.items() if k.lower() in FORWARD_HEADERS}
+        query = dict(request.query_params)
+        path = request.url.path
+
+        if request.method == "GET" and path in FAN_OUT:
+            if path == "/engine/all_sessions":
+                # Each shard returns its first offset+limit rows; the merged page is cut here
+                offset = int(query.get("offset", 0))
+                limit = int(query["limit"]) if query.get("limit") else None
+                shard_query = {**query, "offset": 0}
+                if limit is not None:
+                    shard_query["limit"] = offset + limit
+                results = await run_in_threadpool(_fan_out, path, shard_query, headers)
+                return _merge_all_sessions(list(results.values()), offset, limit)
+            return {"status": "success", "shards": await run_in_threadpool(_fan_out, path, query, headers)}
+        if request.method == "POST" and path in FAN_OUT_POST:
+            return {"status": "success",
+                    "shards": await run_in_threadpool(_fan_out, path, query, headers, "POST", body)}
+
+        user_id = _user_id(request, body)
+        shard = ring.owner(user_id) if user_id else shards[0]
+        return await run_in_threadpool(_forward, shard, request.method, path, query, headers, body)
+
+    return app
+
+
+# ═══════════════════════════════════════════
+# LAUNCHER
+# ═══════════════════════════════════════════
+
+def spawn_shards(count=SHARD_COUNT, base_port=SHARD_BASE_PORT):
+    """Start `count` engine worker processes; returns (processes, base URLs)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    procs, urls = [], []
+    for i in range(count):
+        port = base_port + i
+        env = {**os.environ, "ENGINE_SHARD_ID": str(i)}
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=here, env=env
+        ))
+        urls.append(f"http://127.0.0.1:{port}")
+        logger.info(f"Engine shard {i} starting on :{port}")
+    return procs, urls
+
+
+def main():
+    procs, urls = spawn_shards()
+    try:
+        uvicorn.run(create_app(urls), host="0.0.0.0", port=FRONT_PORT)
+    finally:
+        for p in procs:
+            p.terminate()
+        deadline = time.time() + 10
+        for p in procs:
+            try:
+                p.wait(timeout=max(deadline - time.time(), 0.1))
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+MerQPrime Bulk Square-Off
+Exits every open position across sessions at once: on the clock at each
+session's square-off time (15:05 IST or the earlier configured stopTime),
+and on demand from the admin kill switch.
+
+The per-tick square-off in _check_signal only ran when a tick for that
+symbol arrived after the cutoff, and every exit was a serial
+cancel-SL / cancel-TP / exit-order chain. Here all positions are exited
+concurrently on the engine loop: each account's broker position book is
+fetched once, a position's SL and TP cancels go out together ahead of its
+exit order, and the per-account broker gateway keeps the order calls
+within that account's rate limit. Each run reports per-position exit
+latency.
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+from logzero import logger
+
+import engine_loop
+import market_clock
+
+RECHECK_SECONDS = float(os.getenv('SQUARE_OFF_RECHECK_SECONDS', '30'))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)] if ordered else 0.0
+
+
+class SquareOff:
+    """Concurrent exit of open positions across sessions, with a clock-driven daily run."""
+
+    def __init__(self, sessions_provider):
+        self.sessions_provider = sessions_provider
+        self.clock = market_clock.get_clock()
+        self.runs = 0
+        self.last_report = None
+        self._task = engine_loop.submit(self._run())
+
+    # ═══════════════════════════════════════════
+    # EXIT RUN
+    # ═══════════════════════════════════════════
+
+    async def _position_books(self, sessions):
+        """One broker position book per LIVE account (fetched concurrently)"""
+        accounts = {}
+        for session in sessions:
+            if session.mode == "LIVE" and session.smartApi:
+                accounts.setdefault(session.credentials.get('client_code'), session)
+
+        async def _fetch(session):
+            try:
+                return await engine_loop.run_blocking(session.smartApi.position)
+            except Exception as e:
+                logger.warning(f"Square-off: position book fetch failed for {session.user_id}: {e}")
+                return None   # Each exit then verifies on its own
+
+        books = await asyncio.gather(*(_fetch(s) for s in accounts.values()))
+        return dict(zip(accounts, books))
+
+    async def _exit(self, session, pos, reason, book):
+        started = time.monotonic()
+        try:
+            ok = await session._square_off(pos, reason, book)   # None: closed by another exit path
+            error = None
+        except Exception as e:
+            ok, error = False, str(e)
+            session.log(f"❌ Square-off failed for {pos['symbol']}: {e}", "ERROR")
+        result = {
+            "user_id": session.user_id,
+            "position_id": pos['id'],
+            "symbol": pos['symbol'],
+            "mode": session.mode,
+            "ok": ok,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        if error:
+            result["error"] = error
+        return result
+
+    async def run(self, reason, sessions=None):
+        """Exit all open positions of `sessions` (default: every session); returns the run report"""
+        sessions = list(sessions if sessions is not None else self.sessions_provider())
+        targets = []
+        for session in sessions:
+            # Overlapping runs (and TP/SL, OCO, manual exits) may target the same
+            # position: the session's close claim lets exactly one of them exit it
+            targets += [(session, pos) for pos in list(session.positions) if pos['status'] == 'OPEN']
+
+        started = time.monotonic()
+        books = await self._position_books({s for s, _ in targets}) if targets else {}
+        results = await asyncio.gather(*(
+            self._exit(s, p, reason, books.get(s.credentials.get('client_code'))) for s, p in targets
+        ))
+        latencies = [r["latency_ms"] for r in results]
+        report = {
+            "reason": reason,
+            "at": market_clock.ist_now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sessions": len({s.user_id for s, _ in targets}),
+            "positions": len(results),
+            "exited": sum(1 for r in results if r["ok"]),
+            "already_closed": sum(1 for r in results if r["ok"] is None),
+            "failed": sum(1 for r in results if r["ok"] is False),
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+            "p50_latency_ms": _percentile(latencies, 0.5),
+            "p95_latency_ms": _percentile(latencies, 0.95),
+            "max_latency_ms": max(latencies, default=0.0),
+            "results": list(results),
+        }
+        self.runs += 1
+        self.last_report = report
+        if results:
+            logger.warning(f"Square-off ({reason}): {report['exited']}/{report['positions']} positions exited "
+                           f"in {report['elapsed_ms']}ms (p95 {report['p95_latency_ms']}ms)")
+        return report
+
+    def kill_switch(self, reason="KILL_SWITCH"):
+        """Blocking entry point for the admin endpoint"""
+        return engine_loop.submit(self.run(reason)).result()
+
+    # ═══════════════════════════════════════════
+    # DAILY SCHEDULE
+    # ═══════════════════════════════════════════
+
+    async def _check_due(self):
+        """Square off sessions past their square-off time; returns seconds until the next check"""
+        day = self.clock.today()
+        now = time.monotonic()
+        if not day.trading or now > day.close:
+            return max(day.end - now, 1.0)
+
+        due, next_deadline = [], None
+        for session in self.sessions_provider():
+            deadline = day.at(session.square_off_time)
+            if now < deadline:
+                next_deadline = deadline if next_deadline is None else min(next_deadline, deadline)
+            elif any(p['status'] == 'OPEN' for p in session.positions):
+                due.append(session)
+
+        if due:
+            await self.run("AUTO_SQUARE_OFF", due)
+        # Re-scan periodically: sessions (and manual entries) can appear after the deadline
+        return min(next_deadline - now, RECHECK_SECONDS) if next_deadline else RECHECK_SECONDS
+
+    async def _run(self):
+        while True:
+            try:
+                delay = await self._check_due()
+            except Exception as e:
+                logger.error(f"Square-off scheduler error: {e}")
+                delay = RECHECK_SECONDS
+            await asyncio.sleep(max(delay, 0.05))
+
+    def status(self):
+        day = self.clock.today()
+        return {
+            "trading_day": day.trading,
+            "date": day.key,
+            "runs": self.runs,
+            "last_report": self.last_report,
+        }
+
+
+# ── Process-wide square-off (started with the first session) ──
+_square_off = None
+_square_off_lock = threading.Lock()
+
+
+def start_square_off(sessions_provider):
+    global _square_off
+    with _square_off_lock:
+        if _square_off is None:
+            _square_off = SquareOff(sessions_provider)
+        return _square_off
+
+
+def get_square_off():
+    return _square_off
@@ -147,8 +147,6 @@ class LiveORB(BaseLiveStrategy):
             # Retry up to 3 times for each symbol
             for attempt in range(3):
                 try:
-                    time.sleep(0.5) # Rate limit delay for Angel One API (3 req/sec limit)
-                    
                     params = {
                         "exchange": "NSE",
                         "symboltoken": token,
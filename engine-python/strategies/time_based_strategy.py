@@ -12,6 +12,7 @@ import pandas as pd
 import numpy as np
 from .base_live import BaseLiveStrategy
 import datetime
+import market_clock
 
 
 class LiveTimeBased(BaseLiveStrategy):
@@ -94,7 +95,7 @@ class LiveTimeBased(BaseLiveStrategy):
             return None
         
         # Reset traded times if new day
-        today = datetime.date.today()
+        today = market_clock.get_clock().today().date
         if self.last_trade_date.get(symbol) != today:
             self.traded_times[symbol] = set()
             self.last_trade_date[symbol] = today
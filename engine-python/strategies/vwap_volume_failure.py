@@ -34,6 +34,7 @@ import pandas as pd
 import numpy as np
 from .base_live import BaseLiveStrategy
 import datetime
+import market_clock
 import time as time_module
 
 
@@ -142,7 +143,7 @@ class LiveVWAPFailure(BaseLiveStrategy):
             return None
         
         # Daily limits
-        today_str = str(datetime.date.today())
+        today_str = market_clock.get_clock().today().key
         date_key = f"{symbol}_{today_str}"
         
         if self.last_trade_date.get(symbol) != today_str:
@@ -0,0 +1,51 @@
+import pytest
+
+from entity_matcher import EntityMatcher
+
+KEYWORDS = {
+    "ITC": ["ITC"],
+    "Tata Motors": ["TATAMOTORS"],
+    "Tata": ["TATASTEEL", "TATAMOTORS"],
+    "HDFC Bank": ["HDFCBANK"],
+    "HDFC": ["HDFC"],
+    "M&M": ["M&M"],
+    "  ": ["BLANK"],
+}
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return EntityMatcher(KEYWORDS)
+
+
+def test_whole_words_only(matcher):
+    assert matcher.match("ITC shares rise") == {"ITC"}
+    assert matcher.match("Shares of itc, rose.") == {"ITC"}
+    assert matcher.match("Network switch maker") == set()      # "itc" inside "switch"
+    assert matcher.match("ITCs and ITC2 are not ITC") == {"ITC"}
+    assert matcher.match("ITC") == {"ITC"}                      # Hit at both text edges
+
+
+def test_overlapping_and_nested_keywords(matcher):
+    assert matcher.match("Tata Motors posts profit") == {"TATAMOTORS", "TATASTEEL"}
+    assert matcher.match("Tatanagar plant") == set()
+    assert matcher.match("HDFC Bank and HDFC merge") == {"HDFCBANK", "HDFC"}
+    assert matcher.match("HDFC Banking arm") == {"HDFC"}        # "HDFC Bank" not closed by a boundary
+
+
+def test_case_insensitive_and_punctuation(matcher):
+    assert matcher.match("m&m unveils EV") == {"M&M"}
+    assert matcher.match("(M&M)") == {"M&M"}
+
+
+def test_blank_keywords_skipped(matcher):
+    assert matcher.keywords == 6
+    assert "BLANK" not in matcher.match("a  b")
+
+
+def test_empty_matcher():
+    assert EntityMatcher({}).match("anything") == set()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
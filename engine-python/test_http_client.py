@@ -0,0 +1,60 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from SmartApi.smartConnect import SmartConnect
+
+import http_client
+
+
+class _FakeAngel(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, so pooled connections can be reused
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        body = json.dumps({"status": True, "message": "SUCCESS", "data": {"path": self.path}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FakeAngel)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_attached_smartconnect_uses_the_orders_pool(server, monkeypatch):
+    sent = []
+    monkeypatch.setattr("requests.request", lambda *a, **kw: sent.append(a) or pytest.fail("bypassed the pool"))
+    api = http_client.attach(SmartConnect(api_key="key", root=server))
+    before = http_client.session("orders").metrics.snapshot()
+
+    assert api.position()["status"] is True
+    assert api.orderBook()["status"] is True
+    assert api.cancelOrder("123", "NORMAL")["status"] is True
+
+    after = http_client.session("orders").metrics.snapshot()
+    assert sent == []
+    assert after["requests"] - before["requests"] == 3
+    assert after["new_connections"] - before["new_connections"] <= 1   # One socket, reused
+
+
+def test_unattached_instances_are_untouched():
+    api = SmartConnect(api_key="key")
+    assert "_request" not in vars(api)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
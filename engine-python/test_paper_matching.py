@@ -0,0 +1,157 @@
+import random
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from paper_matching import PaperMatchingEngine
+
+
+def _session(active=True):
+    return SimpleNamespace(active=active)
+
+
+def _pos(pos_id, side, tp, sl):
+    return {"id": pos_id, "type": side, "tp": tp, "sl": sl, "status": "OPEN"}
+
+
+def _reference_exit(pos, ltp):
+    """What a per-position TP/SL check would do at `ltp`"""
+    if pos["type"] == "BUY":
+        return "TARGET" if ltp >= pos["tp"] else "SL" if ltp <= pos["sl"] else None
+    return "TARGET" if ltp <= pos["tp"] else "SL" if ltp >= pos["sl"] else None
+
+
+def _fills(book, token, ltp):
+    """Fills as (pos id, reason), closing them like the owning session would"""
+    fills = book.on_tick(token, ltp)
+    for _, pos, _ in fills:
+        pos["status"] = "CLOSED"
+    return sorted((pos["id"], reason) for _, pos, reason in fills)
+
+
+@pytest.fixture
+def book():
+    return PaperMatchingEngine()
+
+
+def test_only_crossed_levels_fill(book):
+    s = _session()
+    book.add(s, _pos(1, "BUY", tp=110, sl=95), "T")
+    book.add(s, _pos(2, "BUY", tp=105, sl=90), "T")
+    book.add(s, _pos(3, "SELL", tp=90, sl=108), "T")
+    book.add(s, _pos(4, "SELL", tp=96, sl=112), "T")
+
+    assert _fills(book, "T", 100) == []
+    assert _fills(book, "T", 105) == [(2, "TARGET")]
+    assert _fills(book, "T", 108) == [(3, "SL")]
+    assert _fills(book, "T", 95) == [(1, "SL"), (4, "TARGET")]
+    assert _fills(book, "OTHER", 1) == []
+    # Every position filled on one leg; the other legs are stale and never fire
+    assert _fills(book, "T", 1) == _fills(book, "T", 1000) == []
+    assert book.stats()["fills"] == 4
+    assert book.stats()["positions"] == 0
+
+
+def test_relevel_and_remove_retire_old_levels(book):
+    s = _session()
+    moved, removed = _pos(1, "BUY", tp=110, sl=90), _pos(2, "BUY", tp=110, sl=90)
+    book.add(s, moved, 7)
+    book.add(s, removed, 7)
+    moved.update(tp=120, sl=80)
+    book.add(s, moved, 7)   # Token normalised to str
+    book.remove(removed, 7)
+    assert book.stats()["entries"] == 2   # Stale entries outnumbered live ones: compacted
+
+    assert _fills(book, "7", 115) == []          # Old TP of both is stale
+    assert _fills(book, "7", 85) == []           # Old SL too
+    assert _fills(book, "7", 121) == [(1, "TARGET")]
+
+
+def test_inactive_sessions_and_closed_positions_are_dropped(book):
+    stopped, running = _session(), _session()
+    orphan, closed, live = _pos(1, "SELL", tp=90, sl=110), _pos(2, "SELL", tp=90, sl=110), _pos(3, "SELL", tp=90, sl=110)
+    book.add(stopped, orphan, "T")
+    book.add(running, closed, "T")
+    book.add(running, live, "T")
+    stopped.active = False
+    closed["status"] = "CLOSED"   # Closed elsewhere without removing its triggers
+
+    assert _fills(book, "T", 89) == [(3, "TARGET")]
+    assert book.stats()["positions"] == 0
+    assert book.stats()["stale_skipped"] == 2
+
+
+def test_compaction_bounds_stale_entries(book):
+    s = _session()
+    positions = [_pos(i, "BUY", tp=200 + i, sl=50 - i % 40) for i in range(100)]
+    for pos in positions:
+        book.add(s, pos, "T")
+    for pos in positions[:90]:
+        book.remove(pos, "T")
+    stats = book.stats()
+    assert stats["positions"] == 10
+    assert stats["entries"] <= 2 * 2 * stats["positions"]   # Stale entries never outnumber live ones
+
+
+def test_matches_brute_force_reference(book):
+    rng = random.Random(7)
+    sessions = [_session() for _ in range(5)]
+    open_positions = {}
+    for step in range(2000):
+        roll = rng.random()
+        if roll < 0.3:
+            side = rng.choice(("BUY", "SELL"))
+            near, far = sorted(rng.uniform(90, 110) for _ in range(2))
+            tp, sl = (far, near) if side == "BUY" else (near, far)
+            pos = _pos(step, side, tp=tp, sl=sl)
+            book.add(rng.choice(sessions), pos, "T")
+            open_positions[step] = pos
+        elif roll < 0.4 and open_positions:
+            pos = open_positions.pop(rng.choice(list(open_positions)))
+            book.remove(pos, "T")
+        else:
+            ltp = rng.uniform(88, 112)
+            expected = sorted((pid, reason) for pid, pos in open_positions.items()
+                              if (reason := _reference_exit(pos, ltp)))
+            assert _fills(book, "T", ltp) == expected
+            for pid, _ in expected:
+                del open_positions[pid]
+    assert book.stats()["positions"] == len(open_positions)
+
+
+def test_concurrent_ticks_adds_and_removes(book):
+    """Several sockets tick the same token while positions open and close"""
+    s = _session()
+    errors, filled = [], []
+
+    def ticker(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(3000):
+                for _, pos, _ in book.on_tick("T", rng.uniform(80, 120)):
+                    filled.append(pos["id"])
+        except Exception as e:   # e.g. IndexError from an unlocked heap peek
+            errors.append(e)
+
+    def trader():
+        try:
+            for i in range(3000):
+                pos = _pos(i, "BUY", tp=101 + i % 15, sl=99 - i % 15)
+                book.add(s, pos, "T")
+                if i % 3 == 0:
+                    book.remove(pos, "T")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ticker, args=(n,)) for n in range(4)] + [threading.Thread(target=trader)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(filled) == len(set(filled))   # Each position filled at most once
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
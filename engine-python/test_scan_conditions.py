@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import scan_conditions
+from scan_conditions import ConditionError, compile_rule, compile_scanner, evaluate, evaluate_all
+
+COLS = {
+    "close": np.array([100.0, 50.0, 0.0, 200.0]),
+    "atr14": np.array([2.0, 5.0, 1.0, 30.0]),
+    "volume": np.array([20000.0, 10.0, 5.0, 1000.0]),
+}
+
+
+def test_arithmetic_and_comparisons():
+    rule = compile_rule("close > 0 and atr14 / close < 0.08")
+    with np.errstate(divide='ignore'):
+        assert rule(COLS).tolist() == [True, False, False, False]
+    assert compile_rule("0 < close <= 100")(COLS).tolist() == [True, True, False, False]
+    assert compile_rule("not (close * volume > 1000000)")(COLS).tolist() == [False, True, True, True]
+    assert compile_rule("-close < -60 or volume == 5")(COLS).tolist() == [True, False, True, True]
+
+
+@pytest.mark.parametrize("source", [
+    "__import__('os').system('true')",
+    "close.__class__",
+    "close[0] > 1",
+    "open('/etc/passwd')",
+    "lambda: 1",
+    "close if volume else atr14",
+    "[c for c in close]",
+    "close ** 2 > 1",
+    "close in volume",
+    "'text' == close",
+    "True",
+    "+close > 0",
+])
+def test_rejects_unsafe_or_unsupported_expressions(source):
+    with pytest.raises(ConditionError):
+        compile_rule(source)
+
+
+def test_rejects_invalid_syntax():
+    with pytest.raises(ConditionError):
+        compile_rule("close >")
+
+
+def test_unknown_column_fails_at_evaluation():
+    rule = compile_rule("ema999 > 0")
+    with pytest.raises(ConditionError):
+        rule(COLS)
+
+
+def test_scanner_funnel_and_shared_rules():
+    spec = {"id": "demo", "min_history": 2, "rules": ["close > 10", "atr14 < 10"],
+            "conditions": ["Price above 10"], "outputs": [("price", "close", 2)]}
+    compiled = compile_scanner(spec)
+    cols = dict(COLS, listing_days=np.array([5, 5, 5, 1]))
+    mask, stats = evaluate(compiled, cols)
+    assert mask.tolist() == [True, True, False, False]
+    assert [c["label"] for c in stats["conditions"]] == ["At least 2 sessions of history", "Price above 10", "atr14 < 10"]
+    assert [c["remaining"] for c in stats["conditions"]] == [3, 2, 2]
+    assert scan_conditions.format_outputs(compiled, cols, 1) == {"price": 50.0}
+
+    both = evaluate_all({"a": compiled, "b": compiled}, cols)
+    assert both["a"][0].tolist() == both["b"][0].tolist() == mask.tolist()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import engine_loop
+import preopen_scheduler
+import session_manager
+from session_manager import TradingSession
+
+
+class _Strategy:
+    def __init__(self):
+        self.initialized = 0
+
+    def initialize(self, smart_api):
+        self.initialized += 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = TradingSession("startup-test", {"symbols": ["SBIN-EQ"]}, {})
+    session.active = True
+    session.strategy = _Strategy()
+    session.connects = []
+
+    async def _no_cleanup():
+        pass
+    monkeypatch.setattr(session, "_cleanup_old_websocket", _no_cleanup)
+    monkeypatch.setattr(session, "_connect_websocket",
+                        lambda: session.connects.append(session.strategy.initialized))
+    return session
+
+
+def _run(coro):
+    """Sessions' coroutines run on the engine loop (run_blocking awaits its executor)"""
+    return engine_loop.submit(coro).result(timeout=10)
+
+
+def test_failed_warm_up_falls_back_with_initialized_strategy(session, monkeypatch):
+    # Closed at start-up, open once the fallback's first poll comes round
+    checks = []
+
+    def _is_market_hours():
+        checks.append(None)
+        return len(checks) > 1
+    monkeypatch.setattr(session, "_is_market_hours", _is_market_hours)
+
+    async def _failing_warm_up():
+        raise RuntimeError("broker session unavailable")
+    monkeypatch.setattr(session, "_pre_open_warm_up", _failing_warm_up)
+    monkeypatch.setattr(preopen_scheduler, "next_preopen", lambda now=None: preopen_scheduler.ist_now())
+
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(session_manager.asyncio, "sleep", lambda delay: real_sleep(0))
+
+    _run(session._start_websocket())
+
+    # The socket opened only after the strategy was initialized, exactly once
+    assert session.connects == [1]
+    assert session.strategy.initialized == 1
+    assert preopen_scheduler.get_scheduler().failed >= 1
+
+
+def test_strategy_initialized_once_per_day(session, monkeypatch):
+    monkeypatch.setattr(session, "_is_market_hours", lambda: True)
+    _run(session._start_websocket())
+    _run(session._start_websocket())   # Reconnect: no second history load
+    assert session.connects == [1, 1]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
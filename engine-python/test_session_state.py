@@ -0,0 +1,33 @@
+import pytest
+
+from session_manager import TradingSession
+
+
+@pytest.fixture
+def session():
+    session = TradingSession("state-test", {"symbols": ["SBIN-EQ", "INFY-EQ"]}, {})
+    session.symbol_tokens = {"SBIN-EQ": "3045", "INFY-EQ": "1594"}
+    session.positions.append({"id": 1, "symbol": "SBIN-EQ", "type": "BUY", "entry": 100.0, "qty": 5,
+                              "tp": 200.0, "sl": 50.0, "pnl": 0.0, "status": "OPEN"})
+    session._mark_changed(positions=True)
+    return session
+
+
+def test_etag_ignores_ticks_without_an_open_position(session):
+    etag = session.state_etag()
+    session._update_position_pnl("INFY-EQ", 1500.0)
+    session._update_position_pnl("INFY-EQ", 1501.0)
+    assert session.state_etag() == etag
+
+
+def test_etag_follows_open_position_ltp(session):
+    etag = session.state_etag()
+    session._update_position_pnl("SBIN-EQ", 101.0)
+    moved = session.state_etag()
+    assert moved != etag
+    session._update_position_pnl("SBIN-EQ", 101.0)   # Same LTP: nothing new to poll
+    assert session.state_etag() == moved
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,44 @@
+import pytest
+
+from shard_router import HashRing
+
+USERS = [f"user-{i}" for i in range(20000)]
+
+
+def _owners(ring):
+    return {u: ring.owner(u) for u in USERS}
+
+
+def test_owner_is_stable_and_independent_of_shard_order():
+    shards = [f"http://127.0.0.1:{5101 + i}" for i in range(4)]
+    ring = HashRing(shards)
+    assert _owners(ring) == _owners(HashRing(shards))
+    assert _owners(ring) == _owners(HashRing(list(reversed(shards))))
+
+
+def test_load_is_roughly_even():
+    shards = [f"s{i}" for i in range(4)]
+    counts = {s: 0 for s in shards}
+    for owner in _owners(HashRing(shards)).values():
+        counts[owner] += 1
+    expected = len(USERS) / len(shards)
+    assert all(abs(c - expected) / expected < 0.35 for c in counts.values())
+
+
+@pytest.mark.parametrize("before, after", [(4, 5), (5, 4), (8, 9), (1, 2)])
+def test_resizing_moves_only_a_fraction_of_users(before, after):
+    old = _owners(HashRing([f"s{i}" for i in range(before)]))
+    new = _owners(HashRing([f"s{i}" for i in range(after)]))
+    moved = [u for u in USERS if old[u] != new[u]]
+    # Ideal is |Δ|/max(N) of the users; allow vnode imbalance
+    ideal = abs(after - before) / max(before, after)
+    assert len(moved) / len(USERS) < ideal * 1.6
+    if after > before:
+        # Growing only hands users to the new shard, never between old ones
+        assert all(new[u] == f"s{after - 1}" for u in moved)
+    else:
+        assert all(old[u] == f"s{before - 1}" for u in moved)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
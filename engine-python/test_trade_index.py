@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+
+import pytest
+
+from price_table import PriceTable
+from trade_index import TradeIndex
+
+
+def _session(user_id, mode="PAPER", strategy="ORB", symbol_tokens=None):
+    return SimpleNamespace(user_id=user_id, mode=mode, strategy_name=strategy, symbol_tokens=symbol_tokens or {})
+
+
+def _pos(pos_id, status="OPEN", pnl=0.0):
+    return {"id": pos_id, "symbol": f"S{pos_id}", "status": status, "pnl": pnl}
+
+
+@pytest.fixture
+def index():
+    """u1 (PAPER/ORB): 6 trades, ids 1-4 closed; u2 (LIVE/EMA): 3 trades, id 1 closed"""
+    idx = TradeIndex()
+    u1, u2 = _session("u1"), _session("u2", "LIVE", "EMA")
+    for session, count, closed in ((u1, 6, 4), (u2, 3, 1)):
+        for i in range(1, count + 1):
+            pos = _pos(i)
+            idx.record(session, pos)
+            if i <= closed:
+                pos.update(status="CLOSED", pnl=float(i))
+                idx.record(session, pos)
+    return idx
+
+
+def _keys(page):
+    return [(t["user_id"], t["id"], t["status"]) for t in page]
+
+
+def test_open_first_then_closed_newest_first(index):
+    total, page = index.query()
+    assert total == 9
+    assert _keys(page) == [
+        ("u1", 5, "OPEN"), ("u1", 6, "OPEN"), ("u2", 2, "OPEN"), ("u2", 3, "OPEN"),
+        ("u2", 1, "CLOSED"), ("u1", 4, "CLOSED"), ("u1", 3, "CLOSED"), ("u1", 2, "CLOSED"), ("u1", 1, "CLOSED"),
+    ]
+
+
+def test_pages_tile_the_full_listing(index):
+    _, everything = index.query()
+    for limit in (1, 2, 3, 4, 5):
+        pages = []
+        for offset in range(0, 9, limit):
+            total, page = index.query(offset=offset, limit=limit)
+            assert total == 9
+            assert len(page) == min(limit, 9 - offset)
+            pages += page
+        assert _keys(pages) == _keys(everything)
+    assert index.query(offset=20, limit=5) == (9, [])
+
+
+def test_filtered_pages(index):
+    total, page = index.query(status="CLOSED", user_id="u1", offset=1, limit=2)
+    assert total == 4
+    assert _keys(page) == [("u1", 3, "CLOSED"), ("u1", 2, "CLOSED")]
+
+    # Two filters: intersected scan instead of a direct slice
+    total, page = index.query(status="CLOSED", user_id="u1", strategy="ORB", offset=3, limit=5)
+    assert total == 4
+    assert _keys(page) == [("u1", 1, "CLOSED")]
+
+    total, page = index.query(status="OPEN", session_mode="LIVE")
+    assert total == 2
+    assert all(t["session_mode"] == "LIVE" for t in page)
+    assert index.query(user_id="nobody") == (0, [])
+
+
+def test_summary_and_drop_user(index):
+    summary = index.summary()
+    assert summary["open_positions"] == 4
+    assert summary["closed_trades"] == 5
+    assert summary["by_mode"]["PAPER"]["realized_pnl"] == 10.0
+    assert summary["by_mode"]["LIVE"]["realized_pnl"] == 1.0
+
+    index.drop_user("u1")
+    total, page = index.query()
+    assert total == 3
+    assert {t["user_id"] for t in page} == {"u2"}
+    assert index.summary()["realized_pnl"] == 1.0
+
+
+@pytest.fixture
+def prices():
+    table = PriceTable.create(f"test_trade_index_{id(object())}", capacity=16)
+    yield table
+    table.close()
+
+
+def test_paper_unrealized_pnl_marked_from_price_table(prices):
+    index = TradeIndex(prices)
+    tokens = {"SBIN": "3045", "INFY": "1594"}
+    paper, live = _session("p", symbol_tokens=tokens), _session("l", "LIVE", symbol_tokens=tokens)
+    buy = {"id": 1, "symbol": "SBIN", "status": "OPEN", "type": "BUY", "entry": 100.0, "qty": 10, "pnl": 0.0}
+    sell = {"id": 2, "symbol": "INFY", "status": "OPEN", "type": "SELL", "entry": 50.0, "qty": 4, "pnl": 0.0}
+    live_pos = {"id": 1, "symbol": "SBIN", "status": "OPEN", "type": "BUY", "entry": 100.0, "qty": 1, "pnl": 7.0}
+    index.record(paper, buy)
+    index.record(paper, sell)
+    index.record(live, live_pos)
+
+    # No tick yet: nothing to mark, the stored P&L stands
+    assert index.summary()["by_mode"]["PAPER"]["unrealized_pnl"] == 0.0
+
+    # Ticks only reach the price table; no session state is read in between
+    prices.update("3045", 103.5)
+    prices.update("1594", 52.0)
+    summary = index.summary()
+    assert summary["by_mode"]["PAPER"]["unrealized_pnl"] == 35.0 - 8.0
+    assert summary["by_mode"]["LIVE"]["unrealized_pnl"] == 7.0     # LIVE P&L is marked per tick by its session
+    assert summary["unrealized_pnl"] == 34.0
+
+    _, page = index.query(status="OPEN", session_mode="PAPER")
+    assert sorted(t["pnl"] for t in page) == [-8.0, 35.0]
+    assert buy["pnl"] == 0.0   # Marked in the listing, not written back
+
+    buy.update(status="CLOSED", pnl=20.0)
+    index.record(paper, buy)
+    _, page = index.query(status="CLOSED")
+    assert [t["pnl"] for t in page] == [20.0]   # Closed trades keep their booked P&L
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
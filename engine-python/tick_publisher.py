@@ -0,0 +1,103 @@
+"""
+MerQPrime Tick Publisher
+Process-wide live P&L push to the Node backend.
+
+One timer on the engine loop collects every active session's open positions and LTPs each
+interval and posts them in a single request to /webhook/ticks. Only what
+changed since the last successful push is sent (position upserts, removed
+position ids, changed LTPs); the backend keeps the merged per-user state
+and emits the full `tick_update` to the browser.
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+from logzero import logger
+
+import http_client
+import engine_loop
+
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:3002')
+TICK_INTERVAL = float(os.getenv('TICK_PUSH_INTERVAL', '1.0'))
+
+
+class TickPublisher:
+    """Batches delta updates for all sessions into one POST per interval."""
+
+    def __init__(self, sessions_provider, interval=TICK_INTERVAL, url=f'{BACKEND_URL}/webhook/ticks'):
+        self.sessions_provider = sessions_provider
+        self.interval = interval
+        self.url = url
+        self._http = http_client.session("backend")
+        self._sent = {}           # user_id -> {"pnl", "trades": {id: trade}, "ltp": {symbol: price}}
+        self.pushes = 0
+        self._task = engine_loop.submit(self._run())
+
+    def _diff(self, user_id, snapshot):
+        """Delta between the last pushed state and `snapshot`; None if nothing changed"""
+        last = self._sent.get(user_id)
+        trades = {t["entry_order_id"]: t for t in snapshot["trades"]}
+        if last is None:
+            return {"user_id": user_id, "full": True, "pnl": snapshot["pnl"],
+                    "upserts": list(trades.values()), "removed": [], "ltp": snapshot["ltp"]}
+
+        upserts = [t for tid, t in trades.items() if last["trades"].get(tid) != t]
+        removed = [tid for tid in last["trades"] if tid not in trades]
+        ltp = {s: p for s, p in snapshot["ltp"].items() if last["ltp"].get(s) != p}
+        if not upserts and not removed and not ltp and snapshot["pnl"] == last["pnl"]:
+            return None
+        return {"user_id": user_id, "full": False, "pnl": snapshot["pnl"],
+                "upserts": upserts, "removed": removed, "ltp": ltp}
+
+    def publish_once(self):
+        snapshots = {}
+        for session in self.sessions_provider():
+            if session.active:
+                try:
+                    snapshots[session.user_id] = session.tick_snapshot()
+                except Exception as e:
+                    logger.error(f"Tick snapshot failed for {session.user_id}: {e}")
+
+        updates = [u for u in (self._diff(uid, snap) for uid, snap in snapshots.items()) if u]
+        # Sessions that stopped since the last push: let the backend drop their state
+        updates += [{"user_id": uid, "closed": True} for uid in self._sent if uid not in snapshots]
+        if not updates:
+            return
+
+        try:
+            self._http.post(self.url, json={"updates": updates}).raise_for_status()
+        except Exception as e:
+            # Backend state is now unknown — next push for everyone is a full one
+            self._sent.clear()
+            logger.debug(f"Tick push failed: {e}")
+            return
+
+        self._sent = {
+            uid: {"pnl": snap["pnl"], "trades": {t["entry_order_id"]: t for t in snap["trades"]}, "ltp": snap["ltp"]}
+            for uid, snap in snapshots.items()
+        }
+        self.pushes += 1
+
+    async def _run(self):
+        while True:
+            started = time.time()
+            try:
+                await engine_loop.run_blocking(self.publish_once)
+            except Exception as e:
+                logger.error(f"Tick publisher error: {e}")
+            await asyncio.sleep(max(self.interval - (time.time() - started), 0.05))
+
+
+# ── Process-wide publisher (started with the first session) ──
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def start_publisher(sessions_provider):
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = TickPublisher(sessions_provider)
+        return _publisher
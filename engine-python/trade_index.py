@@ -0,0 +1,147 @@
+"""
+MerQPrime Trade Index
+Process-wide index of open positions and closed trades across all sessions,
+maintained as positions open and close, for the admin panel.
+
+Records hold a reference to the session's position dict, so LIVE P&L is
+always current without copying on every tick; PAPER positions are not
+marked per tick, so their unrealized P&L is computed here from the shared
+price table when a page or summary is read. Only the requested page is
+serialized. Closed trades are also indexed by user, mode and strategy so a
+filtered page does not scan every trade, and realized P&L is accumulated
+per mode as trades close.
+"""
+
+import threading
+
+import paper_matching
+import price_table
+
+
+class TradeIndex:
+    """Open/closed trade index with secondary indexes and P&L counters."""
+
+    def __init__(self, prices=None):
+        self._prices = prices      # Shared price table (process-wide one unless given)
+        self._lock = threading.Lock()
+        self._open = {}            # (user_id, pos id) -> record
+        self._closed = []          # records in close order
+        self._closed_by = {"user_id": {}, "session_mode": {}, "strategy": {}}
+        self._realized = {}        # mode -> realized P&L
+
+    @staticmethod
+    def _record(session, pos):
+        return {"user_id": session.user_id, "session_mode": session.mode,
+                "strategy": session.strategy_name, "pos": pos,
+                "token": session.symbol_tokens.get(pos['symbol'])}
+
+    def _unrealized(self, rec):
+        """Open position's P&L: PAPER marked to the shared LTP (as the session does on read), LIVE as stored"""
+        pos = rec["pos"]
+        if rec["session_mode"] != 'LIVE' and rec["token"]:
+            if self._prices is None:
+                self._prices = price_table.get_table()
+            ltp = self._prices.ltp(rec["token"])
+            if ltp is not None:
+                return paper_matching.marked_pnl(pos, ltp)
+        return pos.get('pnl', 0)
+
+    def record(self, session, pos):
+        """Index a position after it opened or closed (status decides which)"""
+        key = (session.user_id, pos['id'])
+        with self._lock:
+            if pos['status'] == 'OPEN':
+                self._open[key] = self._record(session, pos)
+                return
+            rec = self._open.pop(key, None) or self._record(session, pos)
+            self._closed.append(rec)
+            for field, index in self._closed_by.items():
+                index.setdefault(rec[field], []).append(rec)
+            self._realized[rec["session_mode"]] = self._realized.get(rec["session_mode"], 0.0) + pos.get('pnl', 0)
+
+    def drop_user(self, user_id):
+        """Forget a replaced session's trades (matches the session store dropping it)"""
+        with self._lock:
+            self._open = {k: r for k, r in self._open.items() if k[0] != user_id}
+            dropped = self._closed_by["user_id"].pop(user_id, [])
+            if not dropped:
+                return
+            gone = set(map(id, dropped))
+            self._closed = [r for r in self._closed if id(r) not in gone]
+            for field in ("session_mode", "strategy"):
+                for value, recs in list(self._closed_by[field].items()):
+                    self._closed_by[field][value] = [r for r in recs if id(r) not in gone]
+            for rec in dropped:
+                self._realized[rec["session_mode"]] -= rec["pos"].get('pnl', 0)
+
+    # ═══════════════════════════════════════════
+    # QUERIES
+    # ═══════════════════════════════════════════
+
+    def _closed_page(self, filters, offset, limit):
+        """(total, page) of closed trades, newest first"""
+        lists = [self._closed_by[f].get(v, []) for f, v in filters.items()]
+        base = min(lists, key=len) if lists else self._closed
+        if len(filters) <= 1:
+            # The index is exactly the match set: count and slice without scanning
+            end = len(base) - offset
+            start = max(end - limit, 0) if limit is not None else 0
+            return len(base), base[start:max(end, 0)][::-1]
+        matched = [r for r in reversed(base) if all(r[f] == v for f, v in filters.items())]
+        return len(matched), matched[offset:offset + limit] if limit is not None else matched[offset:]
+
+    def query(self, status=None, offset=0, limit=None, **filters):
+        """
+        Page of trades as flat dicts (position fields + user_id/session_mode).
+        Filters: user_id, session_mode, strategy. status: 'OPEN', 'CLOSED' or None (both, open first).
+        Returns: (total_matching, page)
+        """
+        filters = {f: v for f, v in filters.items() if v is not None}
+        with self._lock:
+            page, total = [], 0
+            if status in (None, 'OPEN'):
+                # Open positions are few; a scan is cheap
+                open_recs = [r for r in self._open.values() if all(r[f] == v for f, v in filters.items())]
+                total = len(open_recs)
+                page = open_recs[offset:offset + limit] if limit is not None else open_recs[offset:]
+            if status in (None, 'CLOSED'):
+                remaining = None if limit is None else limit - len(page)
+                closed_total, closed = self._closed_page(filters, max(offset - total, 0), remaining)
+                total += closed_total
+                page += closed
+            return total, [{**r["pos"], "pnl": self._unrealized(r) if r["pos"]['status'] == 'OPEN' else r["pos"].get('pnl', 0),
+                            "user_id": r["user_id"], "session_mode": r["session_mode"]} for r in page]
+
+    def summary(self):
+        """Aggregate counters per mode: open/closed counts, realized and unrealized P&L"""
+        def _mode(mode):
+            return by_mode.setdefault(mode, {"open_positions": 0, "closed_trades": 0, "realized_pnl": 0.0, "unrealized_pnl": 0.0})
+
+        by_mode = {}
+        with self._lock:
+            for mode, realized in self._realized.items():
+                _mode(mode)["realized_pnl"] = round(realized, 2)
+            for mode, recs in self._closed_by["session_mode"].items():
+                _mode(mode)["closed_trades"] = len(recs)
+            for rec in self._open.values():
+                m = _mode(rec["session_mode"])
+                m["open_positions"] += 1
+                m["unrealized_pnl"] += self._unrealized(rec)
+
+        for m in by_mode.values():
+            m["unrealized_pnl"] = round(m["unrealized_pnl"], 2)
+        return {
+            "open_positions": sum(m["open_positions"] for m in by_mode.values()),
+            "closed_trades": sum(m["closed_trades"] for m in by_mode.values()),
+            "realized_pnl": round(sum(m["realized_pnl"] for m in by_mode.values()), 2),
+            "unrealized_pnl": round(sum(m["unrealized_pnl"] for m in by_mode.values()), 2),
+            "by_mode": by_mode,
+        }
+
+
+# ── Process-wide index ──
+_index = TradeIndex()
+
+
+def get_index():
+    return _index
@@ -0,0 +1,165 @@
+"""
+MerQPrime Trade Outbox
+Durable local queue for closed trades on their way to the Node backend.
+
+Closing a position only does a local SQLite (WAL) insert; a background
+sender drains the outbox in batches to /webhook/save_trades with
+exponential backoff. Every trade carries an idempotency key, so a batch
+that was saved but whose response got lost is simply acknowledged as a
+duplicate on redelivery. Rows survive engine restarts until acknowledged.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from logzero import logger
+
+import http_client
+
+DATA_DIR = os.getenv('ENGINE_DATA_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+SHARD_ID = os.getenv('ENGINE_SHARD_ID')
+# One outbox per engine shard so sender threads never race over the same rows
+OUTBOX_PATH = os.path.join(DATA_DIR, f'trade_outbox-{SHARD_ID}.db' if SHARD_ID else 'trade_outbox.db')
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:3002')
+
+BATCH_SIZE = 50
+BACKOFF_BASE = 1.0       # Seconds before the first retry
+BACKOFF_MAX = 300.0      # Cap between retries of one trade
+IDLE_WAIT = 5.0          # Poll interval when nothing is due
+
+
+class TradeOutbox:
+    """SQLite-backed outbox with a single background sender thread."""
+
+    def __init__(self, path=OUTBOX_PATH, url=f'{BACKEND_URL}/webhook/save_trades'):
+        self.path = path
+        self.url = url
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._http = http_client.session("backend")
+        self.delivered = 0
+        self._thread = threading.Thread(target=self._run, name="trade-outbox", daemon=True)
+        self._thread.start()
+
+    # ═══════════════════════════════════════════
+    # PRODUCER (tick / order threads)
+    # ═══════════════════════════════════════════
+
+    def enqueue(self, key, payload):
+        """Durably record a trade for delivery. Re-enqueueing the same key is a no-op."""
+        payload = {**payload, "idempotency_key": key}
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO outbox (key, payload) VALUES (?, ?)",
+                (key, json.dumps(payload))
+            )
+        self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    # ═══════════════════════════════════════════
+    # SENDER
+    # ═══════════════════════════════════════════
+
+    def _due_batch(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT key, payload, attempts FROM outbox WHERE dead = 0 AND next_attempt <= ? "
+                "ORDER BY id LIMIT ?",
+                (time.time(), BATCH_SIZE)
+            ).fetchall()
+
+    def _next_due_in(self):
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE dead = 0").fetchone()
+        if row[0] is None:
+            return IDLE_WAIT
+        return min(max(row[0] - time.time(), 0.0), IDLE_WAIT)
+
+    def _retry_later(self, rows, error):
+        now = time.time()
+        with self._lock:
+            for key, _, attempts in rows:
+                delay = min(BACKOFF_BASE * (2 ** attempts), BACKOFF_MAX)
+                self._db.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE key = ?",
+                    (attempts + 1, now + delay, str(error)[:200], key)
+                )
+
+    def _send_batch(self, rows):
+        trades = [json.loads(payload) for _, payload, _ in rows]
+        try:
+            resp = self._http.post(self.url, json={"trades": trades}, timeout=10)
+            resp.raise_for_status()
+            results = {r.get("idempotency_key"): r for r in resp.json().get("results", [])}
+        except Exception as e:
+            logger.error(f"Trade outbox: delivery of {len(rows)} trades failed, will retry: {e}")
+            self._retry_later(rows, e)
+            return
+
+        done, failed, rejected = [], [], []
+        for row in rows:
+            status = results.get(row[0], {}).get("status")
+            if status == "success":
+                done.append(row[0])
+            elif status == "rejected":
+                rejected.append(row[0])
+            else:
+                failed.append(row)
+
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE key = ?", [(k,) for k in done])
+            # Rejected payloads will never succeed; keep them for inspection instead of retrying
+            self._db.executemany("UPDATE outbox SET dead = 1 WHERE key = ?", [(k,) for k in rejected])
+        if failed:
+            self._retry_later(failed, "backend error")
+        if rejected:
+            logger.error(f"🚨 Trade outbox: {len(rejected)} trades rejected by backend, kept as dead letters in {self.path}")
+
+        self.delivered += len(done)
+        logger.info(f"Trade outbox: {len(done)} saved, {len(failed)} retrying, {len(rejected)} rejected")
+
+    def _run(self):
+        while True:
+            try:
+                rows = self._due_batch()
+                if rows:
+                    self._send_batch(rows)
+                    continue
+            except Exception as e:
+                logger.error(f"Trade outbox sender error: {e}")
+            self._wake.wait(timeout=self._next_due_in())
+            self._wake.clear()
+
+
+# ── Process-wide outbox (sender starts on first use) ──
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = TradeOutbox()
+        return _outbox
@@ -16,14 +16,119 @@ Usage in engine:
     from whatsapp_alerts import WhatsAppAlerter
     alerter = WhatsAppAlerter(phone="919876543210", api_key="abc123")
     alerter.send("Hello from MerQPrime!")
+
+All alerters share one process-wide AlertDispatcher: a bounded queue drained
+by a small worker pool over the shared keep-alive "alerts" HTTP session. Messages to the
+same phone within COALESCE_SECONDS of the last send are merged into a single
+digest, so a burst of TP/SL hits becomes one WhatsApp message.
 """
 
+import os
+import time
+import queue
 import threading
-import requests
+
+import http_client
 
 
 CALLMEBOT_URL = "https://api.callmebot.com/whatsapp.php"
 
+COALESCE_SECONDS = float(os.getenv('WHATSAPP_COALESCE_SECONDS', '10'))
+QUEUE_SIZE = 1000
+WORKERS = 2
+
+
+class AlertDispatcher:
+    """Process-wide WhatsApp sender with per-recipient coalescing."""
+
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, window=COALESCE_SECONDS):
+        self.window = window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._recipients = {}     # (phone, api_key) -> {"last_sent": ts, "pending": [messages]}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._http = http_client.session("alerts")
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"whatsapp-{i}", daemon=True).start()
+        threading.Thread(target=self._flusher, name="whatsapp-flush", daemon=True).start()
+
+    def submit(self, phone, api_key, message):
+        """Send now if the recipient is quiet, otherwise hold for the next digest"""
+        key = (phone, api_key)
+        now = time.time()
+        with self._lock:
+            r = self._recipients.setdefault(key, {"last_sent": 0.0, "pending": []})
+            if not r["pending"] and now - r["last_sent"] >= self.window:
+                r["last_sent"] = now
+                self._enqueue(key, message)
+            else:
+                r["pending"].append(message)
+                self.coalesced += 1
+        self._wake.set()
+
+    def _enqueue(self, key, message):
+        try:
+            self._queue.put_nowait((key, message))
+        except queue.Full:
+            self.dropped += 1
+            print(f"[WhatsApp] ⚠️ Queue full, dropped alert for ...{key[0][-4:]}")
+
+    @staticmethod
+    def _digest(messages):
+        if len(messages) == 1:
+            return messages[0]
+        return f"📬 *{len(messages)} alerts*\n\n" + "\n\n".join(messages)
+
+    def _flusher(self):
+        """Release held messages as one digest per recipient once their window has passed"""
+        while True:
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+            now = time.time()
+            with self._lock:
+                for key, r in self._recipients.items():
+                    if r["pending"] and now - r["last_sent"] >= self.window:
+                        self._enqueue(key, self._digest(r["pending"]))
+                        r["pending"] = []
+                        r["last_sent"] = now
+
+    def _worker(self):
+        while True:
+            (phone, api_key), message = self._queue.get()
+            try:
+                params = {
+                    'phone': phone,
+                    'text': message,
+                    'apikey': api_key
+                }
+                resp = self._http.get(CALLMEBOT_URL, params=params)
+                if resp.status_code == 200:
+                    self.sent += 1
+                    print(f"[WhatsApp] ✅ Alert sent: {message[:50]}...")
+                else:
+                    print(f"[WhatsApp] ⚠️ Failed (HTTP {resp.status_code}): {resp.text[:100]}")
+            except Exception as e:
+                print(f"[WhatsApp] ❌ Error: {e}")
+            finally:
+                self._queue.task_done()
+
+
+# ── Process-wide dispatcher (started on first alert) ──
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher()
+        return _dispatcher
+
 
 class WhatsAppAlerter:
     """Per-user WhatsApp alerter. Created once per trading session."""
@@ -39,27 +144,10 @@ class WhatsAppAlerter:
             print(f"[WhatsApp] ℹ️ Alerts disabled (no phone/key configured)")
     
     def send(self, message: str):
-        """Send a WhatsApp alert asynchronously (non-blocking)."""
+        """Queue a WhatsApp alert on the shared dispatcher (non-blocking, may be coalesced)."""
         if not self.enabled:
             return
-        thread = threading.Thread(target=self._send_sync, args=(message,), daemon=True)
-        thread.start()
-    
-    def _send_sync(self, message: str):
-        """Internal sync method to send WhatsApp message via CallMeBot API."""
-        try:
-            params = {
-                'phone': self.phone,
-                'text': message,
-                'apikey': self.api_key
-            }
-            resp = requests.get(CALLMEBOT_URL, params=params, timeout=10)
-            if resp.status_code == 200:
-                print(f"[WhatsApp] ✅ Alert sent: {message[:50]}...")
-            else:
-                print(f"[WhatsApp] ⚠️ Failed (HTTP {resp.status_code}): {resp.text[:100]}")
-        except Exception as e:
-            print(f"[WhatsApp] ❌ Error: {e}")
+        get_dispatcher().submit(self.phone, self.api_key, message)
 
     # ----- Pre-built alert methods -----
 